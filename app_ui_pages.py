@@ -1,4 +1,6 @@
 import datetime
+import threading
+import time
 from kivy.config import Config
 from kivymd.app import MDApp
 from kivymd.uix.boxlayout import MDBoxLayout
@@ -12,43 +14,23 @@ from kivy.graphics import Color, Rectangle
 from kivy.uix.image import Image
 from kivy.uix.scrollview import ScrollView
 from kivymd.uix.scrollview import MDScrollView
-from ui_utils import NoBorderButton
+from ui_utils import NoBorderButton, LogView
+from sensor_payload import batch_from_json, batch_rows
+from latency_trace import get_latency_tracer, STAGE_UI, STAGE_COMMIT, LATENCY_DUMP_FILENAME
+from log_store import get_log_store, format_records, SOURCE_APP, SOURCE_SENSOR, LEVEL_WARNING, LEVEL_ERROR
+from log_file import get_log_file_sink, get_log_search_executor, search_log_files, format_time as format_log_time
 import json
 from kivymd.toast import toast
 # 新增数据库相关导入（核心）
-import sqlite3
 import os
 import sys
 from kivy.utils import platform  # 关键：Kivy官方的平台判断工具
+from storage import (
+    get_db_path, get_data_path, get_sensor_storage, get_recent_buffer, get_query_executor, ms_to_datetime, day_range_ms, HOUR_MS, ROLLUP_HOUR,
+    RetentionPolicy, RetentionScheduler, DEFAULT_RETENTION_DAYS,
+)
 
-# ========== 数据库工具函数（完整适配PC/安卓） ==========
-def get_db_path():
-    """
-    获取数据库路径（兼容PC/安卓，优先使用应用私有目录）
-    安卓端：使用应用私有存储（无需额外权限），避免读写外部存储的权限问题
-    """
-    try:
-        if platform == 'android':
-            # 安卓端：获取应用私有目录（推荐），比app_storage_path更稳定
-            from android import mActivity
-            # 获取应用内部存储目录（/data/data/esp32app/files/）
-            app_files_dir = mActivity.getApplicationContext().getFilesDir().getPath()
-            db_path = os.path.join(app_files_dir, "sensor_data.db")
-        else:
-            # PC端（Windows/Linux/Mac）：当前目录
-            db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensor_data.db")
-        
-        # 确保数据库目录存在（避免创建数据库时报错）
-        db_dir = os.path.dirname(db_path)
-        if not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-        
-        return db_path
-    except Exception as e:
-        # 容错：返回当前目录（避免完全崩溃）
-        toast(f"获取数据库路径失败：{str(e)}")
-        return "sensor_data.db"
-
+# ========== 数据库工具函数（完整适配PC/安卓，实现见storage包） ==========
 def init_db_if_not_exists():
     """初始化数据库表（增加延迟容错）"""
     try:
@@ -59,112 +41,207 @@ def init_db_if_not_exists():
         # 同步执行（备用）
         _real_init_db()
 
+def _get_storage():
+    """获取全局存储实例（内部函数；数据文件路径只在首次创建时解析）"""
+    return get_sensor_storage()
+
+# 过期数据保留天数（2 = 今日 + 昨日），可按需调大
+RETENTION_DAYS = DEFAULT_RETENTION_DAYS
+_RETENTION_SCHEDULER = None
+
+def start_retention_schedule(keep_days=None):
+    """启动定时过期清理（每小时 + 跨天时执行），重复调用会按新配置重启"""
+    global _RETENTION_SCHEDULER, RETENTION_DAYS
+    if keep_days is not None:
+        RETENTION_DAYS = keep_days
+    if _RETENTION_SCHEDULER is not None:
+        _RETENTION_SCHEDULER.stop()
+    _RETENTION_SCHEDULER = RetentionScheduler(_get_storage(), RetentionPolicy(RETENTION_DAYS))
+    _RETENTION_SCHEDULER.start()
+
 def _real_init_db(*args):
-    """实际初始化逻辑（内部函数）"""
+    """实际初始化逻辑（内部函数）：启动存储写线程，由写线程建表"""
     try:
-        db_path = get_db_path()
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensor_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                record_date TEXT,  -- 日期（YYYY-MM-DD）
-                record_time TEXT,  -- 时间（YYYY-MM-DD HH:MM:SS）
-                do_value REAL,     -- 溶解氧
-                ph_value REAL,     -- PH值
-                temp_value REAL    -- 温度
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        _get_storage()
+        if _RETENTION_SCHEDULER is None:
+            start_retention_schedule()
     except Exception as e:
         print(f"数据库初始化失败：{e}")
         if platform == 'android':
             from kivymd.toast import toast
             toast("数据库初始化失败，APP可继续使用")
-def insert_sensor_record_to_db(do, ph, temp):
-    """插入传感器数据到数据库"""
-    init_db_if_not_exists()
-    now = datetime.datetime.now()
-    record_date = now.strftime("%Y-%m-%d")
-    record_time = now.strftime("%Y-%m-%d %H:%M:%S")
-    
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO sensor_records (record_date, record_time, do_value, ph_value, temp_value)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (record_date, record_time, do, ph, temp))
-    conn.commit()
-    conn.close()
-    # 插入后立即清理过期数据（仅保留今日+昨日）
-    clean_expired_sensor_data()
+
+def _get_recent_buffer():
+    """获取最近数据环形缓冲（内部函数；打开失败时返回None，不影响入库）"""
+    try:
+        return get_recent_buffer()
+    except Exception as e:
+        print(f"最近数据缓冲打开失败：{e}")
+        return None
+
+# 首页"近1分钟均值"：统计窗口和刷新间隔（直接在最近数据环形缓冲的映射内存上计算，不查库）
+HOME_MEAN_WINDOW_S = 60
+HOME_MEAN_REFRESH_S = 1
+
+def recent_means(window_s=HOME_MEAN_WINDOW_S, now_ms=None):
+    """最近window_s秒内（全部设备）溶解氧/PH/温度的均值 (do, ph, temp)，缓冲不可用或窗口内没有数据时返回None"""
+    recent_buffer = _get_recent_buffer()
+    if recent_buffer is None:
+        return None
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    count = recent_buffer.count_since(now_ms - window_s * 1000)
+    if not count:
+        return None
+    return tuple(recent_buffer.mean(column, count) for column in ("do", "ph", "temp"))
+
+def format_recent_means(means):
+    """首页均值标签文本"""
+    if means is None:
+        return f"近{HOME_MEAN_WINDOW_S // 60}分钟均值：暂无数据"
+    do, ph, temp = means
+    return f"近{HOME_MEAN_WINDOW_S // 60}分钟均值：溶解氧{round(do, 2)}mg/L | PH{round(ph, 1)} | 温度{round(temp, 1)}℃"
+
+def insert_sensor_record_to_db(do, ph, temp, device_id="", ts_ms=None):
+    """插入传感器数据到数据库（投递到写线程，不阻塞UI），同时写入最近数据环形缓冲
+    device_id为空表示单设备旧主题（esp32/sensor）的数据；ts_ms为空时使用本机接收时间
+    """
+    # 过期清理由定时任务负责，不在写入路径上执行
+    ts_ms = _get_storage().insert_record(do, ph, temp, ts_ms=ts_ms, device_id=device_id)
+    recent_buffer = _get_recent_buffer()
+    if recent_buffer is not None:
+        recent_buffer.append(ts_ms, do, ph, temp)
+
+def insert_sensor_batch_to_db(rows, on_commit=None):
+    """批量插入 [(device_id, ts_ms或None, do, ph, temp)]：一个写线程任务（随缓冲一次executemany），环形缓冲持一次锁写入
+    on_commit()在数据提交后于写线程调用
+    """
+    ts_list = _get_storage().insert_batch(rows, on_commit=on_commit)
+    recent_buffer = _get_recent_buffer()
+    if recent_buffer is not None:
+        recent_buffer.extend([(ts_ms, do, ph, temp) for ts_ms, (_, _, do, ph, temp) in zip(ts_list, rows)])
+    return ts_list
+
+def insert_backfill_batch_to_db(device_id, batch):
+    """设备补传的历史数据整块入库（MQTT网络线程调用，只投递到写线程）
+    不写最近数据环形缓冲、不更新界面：补传的是断线期间的旧数据；与已有数据重复的行（sqlite后端）由主键去重
+    """
+    last_values = {"do": None, "ph": None, "temp": None}
+    # 缺失项按列补齐后仍为空的（开头几条缺项）丢弃
+    rows = [row for row in batch_rows(device_id, batch, last_values) if None not in row]
+    if rows:
+        _get_storage().insert_batch(rows)
+
+
+def latest_stored_ts(device_id="", before_ms=None):
+    """某设备已入库的（早于before_ms的）最新时间戳（补传请求的起点），没有数据时返回None；读库，在查询线程调用"""
+    return _get_storage().latest_ts(device_id, before_ms)
+
+# 历史数据页面每页条数（翻页用keyset游标，代价与页码无关）
+HISTORY_PAGE_SIZE = 50
+# 历史数据页面的后台查询key：新查询自动取消同一key下未完成的旧查询
+HISTORY_QUERY_KEY = "history_page"
+# 有新数据时补充最新行的查询key（与翻页分开，不会取消正在进行的"加载更多"）
+HISTORY_NEW_ROWS_QUERY_KEY = "history_new_rows"
+# 有新数据时最多每隔几秒检查一次（设备每几秒上报一次时不必每帧查询）
+HISTORY_REFRESH_INTERVAL_S = 5
+
+def submit_query(func, *args, on_result=None, on_error=None, key=None, **kwargs):
+    """在后台线程执行查询函数，结果在主线程回调on_result(result)；返回可cancel()的请求"""
+    return get_query_executor().submit(func, *args, on_result=on_result, on_error=on_error, key=key, **kwargs)
+
+def format_sensor_sample(sample):
+    """单条传感器数据的展示字符串（只对实际显示的行调用）"""
+    time_str = ms_to_datetime(sample.ts).strftime("%Y-%m-%d %H:%M:%S")
+    device_note = f"[{sample.device_id}] " if sample.device_id else ""
+    return f"{time_str}: {device_note}溶解氧{round(sample.do,2)}mg/L | PH{round(sample.ph,1)} | 温度{round(sample.temp,1)}℃"
+
+def _target_day(date_type):
+    """今日/昨日对应的日期（内部函数）"""
+    today = datetime.date.today()
+    return today if date_type == "today" else today - datetime.timedelta(days=1)
+
+def query_sensor_page(date_type="today", after=None, limit=HISTORY_PAGE_SIZE):
+    """分页查询今日/昨日传感器数据
+    返回 (SensorSample列表, 下一页游标, 目标日期字符串)，没有下一页时游标为None
+    """
+    target_day = _target_day(date_type)
+    start_ms, end_ms = day_range_ms(target_day)
+    samples, next_cursor = _get_storage().query_page(start_ms, end_ms, limit, after)
+    return samples, next_cursor, target_day.strftime("%Y-%m-%d")
+
+def query_sensor_newer(date_type, head, limit=HISTORY_PAGE_SIZE):
+    """查询今日/昨日中比head（已显示的最新一条的(ts, 设备ID)）更新的数据（按时间倒序）
+    返回 (SensorSample列表, 是否完整)；新数据超过limit条时不完整，调用方应重新加载第一页
+    """
+    target_day = _target_day(date_type)
+    start_ms, end_ms = day_range_ms(target_day)
+    samples, next_cursor = _get_storage().query_page(head[0], end_ms, limit)
+    newer = [sample for sample in samples if (sample.ts, sample.device_id) > head]
+    return newer, next_cursor is None or len(newer) < len(samples)
 
 def query_sensor_data_by_date(date_type="today"):
-    """查询今日/昨日传感器数据"""
-    init_db_if_not_exists()
-    # 计算目标日期
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-    target_date = today if date_type == "today" else yesterday
-
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT record_time, do_value, ph_value, temp_value
-        FROM sensor_records
-        WHERE record_date = ?
-        ORDER BY record_time DESC
-    ''', (target_date,))
-    records = cursor.fetchall()
-    conn.close()
-
-    # 格式化数据（和原有GLOBAL_HISTORY_DATA格式一致）
+    """查询今日/昨日全部传感器数据（已格式化；逐页读取，UI请使用query_sensor_page）"""
+    target_day = _target_day(date_type)
+    start_ms, end_ms = day_range_ms(target_day)
+    display_data = []
+    for samples in _get_storage().iter_pages(start_ms, end_ms):
+        display_data.extend(map(format_sensor_sample, samples))
+    return display_data, target_day.strftime("%Y-%m-%d")
+
+def query_sensor_summary_by_days(days=7):
+    """查询最近days天的汇总数据（长跨度读分钟/小时汇总表，查询代价与原始数据量无关）"""
+    end_ms = int(datetime.datetime.now().timestamp() * 1000)
+    start_ms = end_ms - days * 24 * HOUR_MS
+    source, records = _get_storage().query_series(start_ms, end_ms)
+    time_format = "%Y-%m-%d %H:00" if source == ROLLUP_HOUR else "%Y-%m-%d %H:%M"
+
     display_data = []
     for record in records:
-        time_str, do, ph, temp = record
-        display_str = f"{time_str}: 溶解氧{round(do,2)}mg/L | PH{round(ph,1)} | 温度{round(temp,1)}℃"
+        if source == "raw":
+            _, ts_ms, do_avg, ph_avg, temp_avg = record
+            count = 1
+        else:
+            ts_ms, count, _, _, do_avg, _, _, ph_avg, _, _, temp_avg = record
+        time_str = ms_to_datetime(ts_ms).strftime(time_format)
+        display_str = (f"{time_str}: 溶解氧均值{round(do_avg,2)}mg/L | PH均值{round(ph_avg,1)} | "
+                       f"温度均值{round(temp_avg,1)}℃（{count}条）")
         display_data.append(display_str)
-    return display_data, target_date
+    return display_data, f"近{days}天"
 
 def clean_expired_sensor_data():
-    """清理今日/昨日之外的过期数据"""
-    init_db_if_not_exists()
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-    
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM sensor_records
-        WHERE record_date NOT IN (?, ?)
-    ''', (today, yesterday))
-    conn.commit()
-    conn.close()
-
-# ========== 全局日志存储（所有页面共享） ==========
-GLOBAL_LOGS = []  # 存储所有日志
-MAX_LOG_LINES = 50  # 最多保留50条日志，避免内存溢出
-
-def add_global_log(log_content):
-    """添加日志到全局存储，并触发UI更新"""
-    global GLOBAL_LOGS
-    # 加上时间戳，方便排查
-    timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-    log_with_time = f"[{timestamp}] {log_content}"
-    
-    GLOBAL_LOGS.append(log_with_time)
-    # 限制日志条数
-    if len(GLOBAL_LOGS) > MAX_LOG_LINES:
-        GLOBAL_LOGS = GLOBAL_LOGS[-MAX_LOG_LINES:]
-    
-    # 触发所有日志UI更新（如果有）
-    if hasattr(add_global_log, 'update_callbacks'):
-        for callback in add_global_log.update_callbacks:
-            callback()
-
-# 初始化日志更新回调列表
-add_global_log.update_callbacks = []
+    """立即清理保留期之外的过期数据（写线程分块执行）"""
+    _get_storage().clean_expired(RetentionPolicy(RETENTION_DAYS).cutoff_ms())
+
+# ========== 全局日志（所有页面共享，见log_store.py） ==========
+# 日志页面最多显示的条数（日志存储本身保留DEFAULT_LOG_CAPACITY条）
+LOG_PAGE_LINES = 2000
+# 日志文件检索：级别筛选 (显示文字, 最低级别)、时间范围 (显示文字, 最近多少秒)，点击按钮循环切换
+LOG_LEVEL_FILTERS = (("全部级别", None), ("警告以上", LEVEL_WARNING), ("仅错误", LEVEL_ERROR))
+LOG_RANGE_FILTERS = (("最近1小时", 3600), ("最近24小时", 86400), ("全部时间", None))
+LOG_SEARCH_LIMIT = 1000
+# 日志检索的后台查询key（日志检索有单独的执行器，不与历史数据查询排队）：新检索自动取消未完成的旧检索
+LOG_SEARCH_QUERY_KEY = "log_search"
+# 个人中心页面显示最新的条数
+ME_PAGE_LOG_LINES = 20
+
+def search_saved_logs(min_level=None, range_s=None, substring=None, limit=LOG_SEARCH_LIMIT, should_stop=None):
+    """检索落盘的日志文件（在日志检索线程执行）：先把内存中尚未写入的日志写入文件，再按条件流式检索
+    should_stop()返回True时提前结束（新检索或离开页面时），结果会被丢弃
+    """
+    sink = get_log_file_sink()
+    sink.flush()
+    start_text = None
+    if range_s is not None:
+        start_text = format_log_time(datetime.datetime.now() - datetime.timedelta(seconds=range_s))
+    return search_log_files(sink.directory, min_level=min_level, start_text=start_text, substring=substring,
+                            limit=limit, should_stop=should_stop)
+
+def add_global_log(log_content, *args, level=None, source=SOURCE_APP):
+    """添加日志到全局日志存储（只存记录，显示时才格式化）；日志页面通过存储的监听回调刷新
+    args非空时log_content为str.format模板，level为None时按消息开头的图标推断
+    """
+    get_log_store().add(log_content, *args, level=level, source=source)
 
 # 全局变量：存储历史数据
 GLOBAL_HISTORY_DATA = []
@@ -208,48 +285,120 @@ def create_log_page(app_instance):
     )
     log_layout.add_widget(log_title)
 
-    # 日志滚动视图（核心：可上下滑动查看所有日志）
-    log_scroll = MDScrollView(
+    # 日志列表（RecycleView：增量追加，只为可见行创建控件，新日志每帧最多刷新一次）
+    log_view = LogView(
+        capacity=LOG_PAGE_LINES,
         size_hint=(1, 1),
         do_scroll_x=False,  # 禁止横向滚动
         bar_width=dp(3),  # 滚动条宽度（手机上更易点击）
         bar_color=(0.2, 0.5, 0.8, 1),  # 滚动条颜色
         bar_inactive_color=(0.8, 0.8, 0.8, 1)
     )
+    # 检索栏：级别 / 时间范围 / 关键字，检索落盘的日志文件（后台线程逐行读取，不整个载入内存）
+    filter_state = {"level": 0, "range": 0, "stop_event": None}  # stop_event：正在进行的检索的取消标志
+    filter_bar = MDBoxLayout(
+        orientation="horizontal",
+        spacing=dp(6),
+        size_hint_y=None,
+        height=dp(40)
+    )
+    level_btn = NoBorderButton(
+        text=LOG_LEVEL_FILTERS[0][0],
+        size_hint_x=None,
+        width=dp(80),
+        size_hint_y=None,
+        height=dp(36)
+    )
+    range_btn = NoBorderButton(
+        text=LOG_RANGE_FILTERS[0][0],
+        size_hint_x=None,
+        width=dp(80),
+        size_hint_y=None,
+        height=dp(36)
+    )
+    keyword_field = MDTextField(hint_text="关键字", size_hint_x=1, font_name="CustomChinese")
+    filter_bar.add_widget(level_btn)
+    filter_bar.add_widget(range_btn)
+    filter_bar.add_widget(keyword_field)
 
-    # 日志内容容器
-    log_content = MDLabel(
-        text="",
-        font_name="CustomChinese",
-        font_size=dp(14),
+    action_bar = MDBoxLayout(
+        orientation="horizontal",
+        spacing=dp(6),
         size_hint_y=None,
-        valign="top",
+        height=dp(40)
+    )
+    search_btn = NoBorderButton(
+        text="检索",
+        size_hint_x=None,
+        width=dp(80),
+        size_hint_y=None,
+        height=dp(36)
+    )
+    live_btn = NoBorderButton(
+        text="实时",
+        size_hint_x=None,
+        width=dp(80),
+        size_hint_y=None,
+        height=dp(36)
+    )
+    search_status = MDLabel(
+        text="实时日志",
+        font_name="CustomChinese",
+        font_size=dp(13),
         halign="left"
     )
-    # 自动适配高度
-    log_content.bind(texture_size=lambda instance, size: setattr(instance, 'size', size))
-
-    # 更新日志UI的函数
-    def update_log_ui(*args):
-        # 拼接所有日志，换行分隔
-        log_text = "\n\n".join(GLOBAL_LOGS) if GLOBAL_LOGS else "暂无日志，等待MQTT连接..."
-        log_content.text = log_text
-        # 自动滚动到最新日志（底部）
-        Clock.schedule_once(lambda dt: setattr(log_scroll, 'scroll_y', 0), 0.1)
-
-    # 初始化时更新一次
-    update_log_ui()
-    # 注册到全局日志回调（有新日志时自动更新）
-    add_global_log.update_callbacks.append(update_log_ui)
-
-    log_scroll.add_widget(log_content)
-    log_layout.add_widget(log_scroll)
-
-    # 页面销毁时移除回调（避免内存泄漏）
-    def on_remove(instance, parent):
-        if update_log_ui in add_global_log.update_callbacks:
-            add_global_log.update_callbacks.remove(update_log_ui)
-    log_layout.bind(on_remove=on_remove)
+    action_bar.add_widget(search_btn)
+    action_bar.add_widget(live_btn)
+    action_bar.add_widget(search_status)
+
+    def cycle_level(instance):
+        filter_state["level"] = (filter_state["level"] + 1) % len(LOG_LEVEL_FILTERS)
+        instance.text = LOG_LEVEL_FILTERS[filter_state["level"]][0]
+
+    def cycle_range(instance):
+        filter_state["range"] = (filter_state["range"] + 1) % len(LOG_RANGE_FILTERS)
+        instance.text = LOG_RANGE_FILTERS[filter_state["range"]][0]
+
+    def show_search_result(entries):
+        log_view.show_entries(entries)
+        search_status.text = f"检索到{len(entries)}条" + ("（只显示最新的）" if len(entries) >= LOG_SEARCH_LIMIT else "")
+
+    def show_search_error(error):
+        search_status.text = f"检索失败：{str(error)}"
+
+    def on_search(instance):
+        _, min_level = LOG_LEVEL_FILTERS[filter_state["level"]]
+        _, range_s = LOG_RANGE_FILTERS[filter_state["range"]]
+        search_status.text = "检索中..."
+        # 新检索让正在读文件的旧检索提前结束（同一key的旧请求结果也会被丢弃）
+        cancel_search()
+        stop_event = filter_state["stop_event"] = threading.Event()
+        get_log_search_executor().submit(
+            search_saved_logs, min_level, range_s, keyword_field.text.strip() or None,
+            should_stop=stop_event.is_set,
+            on_result=show_search_result, on_error=show_search_error, key=LOG_SEARCH_QUERY_KEY)
+
+    def cancel_search():
+        """取消正在进行的检索（新检索前，以及离开页面时由switch_page调用）"""
+        if filter_state["stop_event"] is not None:
+            filter_state["stop_event"].set()
+        get_log_search_executor().cancel(LOG_SEARCH_QUERY_KEY)
+
+    def on_live(instance):
+        log_view.show_live()
+        search_status.text = "实时日志"
+
+    level_btn.bind(on_press=cycle_level)
+    range_btn.bind(on_press=cycle_range)
+    search_btn.bind(on_press=on_search)
+    live_btn.bind(on_press=on_live)
+
+    log_layout.add_widget(filter_bar)
+    log_layout.add_widget(action_bar)
+    log_layout.add_widget(log_view)
+    # 离开页面时switch_page调用log_view.detach()和cancel_search()
+    log_layout.log_view = log_view
+    log_layout.cancel_search = cancel_search
 
     return log_layout
 
@@ -266,7 +415,7 @@ def create_home_page(app_instance):
     # 注册MQTT回调（增加重试机制，解决初始化时序问题）
     def register_mqtt_callback(dt):
         if app_instance and hasattr(app_instance, 'mqtt_client') and app_instance.mqtt_client:
-            app_instance.mqtt_client.set_parsed_data_callback(update_sensor_ui_and_record_history)
+            app_instance.mqtt_client.set_parsed_batch_callback(update_sensor_ui_and_record_batch)
             add_global_log("✅ MQTT回调注册成功")
         else:
             # 延迟1秒重试（最多重试5次）
@@ -314,45 +463,101 @@ def create_home_page(app_instance):
         text_color=(0, 0, 1, 1)
     )
 
-    def update_sensor_ui_and_record_history(parsed_data):
-        """更新UI标签 + 记录历史数据 + 入库（新增）"""
-        try:
-            # 更新溶解氧/PH/温度UI
-            if "do" in parsed_data and parsed_data["do"] is not None:
-                do_value = round(float(parsed_data["do"]), 2)
-                do_label.text = f"溶解氧: {do_value}mg/L"
-            if "ph" in parsed_data and parsed_data["ph"] is not None:
-                ph_value = round(float(parsed_data["ph"]), 1)
-                ph_label.text = f"PH值: {ph_value}"
-            if "temp" in parsed_data and parsed_data["temp"] is not None:
-                temp_value = round(float(parsed_data["temp"]), 1)
-                temp_label.text = f"温度: {temp_value}℃"
-
-            # 记录历史数据
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            do_val = do_label.text.replace("溶解氧: ", "").replace("mg/L", "")
-            ph_val = ph_label.text.replace("PH值: ", "")
-            temp_val = temp_label.text.replace("温度: ", "").replace("℃", "")
-            history_record = f"{current_time}: 溶解氧{do_val}mg/L | PH{ph_val} | 温度{temp_val}℃"
-            
-            update_history_data(history_record)
-            add_global_log(f"📊 传感器数据更新：{history_record}")
-
-            # 新增：将数据插入数据库（仅保留今日/昨日）
+    # 最近1分钟均值（由最近数据缓冲计算，每秒最多刷新一次）
+    mean_label = MDLabel(
+        text=format_recent_means(recent_means()),
+        font_size=dp(14),
+        font_name="CustomChinese",
+        halign="center",
+        size_hint_y=None,
+        height=dp(30)
+    )
+    mean_state = {"next_refresh": 0.0}
+
+    # 用最近数据缓冲恢复上次的读数（重启APP后不再显示默认值）
+    recent_buffer = _get_recent_buffer()
+    latest = recent_buffer.latest() if recent_buffer is not None else None
+    if latest is not None:
+        _, last_do, last_ph, last_temp = latest
+        do_label.text = f"溶解氧: {round(last_do, 2)}mg/L"
+        ph_label.text = f"PH值: {round(last_ph, 1)}"
+        temp_label.text = f"温度: {round(last_temp, 1)}℃"
+
+    # 各设备各项最新读数（数据中缺少某项时沿用该设备上一次的值入库）
+    default_values = {"do": 7.25, "ph": 7.0, "temp": 25.5}
+    if latest is not None:
+        default_values["do"], default_values["ph"], default_values["temp"] = latest[1:]
+    last_values_by_device = {}
+    # 延迟追踪：界面更新/入库提交打点（追踪关闭时batch.trace均为None，不产生额外开销）
+    tracer = get_latency_tracer()
+
+    def update_sensor_ui_and_record_batch(readings):
+        """一帧内收到的全部数据 [(设备ID, SensorBatch)]：整块入库（一次批量写入），
+        UI标签/历史记录/日志只按最新一条更新一次
+        """
+        rows = []
+        traces = []
+        last_values = default_values
+        newest_device = ""
+        data_error = False
+        for device_id, batch in readings:
+            if batch is None:
+                # 格式错误的消息（已在接收线程记录日志）
+                data_error = True
+                continue
+            data_error = False
+            if batch.trace is not None:
+                traces.append(batch.trace)
+            last_values = last_values_by_device.get(device_id)
+            if last_values is None:
+                last_values = last_values_by_device[device_id] = dict(default_values)
+            # 按列补齐缺失项（沿用该设备上一条的值），一次遍历生成入库行
+            rows.extend(batch_rows(device_id, batch, last_values))
+            newest_device = device_id
+
+        # 本帧全部数据一次入库（写线程批量提交，这里只是入队）
+        if rows:
+            on_commit = (lambda: tracer.stamp_all(traces, STAGE_COMMIT)) if traces else None
             try:
-                do_num = float(do_val) if do_val.replace('.','').isdigit() else 0.0
-                ph_num = float(ph_val) if ph_val.replace('.','').isdigit() else 0.0
-                temp_num = float(temp_val) if temp_val.replace('.','').isdigit() else 0.0
-                insert_sensor_record_to_db(do_num, ph_num, temp_num)
+                insert_sensor_batch_to_db(rows, on_commit)
             except Exception as e:
                 add_global_log(f"❌ 数据入库失败：{str(e)}")
 
-        except (ValueError, TypeError):
-            error_msg = "❌ 传感器数据格式异常"
-            add_global_log(error_msg)
+        if data_error:
+            add_global_log("❌ 传感器数据格式异常")
             do_label.text = "溶解氧: 数据异常mg/L"
             ph_label.text = "PH值: 数据异常"
             temp_label.text = "温度: 数据异常℃"
+            return
+
+        # 更新溶解氧/PH/温度UI
+        do_label.text = f"溶解氧: {round(last_values['do'], 2)}mg/L"
+        ph_label.text = f"PH值: {round(last_values['ph'], 1)}"
+        temp_label.text = f"温度: {round(last_values['temp'], 1)}℃"
+        now = time.monotonic()
+        if now >= mean_state["next_refresh"]:
+            mean_state["next_refresh"] = now + HOME_MEAN_REFRESH_S
+            mean_label.text = format_recent_means(recent_means())
+        if traces:
+            tracer.stamp_all(traces, STAGE_UI)
+
+        # 记录历史数据（多设备时标注设备ID）
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        device_note = f"[{newest_device}] " if newest_device else ""
+        history_record = (f"{current_time}: {device_note}溶解氧{round(last_values['do'], 2)}mg/L | "
+                          f"PH{round(last_values['ph'], 1)} | 温度{round(last_values['temp'], 1)}℃")
+        update_history_data(history_record)
+        batch_note = f"（本帧{len(rows)}条）" if len(rows) > 1 else ""
+        # 每帧一条：走限速的sensor类别（模板+参数，被限速丢弃时不格式化）
+        add_global_log("📊 传感器数据更新：{}{}", history_record, batch_note, source=SOURCE_SENSOR)
+
+    def update_sensor_ui_and_record_history(parsed_data, device_id=""):
+        """更新UI标签 + 记录历史数据 + 入库（单条数据字典）"""
+        try:
+            batch = batch_from_json(parsed_data)
+        except ValueError:
+            batch = None
+        update_sensor_ui_and_record_batch([(device_id, batch)])
 
     # 手动开关
     switch_label = MDLabel(
@@ -392,12 +597,19 @@ def create_home_page(app_instance):
             if not mqtt_client:
                 raise Exception("MQTT客户端未初始化")
             
-            send_result = mqtt_client.publish_command("esp32/switch", send_data)
-            if send_result:
+            # 异步发布（QoS1）：不等待网络，送达后回调；离线时进入发件箱，重连后按顺序发送
+            def on_delivered(future):
+                if future.exception() is not None:
+                    toast(f"设备{cmd_desc}失败：{future.exception()}")
+                    return
                 toast(f"设备{cmd_desc}成功")
-                add_global_log(f"📱 手动开关操作：设备{cmd_desc}")
-            else:
-                raise Exception("MQTT未连接")
+                add_global_log(f"📱 手动开关操作：设备{cmd_desc}（送达{future.result()}ms）")
+
+            send_result = mqtt_client.publish_command("esp32/switch", send_data, callback=on_delivered)
+            if not send_result:
+                raise Exception("指令提交失败")
+            if not mqtt_client.connected:
+                toast(f"MQTT未连接，{cmd_desc}指令将在重连后发送")
         
         except Exception as e:
             error_msg = f"❌ 开关操作失败：{str(e)}"
@@ -496,32 +708,44 @@ def create_home_page(app_instance):
             Clock.schedule_once(lambda x: instance.reset_button_state(), 2)
             return
         
-        # 构造JSON数据
-        try:
-            threshold_data = json.dumps({
-                "max_do": max_val,
-                "min_do": min_val,
-                "timestamp": str(datetime.datetime.now())
-            }, ensure_ascii=False)
-        except Exception as e:
-            error_msg = f"❌ 构造JSON失败：{str(e)}"
-            add_global_log(error_msg)
-            app_instance._update_recv_data(error_msg)
-            Clock.schedule_once(lambda x: instance.reset_button_state(), 2)
-            return
+        # 阈值数据（发送时自动加上req_id，设备在esp32/threshold_response回复）
+        threshold_data = {
+            "max_do": max_val,
+            "min_do": min_val,
+            "timestamp": str(datetime.datetime.now())
+        }
         
         # 发送数据到服务器
         try:
             if not app_instance or not app_instance.mqtt_client:
                 raise Exception("MQTT客户端未初始化")
             
-            send_result = app_instance.mqtt_client.publish_command("esp32/threshold", threshold_data)
-            if send_result:
-                success_msg = f"✅ 阈值已发送：最高{max_val} | 最低{min_val}"
+            # 异步发布（QoS1）：不等待网络，送达后回调；离线时进入发件箱，重连后按顺序发送
+            def on_delivered(future):
+                if future.exception() is not None:
+                    success_msg = f"❌ 阈值未送达：{future.exception()}"
+                else:
+                    success_msg = f"✅ 阈值已送达：最高{max_val} | 最低{min_val}（{future.result()}ms）"
                 add_global_log(success_msg)
                 app_instance._update_recv_data(success_msg)
-            else:
-                raise Exception("MQTT未连接")
+
+            # 设备确认（或超时）后回调
+            def on_response(future):
+                try:
+                    response = future.result()
+                    status = response.get("status", response.get("result", response.get("text", "")))
+                    response_msg = f"✅ 设备已确认阈值：最高{max_val} | 最低{min_val}（{status}）"
+                except TimeoutError as e:
+                    response_msg = f"⚠️ 设备未确认阈值：{str(e)}"
+                add_global_log(response_msg)
+                app_instance._update_recv_data(response_msg)
+
+            from esp32_mqtt_utils import THRESHOLD_TOPIC
+            response_future = app_instance.mqtt_client.send_request(THRESHOLD_TOPIC, threshold_data,
+                                                                    on_delivered=on_delivered,
+                                                                    on_response=on_response)
+            if response_future is None:
+                raise Exception("指令提交失败")
         
         except Exception as e:
             error_msg = f"❌ 发送阈值失败：{str(e)}"
@@ -566,6 +790,7 @@ def create_home_page(app_instance):
     sensor_layout.add_widget(ph_label)
     sensor_layout.add_widget(temp_label)
     home_layout.add_widget(sensor_layout)
+    home_layout.add_widget(mean_label)
 
     # PH安全范围图片（取消注释需放置ph_safe_table.jpg到根目录）
     ph_table_layout = MDBoxLayout(
@@ -634,23 +859,32 @@ def create_history_page(app_instance):
     today_btn = NoBorderButton(
         text="今日数据",
         size_hint_x=None,
-        width=dp(120),
+        width=dp(90),
         height=dp(40)
     )
     # 昨日数据按钮（移除md_bg_color/text_color传参）
     yesterday_btn = NoBorderButton(
         text="昨日数据",
         size_hint_x=None,
-        width=dp(120),
+        width=dp(90),
+        height=dp(40)
+    )
+    # 近7天汇总按钮（读小时汇总表）
+    week_btn = NoBorderButton(
+        text="近7天",
+        size_hint_x=None,
+        width=dp(90),
         height=dp(40)
     )
     
     # 延迟设置按钮颜色（关键：等canvas初始化完成）
     Clock.schedule_once(lambda dt: today_btn.set_button_colors((0.2, 0.5, 0.8, 1), (1, 1, 1, 1)), 0.02)
     Clock.schedule_once(lambda dt: yesterday_btn.set_button_colors((0.8, 0.8, 0.8, 1), (0, 0, 0, 1)), 0.02)
+    Clock.schedule_once(lambda dt: week_btn.set_button_colors((0.8, 0.8, 0.8, 1), (0, 0, 0, 1)), 0.02)
 
     btn_layout.add_widget(today_btn)
     btn_layout.add_widget(yesterday_btn)
+    btn_layout.add_widget(week_btn)
     history_layout.add_widget(btn_layout)
 
     scroll_view = ScrollView(
@@ -672,63 +906,194 @@ def create_history_page(app_instance):
     )
     scroll_content.bind(minimum_height=scroll_content.setter('height'))
     
-    # 重构刷新函数：支持按日期类型刷新
+    def add_data_label(text, highlight=False, top=False):
+        data_label = MDLabel(
+            text=text,
+            font_size=dp(16),
+            font_name="CustomChinese",
+            halign="left",
+            size_hint_y=None,
+            height=dp(40),
+            theme_text_color="Custom",
+            text_color=(0.8, 0, 0, 1) if highlight else (0.2, 0.2, 0.2, 1),
+            valign="middle",
+        )
+        # top：插到最上面（有新数据时补充的行）
+        scroll_content.add_widget(data_label, index=len(scroll_content.children) if top else 0)
+
+    # 加载更多按钮（今日/昨日数据分页显示，只格式化已加载的行）
+    load_more_btn = NoBorderButton(
+        text="加载更多",
+        size_hint_y=None,
+        height=dp(40)
+    )
+    # pages：已加载的页数；head：已显示的最新一条的(ts, 设备ID)，有新数据时只补充比它新的行；prepended：已补充的行数
+    page_state = {"date_type": "today", "cursor": None, "pages": 0, "head": None, "prepended": 0}
+
+    # 有新数据的提示（已翻过页或近7天汇总时不自动重载，点击后回到第一页）
+    new_data_btn = NoBorderButton(
+        text="有新数据，点击刷新",
+        size_hint_y=None,
+        height=dp(40)
+    )
+
+    # 加载提示（查询在后台线程执行，结果回到主线程后移除）
+    loading_label = MDLabel(
+        text="加载中...",
+        font_size=dp(16),
+        font_name="CustomChinese",
+        halign="center",
+        size_hint_y=None,
+        height=dp(40),
+        theme_text_color="Custom",
+        text_color=(0.5, 0.5, 0.5, 1),
+    )
+
+    def show_loading():
+        if not loading_label.parent:
+            scroll_content.add_widget(loading_label)
+
+    def hide_loading():
+        if loading_label.parent:
+            scroll_content.remove_widget(loading_label)
+
+    def on_query_error(error):
+        hide_loading()
+        print(f"历史数据查询失败：{error}")
+        add_data_label("历史数据查询失败，请稍后重试", highlight=True)
+
+    def on_page_loaded(result):
+        hide_loading()
+        samples, next_cursor, target_date = result
+        page_state["cursor"] = next_cursor
+        if page_state["pages"] == 0 and samples:
+            page_state["head"] = (samples[0].ts, samples[0].device_id)
+        page_state["pages"] += 1
+        # 首页无数据时的默认提示
+        if not samples and not scroll_content.children:
+            add_data_label(f"{target_date} 暂无传感器数据", highlight=True)
+            return
+        for sample in samples:
+            add_data_label(format_sensor_sample(sample))
+        if next_cursor is not None:
+            scroll_content.add_widget(load_more_btn)
+
+    def load_next_page(*args):
+        if load_more_btn.parent:
+            scroll_content.remove_widget(load_more_btn)
+        show_loading()
+        submit_query(query_sensor_page, page_state["date_type"], page_state["cursor"],
+                     on_result=on_page_loaded, on_error=on_query_error, key=HISTORY_QUERY_KEY)
+
+    load_more_btn.bind(on_press=load_next_page)
+
+    def on_summary_loaded(result):
+        hide_loading()
+        display_data, target_date = result
+        if not display_data:
+            add_data_label(f"{target_date} 暂无传感器数据", highlight=True)
+        for data in display_data:
+            add_data_label(data)
+
+    # 重构刷新函数：支持按日期类型刷新（查询在后台执行，快速切换时旧查询自动取消）
     def refresh_history_ui(date_type="today"):
+        get_query_executor().cancel(HISTORY_NEW_ROWS_QUERY_KEY)
         scroll_content.clear_widgets()
-        # 从数据库查询对应日期数据
-        display_data, target_date = query_sensor_data_by_date(date_type)
-        
-        # 无数据时的默认提示
-        if not display_data:
-            display_data = [f"{target_date} 暂无传感器数据"]
-        
-        # 重新添加数据标签
-        for idx, data in enumerate(display_data):
-            data_label = MDLabel(
-                text=data,
-                font_size=dp(16),
-                font_name="CustomChinese",
-                halign="left",
-                size_hint_y=None,
-                height=dp(40),
-                theme_text_color="Custom",
-                text_color=(0.2, 0.2, 0.2, 1) if idx != 0 or len(display_data) > 1 else (0.8, 0, 0, 1),
-                valign="middle",
-            )
-            scroll_content.add_widget(data_label)
+        page_state["date_type"] = date_type
+        page_state["cursor"] = None
+        page_state["pages"] = 0
+        page_state["head"] = None
+        page_state["prepended"] = 0
+        if date_type != "week":
+            load_next_page()
+            return
+
+        # 近7天读汇总数据（每小时一行，行数固定）
+        show_loading()
+        submit_query(query_sensor_summary_by_days, 7,
+                     on_result=on_summary_loaded, on_error=on_query_error, key=HISTORY_QUERY_KEY)
 
     # 按钮点击事件：切换数据+更新按钮样式（改用set_button_colors）
+    def highlight_button(active_btn):
+        for btn in (today_btn, yesterday_btn, week_btn):
+            if btn is active_btn:
+                btn.set_button_colors((0.2, 0.5, 0.8, 1), (1, 1, 1, 1))
+            else:
+                btn.set_button_colors((0.8, 0.8, 0.8, 1), (0, 0, 0, 1))
+
     def show_today(*args):
-        today_btn.set_button_colors((0.2, 0.5, 0.8, 1), (1, 1, 1, 1))
-        yesterday_btn.set_button_colors((0.8, 0.8, 0.8, 1), (0, 0, 0, 1))
+        highlight_button(today_btn)
         refresh_history_ui("today")
         toast("已切换到今日数据")
 
     def show_yesterday(*args):
-        yesterday_btn.set_button_colors((0.2, 0.5, 0.8, 1), (1, 1, 1, 1))
-        today_btn.set_button_colors((0.8, 0.8, 0.8, 1), (0, 0, 0, 1))
+        highlight_button(yesterday_btn)
         refresh_history_ui("yesterday")
         toast("已切换到昨日数据")
 
+    def show_week(*args):
+        highlight_button(week_btn)
+        refresh_history_ui("week")
+        toast("已切换到近7天汇总数据")
+
     # 绑定按钮事件
     today_btn.bind(on_press=show_today)
     yesterday_btn.bind(on_press=show_yesterday)
+    week_btn.bind(on_press=show_week)
 
     # 初始化时加载今日数据
     refresh_history_ui("today")
-    # 注册回调（切换页面时自动刷新）
-    register_history_callback(lambda: refresh_history_ui("today"))
+    new_data_btn.bind(on_press=lambda *args: refresh_history_ui(page_state["date_type"]))
+
+    def show_new_data_hint():
+        if not new_data_btn.parent:
+            scroll_content.add_widget(new_data_btn, index=len(scroll_content.children))
+
+    def on_newer_loaded(result):
+        samples, complete = result
+        page_state["prepended"] += len(samples)
+        if not complete or page_state["prepended"] > HISTORY_PAGE_SIZE:
+            # 新数据超过一页（或补充的行已超过一页，列表越来越长）：只显示第一页时直接重新加载（不会丢掉已翻的页），否则只提示
+            if page_state["pages"] > 1:
+                show_new_data_hint()
+            else:
+                refresh_history_ui(page_state["date_type"])
+            return
+        if not samples:
+            return
+        # 新数据按时间倒序返回，从旧到新依次插到最上面
+        for sample in reversed(samples):
+            add_data_label(format_sensor_sample(sample), top=True)
+        page_state["head"] = (samples[0].ts, samples[0].device_id)
+
+    def check_new_rows(*args):
+        """有新数据时（节流后）更新显示：只显示第一页时在顶部补充新行，已翻页或汇总视图只显示提示"""
+        date_type = page_state["date_type"]
+        if date_type == "yesterday" or (page_state["pages"] == 0 and loading_label.parent):
+            return  # 昨日数据不会变化；第一页还在加载时会包含新数据
+        if date_type == "week" or page_state["pages"] > 1 or loading_label.parent:
+            show_new_data_hint()
+            return
+        if page_state["head"] is None:
+            refresh_history_ui(date_type)  # 第一页为空：重新加载即可
+            return
+        submit_query(query_sensor_newer, date_type, page_state["head"],
+                     on_result=on_newer_loaded, on_error=on_query_error, key=HISTORY_NEW_ROWS_QUERY_KEY)
+
+    new_rows_trigger = Clock.create_trigger(check_new_rows, HISTORY_REFRESH_INTERVAL_S)
+
+    # 注册回调（每帧有新数据时调用，只触发节流后的检查）
+    def on_history_update():
+        new_rows_trigger()
+    register_history_callback(on_history_update)
+    # switch_page切换页面时按此属性注销回调、取消未完成的查询和检查
+    history_layout.update_history_ui = on_history_update
+    history_layout.new_rows_trigger = new_rows_trigger
     add_global_log("📱 进入历史数据页面")
 
     scroll_view.add_widget(scroll_content)
     history_layout.add_widget(scroll_view)
 
-    # 页面销毁时注销回调
-    def on_remove(instance, parent):
-        unregister_history_callback(refresh_history_ui)
-        add_global_log("📱 退出历史数据页面")
-    history_layout.bind(on_remove=on_remove)
-
     return history_layout
 
 
@@ -777,6 +1142,132 @@ def create_me_page(app_instance):
         font_size=dp(16),
         font_name="CustomChinese"
     ))
+    # 各探头在线情况（多设备主题esp32/<设备ID>/sensor）
+    if hasattr(app_instance, 'mqtt_client') and app_instance.mqtt_client:
+        registry = app_instance.mqtt_client.devices
+        for state in registry.devices():
+            age = state.age_s()
+            online = registry.is_fresh(state.device_id)
+            me_layout.add_widget(MDLabel(
+                text=(f"探头 {state.device_id or '默认'}：{'在线' if online else '离线'}"
+                      f"（{int(age)}秒前 | 共{state.message_count}条）"),
+                font_size=dp(14),
+                font_name="CustomChinese",
+                theme_text_color="Custom",
+                text_color=(0, 0.6, 0, 1) if online else (0.8, 0, 0, 1)
+            ))
+    # 数据库写缓冲状态
+    try:
+        db_stats = _get_storage().get_stats()
+        db_status = (f"数据库缓冲：待写入{db_stats['pending_rows']}条 | "
+                     f"最近批量{db_stats['last_flush_size']}条/{db_stats['last_flush_latency_ms']:.1f}ms")
+    except Exception as e:
+        db_status = f"数据库缓冲：状态获取失败（{e}）"
+    me_layout.add_widget(MDLabel(
+        text=db_status,
+        font_size=dp(14),
+        font_name="CustomChinese"
+    ))
+    # MQTT连接状态机、接收队列（网络线程 -> 主线程）、指令发件箱状态
+    if hasattr(app_instance, 'mqtt_client') and app_instance.mqtt_client:
+        from esp32_mqtt_utils import STATE_NAMES
+        conn_stats = app_instance.mqtt_client.get_connection_stats()
+        last_ms = conn_stats['last_reconnect_ms']
+        avg_ms = conn_stats['avg_reconnect_ms']
+        me_layout.add_widget(MDLabel(
+            text=(f"连接：{STATE_NAMES.get(conn_stats['state'], conn_stats['state'])} | "
+                  f"重连{conn_stats['total_reconnects']}次 | "
+                  f"最近恢复{'--' if last_ms is None else f'{last_ms / 1000.0:.1f}'}秒 | "
+                  f"平均{'--' if avg_ms is None else f'{avg_ms / 1000.0:.1f}'}秒"),
+            font_size=dp(14),
+            font_name="CustomChinese"
+        ))
+        try:
+            outbox_stats = app_instance.mqtt_client.get_outbox_stats()
+            avg_ms = outbox_stats['avg_delivery_ms']
+            outbox_status = (f"指令发件箱：待发送{outbox_stats['pending']}条 | "
+                             f"最近平均送达{'--' if avg_ms is None else f'{avg_ms:.0f}'}ms | "
+                             f"已过期{outbox_stats['total_expired']}条")
+        except Exception as e:
+            outbox_status = f"指令发件箱：状态获取失败（{e}）"
+        me_layout.add_widget(MDLabel(
+            text=outbox_status,
+            font_size=dp(14),
+            font_name="CustomChinese"
+        ))
+        ingest_stats = app_instance.mqtt_client.get_ingest_stats()
+        me_layout.add_widget(MDLabel(
+            text=(f"接收队列：当前{ingest_stats['depth']}条 | 峰值{ingest_stats['max_depth']}条 | "
+                  f"丢弃{ingest_stats['total_dropped']}条 | 合并{ingest_stats['total_coalesced']}条"),
+            font_size=dp(14),
+            font_name="CustomChinese"
+        ))
+    # 端到端延迟追踪（设备采样 -> 收到 -> 解析 -> 主线程 -> 界面/入库）
+    tracer = get_latency_tracer()
+    trace_bar = MDBoxLayout(
+        orientation="horizontal",
+        spacing=dp(10),
+        size_hint_y=None,
+        height=dp(40)
+    )
+    trace_bar.add_widget(MDLabel(
+        text="延迟追踪",
+        font_size=dp(16),
+        font_name="CustomChinese"
+    ))
+    trace_switch = NoBorderButton(
+        text="开" if tracer.enabled else "关",
+        button_type="switch",
+        size_hint_x=None,
+        width=dp(60),
+        size_hint_y=None,
+        height=dp(30)
+    )
+    trace_switch.current_state = trace_switch.text
+    trace_dump_btn = NoBorderButton(
+        text="导出",
+        size_hint_x=None,
+        width=dp(70),
+        size_hint_y=None,
+        height=dp(30)
+    )
+    trace_bar.add_widget(trace_switch)
+    trace_bar.add_widget(trace_dump_btn)
+    me_layout.add_widget(trace_bar)
+    trace_label = MDLabel(
+        text=tracer.format_stats(),
+        font_size=dp(14),
+        font_name="CustomChinese",
+        size_hint_y=None
+    )
+    trace_label.bind(texture_size=lambda label, size: setattr(label, "height", size[1]))
+    me_layout.add_widget(trace_label)
+
+    def toggle_trace(instance):
+        instance.current_state = "开" if instance.current_state == "关" else "关"
+        instance.text = instance.current_state
+        instance.update_button_colors()
+        tracer.enabled = instance.current_state == "开"
+        if tracer.enabled:
+            tracer.reset()
+        trace_label.text = tracer.format_stats()
+        add_global_log(f"📱 延迟追踪已{'开启' if tracer.enabled else '关闭'}")
+
+    def dump_trace(instance):
+        instance.is_pressed = True
+        instance.update_button_colors()
+        Clock.schedule_once(lambda x: instance.reset_button_state(), 2)
+        try:
+            path = tracer.dump(get_data_path(LATENCY_DUMP_FILENAME))
+            trace_label.text = tracer.format_stats()
+            toast(f"已导出：{path}")
+            add_global_log(f"📱 延迟统计已导出到{path}")
+        except Exception as e:
+            toast(f"导出失败：{str(e)}")
+
+    trace_switch.bind(on_press=toggle_trace)
+    trace_dump_btn.bind(on_press=dump_trace)
+
     # 日志滚动视图
     log_scroll_view = ScrollView(
         size_hint=(1, None),
@@ -791,13 +1282,14 @@ def create_me_page(app_instance):
         valign="top",
         halign="left"
     )
-    log_label.is_log_label = True  # 标记为日志标签
     log_label.bind(texture_size=log_label.setter('size'))
-    # 初始化日志内容
-    from main import recv_data_list
-    log_label.text = "\n".join(recv_data_list) + "\n"
+    # 初始化日志内容（之后由main._refresh_me_page_log随日志新增刷新，只在本页显示期间订阅）
+    log_label.text = format_records(get_log_store().latest(ME_PAGE_LOG_LINES)) + "\n"
     log_scroll_view.add_widget(log_label)
     me_layout.add_widget(log_scroll_view)
+    me_layout.me_log_label = log_label  # switch_page离开本页时据此取消订阅
+    if hasattr(app_instance, 'attach_me_page_log'):
+        app_instance.attach_me_page_log(log_label)
     add_global_log("📱 进入个人中心页面")
 
     return me_layout
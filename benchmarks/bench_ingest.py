@@ -0,0 +1,453 @@
+# benchmarks/bench_ingest.py：端到端接收压测（PC上无界面运行）
+# 本机MQTT服务器替身 + N台模拟ESP32（按速率上报，可加突发、格式错误消息、随机断线），
+# 驱动真实的Esp32MqttClient（网络线程解析 -> 接收队列 -> 每帧处理）和存储批量写入，统计持续吞吐和丢失条数
+# 依赖paho-mqtt和kivy（只用Clock，不创建窗口）；模拟设备直接用socket收发，不依赖paho
+# 用法：
+#   python benchmarks/bench_ingest.py                                   # 10台设备 × 10条/秒，30秒
+#   python benchmarks/bench_ingest.py --devices 50 --rate 20 --burst-every 5 --burst-size 200
+#   python benchmarks/bench_ingest.py --malformed 0.05 --device-disconnect-every 10 --kick-every 15
+#   python benchmarks/bench_ingest.py --topic device --format binary_batch --batch-size 10
+#   python benchmarks/bench_ingest.py --trace                           # 同时统计各段延迟p50/p95/p99
+#   python benchmarks/bench_ingest.py --topic device --format binary_batch --kick-every 10 --backfill
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 无界面运行：不解析命令行参数、不输出Kivy日志
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+# 不加载UI模块（导入app_ui_pages会创建窗口）；客户端日志只写入log_store，data_callback经事件总线在Clock.tick中调用，不依赖UI
+sys.modules.setdefault("app_ui_pages", None)
+
+from mqtt_broker import (  # noqa: E402
+    LocalBroker, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, DISCONNECT,
+    encode_connect, encode_packet, encode_publish, encode_string, read_packet,
+)
+from latency_trace import get_latency_tracer, STAGE_UI, STAGE_COMMIT  # noqa: E402
+from ingest_queue import DEFAULT_INGEST_MAXLEN, POLICY_DROP_OLDEST, POLICY_COALESCE_LATEST  # noqa: E402
+from sensor_payload import batch_rows, encode_binary  # noqa: E402
+from storage import BACKENDS, create_backend  # noqa: E402
+from storage.base import LATEST_TS_UPPER_MS  # noqa: E402
+
+CLIENT_ID_PREFIX = "esp32_android"
+DEVICE_ID_PREFIX = "sim"
+PAYLOAD_FORMATS = ("json", "json_batch", "binary", "binary_batch")
+# 截断的JSON（模拟串口/网络出错的上报）
+MALFORMED_PAYLOAD = b'{"do": 7.1, "ph": 7.'
+# 设备断线后多久重连
+DEVICE_RECONNECT_DELAY_S = 0.5
+# 停止上报后等待客户端处理完剩余消息的最长时间
+DRAIN_TIMEOUT_S = 5
+# 模拟设备本地缓存的数据条数（补传用）和每条补传消息的最大条数
+DEVICE_HISTORY_SAMPLES = 100000
+BACKFILL_CHUNK_SAMPLES = 1000
+
+
+# ========== 模拟设备 ==========
+class SimulatedDevice(threading.Thread):
+    """一台模拟ESP32：按固定速率采样上报，可选突发、格式错误和随机断线
+    断线期间照常采样（未发出的数据只留在本地缓存）；开启--backfill时响应APP的补传请求，把缓存数据整块补发
+    """
+
+    def __init__(self, index, host, port, args, stop_event, request_topic=None):
+        super().__init__(name=f"SimDevice-{index}", daemon=True)
+        self.device_id = f"{DEVICE_ID_PREFIX}-{index}"
+        self.host = host
+        self.port = port
+        self.args = args
+        self.stop_event = stop_event
+        self.rng = random.Random(args.seed + index)
+        if args.topic == "legacy":
+            self.topic, self.backfill_topic = "esp32/sensor", "esp32/backfill"
+        else:
+            self.topic, self.backfill_topic = f"esp32/{self.device_id}/sensor", f"esp32/{self.device_id}/backfill"
+        self.request_topic = request_topic  # APP发补传请求的主题
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.history = collections.deque(maxlen=DEVICE_HISTORY_SAMPLES)  # 本地缓存 (ts, do, ph, temp)
+        self.history_lock = threading.Lock()
+        # 统计
+        self.messages_sent = 0
+        self.samples_generated = 0  # 采到的有效数据条数（含断线期间未发出的）
+        self.samples_sent = 0       # 实时上报发出的有效数据条数
+        self.malformed_sent = 0
+        self.disconnects = 0
+        self.send_failures = 0
+        self.backfill_requests = 0
+        self.samples_backfilled = 0
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(encode_connect(self.device_id, keepalive=0))
+        packet = read_packet(sock)
+        if packet is None or packet[0] != CONNACK:
+            sock.close()
+            raise ConnectionError("未收到CONNACK")
+        sock.settimeout(None)
+        if self.args.backfill:
+            sock.sendall(encode_packet(SUBSCRIBE, 2, b"\x00\x01" + encode_string(self.request_topic) + b"\x01"))
+            threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+        self.sock = sock
+
+    def drop(self):
+        """不发DISCONNECT直接断开（模拟掉线）"""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, packet):
+        """发送一个报文，失败时断开并返回False"""
+        sock = self.sock
+        if sock is None:
+            return False
+        try:
+            with self.send_lock:
+                sock.sendall(packet)
+            return True
+        except OSError:
+            self.send_failures += 1
+            self.drop()
+            return False
+
+    def make_readings(self):
+        """采样：返回 [(ts, do, ph, temp)]；批量格式模拟100Hz采样，最后一条为当前时刻"""
+        count = self.args.batch_size if self.args.format.endswith("_batch") else 1
+        now_ms = int(time.time() * 1000)
+        return [(now_ms - (count - 1 - i) * 10, round(7.0 + self.rng.random(), 2),
+                 round(6.8 + self.rng.random() * 0.8, 2), round(24.0 + self.rng.random() * 2, 2))
+                for i in range(count)]
+
+    def encode(self, readings):
+        fmt = self.args.format
+        if fmt == "json":
+            _, do, ph, temp = readings[0]
+            return json.dumps({"do": do, "ph": ph, "temp": temp}).encode()
+        if fmt == "json_batch":
+            return json.dumps([{"ts": ts, "do": do, "ph": ph, "temp": temp}
+                               for ts, do, ph, temp in readings]).encode()
+        if fmt == "binary":
+            return encode_binary([reading[1:] for reading in readings])
+        return encode_binary(readings, readings[0][0])
+
+    def publish(self):
+        if self.args.malformed and self.rng.random() < self.args.malformed:
+            if self.send(encode_publish(self.topic, MALFORMED_PAYLOAD)):
+                self.messages_sent += 1
+                self.malformed_sent += 1
+            return
+        readings = self.make_readings()
+        self.samples_generated += len(readings)
+        if self.args.backfill:
+            with self.history_lock:
+                self.history.extend(readings)
+        if self.send(encode_publish(self.topic, self.encode(readings))):
+            self.messages_sent += 1
+            self.samples_sent += len(readings)
+
+    def _read_loop(self, sock):
+        """接收补传请求（连接断开时退出）"""
+        while True:
+            packet = read_packet(sock)
+            if packet is None:
+                return
+            packet_type, flags, body = packet
+            if packet_type != PUBLISH:
+                continue
+            offset = 2 + int.from_bytes(body[:2], "big")
+            if flags & 0x06:
+                self.send(encode_packet(PUBACK, 0, body[offset:offset + 2]))
+                offset += 2
+            try:
+                since = int(json.loads(body[offset:]).get("since") or 0)
+            except (ValueError, AttributeError):
+                continue
+            self.backfill_requests += 1
+            self.send_backfill(since)
+
+    def send_backfill(self, since):
+        """把本地缓存中since之后的数据按带时间戳的二进制格式分块补发"""
+        with self.history_lock:
+            samples = [reading for reading in self.history if reading[0] > since]
+        for start in range(0, len(samples), BACKFILL_CHUNK_SAMPLES):
+            chunk = samples[start:start + BACKFILL_CHUNK_SAMPLES]
+            if not self.send(encode_publish(self.backfill_topic, encode_binary(chunk, chunk[0][0]))):
+                return
+            self.samples_backfilled += len(chunk)
+
+    def run(self):
+        interval = 1.0 / self.args.rate
+        start = time.monotonic()
+        next_send = start + self.rng.random() * interval  # 错开各设备的上报时刻
+        next_burst = start + self.args.burst_every if self.args.burst_every else None
+        next_drop = self._next_drop(start)
+        reconnect_at = start
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if self.sock is None and now >= reconnect_at:
+                try:
+                    self.connect()
+                except OSError:
+                    reconnect_at = now + DEVICE_RECONNECT_DELAY_S
+            if next_drop is not None and now >= next_drop:
+                if self.sock is not None:
+                    self.drop()
+                    self.disconnects += 1
+                reconnect_at = now + DEVICE_RECONNECT_DELAY_S
+                next_drop = self._next_drop(now)
+            if next_burst is not None and now >= next_burst:
+                for _ in range(self.args.burst_size):
+                    self.publish()
+                next_burst += self.args.burst_every
+            if now >= next_send:
+                # 断线期间照常采样，数据只进本地缓存
+                self.publish()
+                next_send += interval
+                # 落后太多（机器跑不动）时不补发，避免一次性堆积
+                if next_send < now - 1.0:
+                    next_send = now + interval
+            else:
+                self.stop_event.wait(next_send - now)
+        if self.sock is not None:
+            self.send(encode_packet(DISCONNECT, 0, b""))
+            self.drop()
+
+    def _next_drop(self, now):
+        """下一次随机断线的时刻（指数分布，均值为--device-disconnect-every秒）"""
+        if not self.args.device_disconnect_every:
+            return None
+        return now + self.rng.expovariate(1.0 / self.args.device_disconnect_every)
+
+
+# ========== 被测客户端 ==========
+class IngestSink:
+    """替代首页的批量回调：按首页相同方式生成入库行并批量写入存储"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.tracer = get_latency_tracer()
+        self.last_values_by_device = {}
+        self.frames = 0
+        self.rows_submitted = 0
+        self.rows_backfilled = 0
+        self.bad_messages = 0
+        self.log_lines = 0
+
+    def on_log(self, message):
+        self.log_lines += message.count("\n") + 1
+
+    def on_batch(self, readings):
+        self.frames += 1
+        rows = []
+        traces = []
+        for device_id, batch in readings:
+            if batch is None:
+                self.bad_messages += 1
+                continue
+            if batch.trace is not None:
+                traces.append(batch.trace)
+            last_values = self.last_values_by_device.get(device_id)
+            if last_values is None:
+                last_values = self.last_values_by_device[device_id] = {"do": 0.0, "ph": 0.0, "temp": 0.0}
+            rows.extend(batch_rows(device_id, batch, last_values))
+        if rows:
+            on_commit = (lambda: self.tracer.stamp_all(traces, STAGE_COMMIT)) if traces else None
+            self.storage.insert_batch(rows, on_commit)
+            self.rows_submitted += len(rows)
+        if traces:
+            self.tracer.stamp_all(traces, STAGE_UI)
+
+    def on_backfill(self, device_id, batch):
+        """与APP的insert_backfill_batch_to_db相同：网络线程直接批量入库"""
+        last_values = {"do": None, "ph": None, "temp": None}
+        rows = [row for row in batch_rows(device_id, batch, last_values) if None not in row]
+        if rows:
+            self.storage.insert_batch(rows)
+            self.rows_backfilled += len(rows)
+
+
+def run(args, work_dir):
+    from kivy.clock import Clock
+    from esp32_mqtt_utils import Esp32MqttClient, backfill_request_topic
+
+    tracer = get_latency_tracer()
+    tracer.enabled = args.trace
+    tracer.reset()
+    broker = LocalBroker(port=args.port).start()
+    storage = create_backend(args.backend, os.path.join(work_dir, f"ingest_{args.backend}.data"))
+    storage.start()
+    sink = IngestSink(storage)
+    client = Esp32MqttClient("127.0.0.1", broker.port, None, None, sink.on_log,
+                             ingest_maxlen=args.ingest_maxlen, ingest_policy=args.ingest_policy, tls=False,
+                             client_id=f"{CLIENT_ID_PREFIX}_bench", clean_session=args.clean_session,
+                             backfill_since=storage.latest_ts if args.backfill else None)
+    client.set_parsed_batch_callback(sink.on_batch)
+    client.set_backfill_callback(sink.on_backfill)
+    client.start_mqtt()
+
+    # 等客户端连上并完成订阅，再开始上报
+    deadline = time.monotonic() + 10
+    while not client.connected and time.monotonic() < deadline:
+        Clock.tick()
+    if not client.connected:
+        raise RuntimeError("客户端未能连接本机MQTT服务器替身")
+    time.sleep(0.2)
+
+    stop_event = threading.Event()
+    devices = [SimulatedDevice(i, "127.0.0.1", broker.port, args, stop_event,
+                               backfill_request_topic(f"{DEVICE_ID_PREFIX}-{i}" if args.topic == "device" else ""))
+               for i in range(args.devices)]
+    start = time.monotonic()
+    for device in devices:
+        device.start()
+    next_kick = start + args.kick_every if args.kick_every else None
+    next_report = start + 5
+    end = start + args.duration
+    while time.monotonic() < end:
+        Clock.tick()  # 按maxfps节奏模拟主线程的帧
+        now = time.monotonic()
+        if next_kick is not None and now >= next_kick:
+            broker.kick(CLIENT_ID_PREFIX)
+            next_kick += args.kick_every
+        if now >= next_report:
+            stats = client.get_ingest_stats()
+            print(f"  {now - start:5.1f}s | 已入库 {sink.rows_submitted} 条 | 队列深度 {stats['depth']} | "
+                  f"丢弃 {stats['total_dropped']} | 连接 {client.state}")
+            next_report += 5
+    stop_event.set()
+    for device in devices:
+        device.join(2)
+    send_elapsed = time.monotonic() - start
+
+    # 处理完已到达的消息
+    deadline = time.monotonic() + DRAIN_TIMEOUT_S
+    while time.monotonic() < deadline:
+        Clock.tick()
+        if client.ingest_queue.get_stats()["total_put"] >= broker.messages_out and not len(client.ingest_queue):
+            break
+    client.stop_mqtt()
+    broker.stop()
+    storage.flush()
+
+    ingest = client.get_ingest_stats()
+    storage_stats = storage.get_stats()
+    # 实际入库的数据条数（sqlite后端按主键去重，补传与实时数据重叠的部分只算一次）
+    timestamped = args.topic == "device" and args.format.endswith("_batch")
+    rows_stored = len(storage.query_range(0, LATEST_TS_UPPER_MS)) if timestamped else None
+    storage.close()
+    messages_sent = sum(d.messages_sent for d in devices)
+    samples_sent = sum(d.samples_sent for d in devices)
+    samples_generated = sum(d.samples_generated for d in devices)
+    broker_stats = broker.get_stats()
+    return {
+        "config": vars(args),
+        "duration_s": send_elapsed,
+        "messages_sent": messages_sent,
+        "samples_sent": samples_sent,
+        "malformed_sent": sum(d.malformed_sent for d in devices),
+        "device_disconnects": sum(d.disconnects for d in devices),
+        "device_send_failures": sum(d.send_failures for d in devices),
+        "broker": broker_stats,
+        "ingest": ingest,
+        "connection": client.get_connection_stats(),
+        "frames_with_data": sink.frames,
+        "bad_messages": sink.bad_messages,
+        "rows_submitted": sink.rows_submitted,
+        "rows_backfilled": sink.rows_backfilled,
+        "rows_written": storage_stats.get("total_rows_written"),
+        "rows_failed": storage_stats.get("total_rows_failed", 0),
+        "rows_stored": rows_stored,
+        "samples_generated": samples_generated,
+        "backfill_requests": sum(d.backfill_requests for d in devices),
+        "samples_backfilled": sum(d.samples_backfilled for d in devices),
+        "sent_msgs_per_s": messages_sent / send_elapsed,
+        "sustained_msgs_per_s": ingest["total_drained"] / send_elapsed,
+        "sustained_rows_per_s": sink.rows_submitted / send_elapsed,
+        # 丢失：服务器没有转发（客户端断线且无持久会话）+ 接收队列丢弃/覆盖 + 发出但最终未入库的有效数据
+        "messages_lost_offline": broker_stats["messages_unrouted"],
+        "messages_dropped_queue": ingest["total_dropped"] + ingest["total_coalesced"],
+        "samples_lost": samples_sent - sink.rows_submitted,
+        # 采到（含设备断线期间）但库里没有的数据；只有按设备分主题且带设备时间戳时才能逐条对上
+        "samples_missing": samples_generated - rows_stored if timestamped else None,
+        "latency": tracer.get_stats() if args.trace else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端接收压测（本机MQTT服务器替身 + 模拟设备）")
+    parser.add_argument("--devices", type=int, default=10, help="模拟设备数")
+    parser.add_argument("--rate", type=float, default=10.0, help="每台设备每秒上报条数")
+    parser.add_argument("--duration", type=float, default=30.0, help="上报持续秒数")
+    parser.add_argument("--topic", choices=("legacy", "device"), default="legacy",
+                        help="legacy：全部发到esp32/sensor；device：发到esp32/<设备ID>/sensor")
+    parser.add_argument("--format", choices=PAYLOAD_FORMATS, default="json", help="消息格式")
+    parser.add_argument("--batch-size", type=int, default=10, help="*_batch格式每条消息的数据条数")
+    parser.add_argument("--burst-every", type=float, default=0, help="每台设备每隔N秒突发一次（0为不突发）")
+    parser.add_argument("--burst-size", type=int, default=100, help="每次突发的消息条数")
+    parser.add_argument("--malformed", type=float, default=0.0, help="格式错误消息的比例（0~1）")
+    parser.add_argument("--device-disconnect-every", type=float, default=0,
+                        help="每台设备平均每隔N秒掉线一次（0为不掉线）")
+    parser.add_argument("--kick-every", type=float, default=0, help="每隔N秒强制断开被测客户端（0为不断开）")
+    parser.add_argument("--clean-session", action="store_true",
+                        help="被测客户端不使用持久会话（默认与APP相同：固定client_id + 持久会话）")
+    parser.add_argument("--backfill", action="store_true",
+                        help="客户端重连后请求补传，设备补发断线期间缓存的数据（需--topic device和带时间戳的批量格式）")
+    parser.add_argument("--ingest-maxlen", type=int, default=DEFAULT_INGEST_MAXLEN, help="客户端接收队列长度")
+    parser.add_argument("--ingest-policy", choices=(POLICY_DROP_OLDEST, POLICY_COALESCE_LATEST),
+                        default=POLICY_DROP_OLDEST, help="接收队列满时的策略")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="sqlite", help="存储后端")
+    parser.add_argument("--port", type=int, default=0, help="服务器替身端口（0为自动分配）")
+    parser.add_argument("--trace", action="store_true", help="开启端到端延迟追踪（界面更新段为批量回调耗时）")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", default="bench_ingest_results.json", help="结果JSON文件")
+    parser.add_argument("--work-dir", help="数据文件目录（默认临时目录，测完删除）")
+    args = parser.parse_args()
+    if args.backfill and (args.topic != "device" or args.format not in ("json_batch", "binary_batch")):
+        parser.error("--backfill需要--topic device和json_batch/binary_batch格式（补传按设备时间戳去重）")
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_ingest_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        print(f"{args.devices}台设备 × {args.rate}条/秒，{args.duration}秒，格式{args.format}，主题{args.topic}")
+        result = run(args, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"发送 {result['messages_sent']} 条消息（{result['sent_msgs_per_s']:.0f}/秒，格式错误 {result['malformed_sent']}）"
+          f" | 持续接收 {result['sustained_msgs_per_s']:.0f} 条消息/秒，入库 {result['sustained_rows_per_s']:.0f} 行/秒")
+    print(f"丢失：客户端离线 {result['messages_lost_offline']} 条 | 接收队列丢弃 {result['messages_dropped_queue']} 条"
+          f" | 有效数据未入库 {result['samples_lost']} 条 | 客户端重连 {result['connection']['total_reconnects']} 次")
+    if args.backfill:
+        print(f"补传：请求 {result['backfill_requests']} 次 | 设备补发 {result['samples_backfilled']} 条"
+              f" | 补传入库 {result['rows_backfilled']} 条 | 采到但未入库 {result['samples_missing']} 条")
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "result": result,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.trace:
+        print(get_latency_tracer().format_stats())
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_payload.py：传感器消息格式微基准（JSON vs 二进制）
+# 对比每条消息的解码耗时和传输字节数
+# 用法：
+#   python benchmarks/bench_payload.py
+#   python benchmarks/bench_payload.py --samples 1,10,100 --output bench_payload_results.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sensor_payload import decode_sensor_payload, encode_binary  # noqa: E402
+
+DEFAULT_SAMPLES = (1, 10, 100)
+BASE_TS_MS = 1767225600000
+
+
+def make_readings(count):
+    """合成读数 (ts, do, ph, temp)，10Hz采样"""
+    return [(BASE_TS_MS + i * 100, 7.0 + i % 7 * 0.13, 7.1 + i % 5 * 0.07, 25.0 + i % 11 * 0.21)
+            for i in range(count)]
+
+
+def make_payloads(count):
+    """同一组读数的各种编码：{名称: payload字节}"""
+    readings = make_readings(count)
+    payloads = {}
+    if count == 1:
+        _, do, ph, temp = readings[0]
+        # 现有ESP32固件的单条JSON格式
+        payloads["json"] = json.dumps({"do": round(do, 2), "ph": round(ph, 2), "temp": round(temp, 2)}).encode()
+        payloads["binary"] = encode_binary([(do, ph, temp)])
+    payloads["json_ts"] = json.dumps([{"ts": ts, "do": round(do, 2), "ph": round(ph, 2), "temp": round(temp, 2)}
+                                      for ts, do, ph, temp in readings]).encode()
+    payloads["binary_ts"] = encode_binary(readings, BASE_TS_MS)
+    return payloads
+
+
+def bench(payload, number):
+    """每条消息平均解码耗时（微秒），取5轮中最快一轮"""
+    timer = timeit.Timer(lambda: decode_sensor_payload(payload))
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器消息格式微基准")
+    parser.add_argument("--samples", default=",".join(str(n) for n in DEFAULT_SAMPLES), help="每条消息的数据条数，逗号分隔")
+    parser.add_argument("--number", type=int, default=20000, help="每轮解码次数（按数据条数自动缩减）")
+    parser.add_argument("--output", default="bench_payload_results.json", help="结果JSON文件")
+    args = parser.parse_args()
+
+    results = []
+    for count in (int(n) for n in args.samples.split(",") if n):
+        number = max(100, args.number // count)
+        for name, payload in make_payloads(count).items():
+            decode_us = bench(payload, number)
+            results.append({
+                "format": name,
+                "samples": count,
+                "bytes": len(payload),
+                "bytes_per_sample": len(payload) / count,
+                "decode_us": decode_us,
+                "decode_us_per_sample": decode_us / count,
+            })
+            print(f"{name:10s} {count:4d}条 | {len(payload):6d}字节（{len(payload) / count:.1f}/条） | "
+                  f"解码 {decode_us:8.2f}us（{decode_us / count:.3f}us/条）")
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
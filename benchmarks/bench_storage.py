@@ -0,0 +1,248 @@
+# benchmarks/bench_storage.py：存储后端基准测试（PC上无界面运行，不依赖Kivy）
+# 用法：
+#   python benchmarks/bench_storage.py                              # 1万/100万/1000万行，全部后端
+#   python benchmarks/bench_storage.py --sizes 10000 --backends sqlite,binary
+#   python benchmarks/bench_storage.py --compare old.json           # 与上一版本结果对比
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import BACKENDS, create_backend, day_range_ms, RetentionPolicy  # noqa: E402
+
+DEFAULT_SIZES = (10_000, 1_000_000, 10_000_000)
+# 模拟设备；数据均匀分布在最近N天内（数据量越大采样越密），保证清理和按天查询都有实际工作量
+DEVICES = ("", "pond-1", "pond-2", "pond-3")
+DATA_SPAN_DAYS = 7
+# 单条提交代价与总行数无关，只测前N条，避免1000万次单条事务跑几个小时
+DEFAULT_SINGLE_ROWS = 10_000
+# 内存后端按Python对象保存，超过该行数跳过
+DEFAULT_MEMORY_MAX_ROWS = 1_000_000
+# 等待异步清理完成的最长时间
+RETENTION_TIMEOUT_S = 600
+
+
+def generate_rows(rows, end_ms):
+    """生成合成数据 (device_id, ts, do, ph, temp)，按时间顺序覆盖 end_ms 之前的 DATA_SPAN_DAYS 天"""
+    per_device = math.ceil(rows / len(DEVICES))
+    span_ms = DATA_SPAN_DAYS * 24 * 3600 * 1000
+    interval_ms = max(1, span_ms // per_device)
+    start_ms = end_ms - per_device * interval_ms
+    for i in range(rows):
+        step, device_index = divmod(i, len(DEVICES))
+        yield (DEVICES[device_index], start_ms + step * interval_ms,
+               7.0 + math.sin(i / 500.0), 7.2 + 0.3 * math.cos(i / 700.0), 25.0 + (i % 100) / 50.0)
+
+
+def file_bytes(path):
+    """数据文件及其附属文件（WAL/设备表）的总大小"""
+    if path is None:
+        return None
+    total = 0
+    for suffix in ("", "-wal", "-shm", ".devices"):
+        if os.path.exists(path + suffix):
+            total += os.path.getsize(path + suffix)
+    return total
+
+
+def bench_insert(backend_name, path, rows, end_ms, flush_rows=None):
+    """写入rows条数据，返回 (后端实例, 每秒行数)；计时包含最后一次提交，只计实际提交成功的行
+    flush_rows=1 即每条一次提交；None 使用后端默认写缓冲参数（内存后端没有写缓冲）
+    """
+    kwargs = {"flush_rows": flush_rows} if flush_rows is not None and backend_name != "memory" else {}
+    backend = create_backend(backend_name, path, **kwargs)
+    backend.start()
+    start = time.perf_counter()
+    for device_id, ts_ms, do, ph, temp in generate_rows(rows, end_ms):
+        backend.insert_record(do, ph, temp, ts_ms=ts_ms, device_id=device_id)
+    backend.flush(timeout=RETENTION_TIMEOUT_S)
+    elapsed = time.perf_counter() - start
+    written = backend.get_stats()["total_rows_written"]
+    return backend, written / elapsed if elapsed else None
+
+
+def bench_legacy_single(path, rows, end_ms):
+    """旧版写入方式的参照：每条数据 connect -> INSERT -> commit -> close，再单独连接执行DELETE NOT IN"""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            record_date TEXT, record_time TEXT,
+            do_value REAL, ph_value REAL, temp_value REAL
+        )
+    """)
+    conn.commit()
+    conn.close()
+    start = time.perf_counter()
+    for _, ts_ms, do, ph, temp in generate_rows(rows, end_ms):
+        now = datetime.datetime.fromtimestamp(ts_ms / 1000.0)
+        record_date = now.strftime("%Y-%m-%d")
+        conn = sqlite3.connect(path)
+        conn.execute("""
+            INSERT INTO sensor_records (record_date, record_time, do_value, ph_value, temp_value)
+            VALUES (?, ?, ?, ?, ?)
+        """, (record_date, now.strftime("%Y-%m-%d %H:%M:%S"), do, ph, temp))
+        conn.commit()
+        conn.close()
+        yesterday = (now - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM sensor_records WHERE record_date NOT IN (?, ?)", (record_date, yesterday))
+        conn.commit()
+        conn.close()
+    elapsed = time.perf_counter() - start
+    return rows / elapsed if elapsed else None
+
+
+def bench_day_query(backend, end_ms):
+    """查询最新一天：首页延迟（历史页面打开时的代价）和逐页读完整天的耗时"""
+    day = datetime.datetime.fromtimestamp(end_ms / 1000.0).date()
+    start_ms, stop_ms = day_range_ms(day)
+    start = time.perf_counter()
+    backend.query_page(start_ms, stop_ms)
+    first_page_ms = (time.perf_counter() - start) * 1000.0
+    start = time.perf_counter()
+    day_rows = sum(len(page) for page in backend.iter_pages(start_ms, stop_ms, page_size=1000))
+    full_day_ms = (time.perf_counter() - start) * 1000.0
+    return first_page_ms, full_day_ms, day_rows
+
+
+def bench_retention(backend, rows, end_ms):
+    """按默认保留策略（今日+昨日）清理，计时到清理完成"""
+    cutoff_ms = RetentionPolicy().cutoff_ms(datetime.datetime.fromtimestamp(end_ms / 1000.0).date())
+    expected = sum(1 for row in generate_rows(rows, end_ms) if row[1] < cutoff_ms)
+    before = backend.get_stats()["total_rows_expired"]
+    start = time.perf_counter()
+    backend.clean_expired(cutoff_ms)
+    # SQLite后端在写线程分块异步清理、二进制后端在维护线程压缩，轮询统计直到删完
+    deadline = time.monotonic() + RETENTION_TIMEOUT_S
+    while backend.get_stats()["total_rows_expired"] - before < expected and time.monotonic() < deadline:
+        time.sleep(0.001)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    return elapsed_ms, backend.get_stats()["total_rows_expired"] - before
+
+
+def run_case(backend_name, rows, work_dir, single_rows):
+    """一个后端 + 一个数据量的全部测试"""
+    end_ms = int(time.time() * 1000)
+    filename = BACKENDS[backend_name].default_filename
+    result = {"backend": backend_name, "rows": rows}
+
+    # 单条提交（只测前single_rows条）
+    single_count = min(rows, single_rows)
+    single_path = os.path.join(work_dir, f"single_{filename}") if filename else None
+    backend, result["insert_single_rows_per_s"] = bench_insert(backend_name, single_path, single_count, end_ms, 1)
+    backend.close()
+    result["single_rows_measured"] = single_count
+
+    # 批量提交（默认写缓冲参数），之后在同一份数据上测查询、文件大小和清理
+    path = os.path.join(work_dir, filename) if filename else None
+    backend, result["insert_batched_rows_per_s"] = bench_insert(backend_name, path, rows, end_ms)
+    first_page_ms, full_day_ms, day_rows = bench_day_query(backend, end_ms)
+    result["day_query_first_page_ms"] = first_page_ms
+    result["day_query_full_ms"] = full_day_ms
+    result["day_rows"] = day_rows
+    result["file_bytes"] = file_bytes(path)
+    result["retention_ms"], result["rows_expired"] = bench_retention(backend, rows, end_ms)
+    backend.close()
+    result["file_bytes_after_retention"] = file_bytes(path)
+    return result
+
+
+def git_revision():
+    """当前代码版本（便于对比不同版本的结果）"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(old_path, results):
+    """打印与旧结果的对比（吞吐越大越好，耗时/文件越小越好）"""
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["backend"], r["rows"]): r for r in json.load(f)["results"]}
+    for result in results:
+        previous = old.get((result["backend"], result["rows"]))
+        if previous is None:
+            continue
+        print(f"--- {result['backend']} {result['rows']}行 对比 {old_path}")
+        for key, value in result.items():
+            if not isinstance(value, (int, float)) or key in ("rows", "single_rows_measured"):
+                continue
+            before = previous.get(key)
+            if before:
+                print(f"  {key}: {before:.4g} -> {value:.4g}（{(value / before - 1) * 100:+.1f}%）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器存储后端基准测试")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES), help="数据量，逗号分隔")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="后端名称，逗号分隔")
+    parser.add_argument("--single-rows", type=int, default=DEFAULT_SINGLE_ROWS, help="单条提交测试的行数上限")
+    parser.add_argument("--memory-max-rows", type=int, default=DEFAULT_MEMORY_MAX_ROWS, help="内存后端的最大数据量")
+    parser.add_argument("--legacy", action="store_true", help="同时测旧版逐条connect/commit/close写入作参照")
+    parser.add_argument("--output", default="bench_storage_results.json", help="结果JSON文件")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    parser.add_argument("--work-dir", help="数据文件目录（默认临时目录，测完删除）")
+    args = parser.parse_args()
+
+    sizes = [int(n) for n in args.sizes.split(",") if n]
+    backends = [name for name in args.backends.split(",") if name]
+    work_root = args.work_dir or tempfile.mkdtemp(prefix="bench_storage_")
+    os.makedirs(work_root, exist_ok=True)
+    results = []
+    try:
+        if args.legacy:
+            legacy_rows = min(args.single_rows, min(sizes))
+            legacy_path = os.path.join(work_root, "legacy_sensor_data.db")
+            rate = bench_legacy_single(legacy_path, legacy_rows, int(time.time() * 1000))
+            results.append({"backend": "legacy", "rows": legacy_rows, "insert_single_rows_per_s": rate,
+                            "file_bytes": file_bytes(legacy_path)})
+            print(f"legacy {legacy_rows}行：单条写入 {rate:.0f} 行/秒")
+        for rows in sizes:
+            for backend_name in backends:
+                if backend_name == "memory" and rows > args.memory_max_rows:
+                    print(f"跳过 memory {rows}行（超过 --memory-max-rows）")
+                    continue
+                case_dir = os.path.join(work_root, f"{backend_name}_{rows}")
+                os.makedirs(case_dir, exist_ok=True)
+                result = run_case(backend_name, rows, case_dir, args.single_rows)
+                shutil.rmtree(case_dir, ignore_errors=True)
+                results.append(result)
+                print(f"{backend_name} {rows}行：单条 {result['insert_single_rows_per_s']:.0f} 行/秒 | "
+                      f"批量 {result['insert_batched_rows_per_s']:.0f} 行/秒 | "
+                      f"日查询首页 {result['day_query_first_page_ms']:.2f}ms / 整天 {result['day_query_full_ms']:.1f}ms"
+                      f"（{result['day_rows']}行） | 清理 {result['retention_ms']:.1f}ms | 文件 {result['file_bytes']}")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
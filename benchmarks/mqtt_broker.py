@@ -0,0 +1,383 @@
+# benchmarks/mqtt_broker.py：本机MQTT服务器替身（MQTT 3.1.1最小子集，纯标准库，无TLS）
+# 支持：CONNECT/CONNACK、SUBSCRIBE(+ / # 通配)/SUBACK、UNSUBSCRIBE、PUBLISH QoS0/1(PUBACK)、PINGREQ、DISCONNECT
+# 持久会话（clean_session=0）：断线期间保留订阅并缓存消息，重连后补发（与EMQX默认一样QoS0消息也缓存）
+# 用于压测时替代云端EMQX：
+#   broker = LocalBroker(); broker.start(); ...; broker.stop()
+#   python benchmarks/mqtt_broker.py --port 1883      # 单独运行
+import argparse
+import collections
+import socket
+import struct
+import threading
+import time
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+_UINT16 = struct.Struct("!H")
+# 每个离线持久会话最多缓存的消息数（超出丢弃最旧的）
+DEFAULT_MAX_QUEUED = 10000
+
+
+# ========== 报文编解码（压测设备模拟器共用） ==========
+def encode_remaining_length(length):
+    """剩余长度（变长编码）"""
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(text):
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    return _UINT16.pack(len(data)) + data
+
+
+def encode_packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + encode_remaining_length(len(body)) + body
+
+
+def encode_connect(client_id, keepalive=60, clean_session=True, username=None, password=None):
+    flags = 0x02 if clean_session else 0
+    payload = encode_string(client_id)
+    if username is not None:
+        flags |= 0x80
+        payload += encode_string(username)
+    if password is not None:
+        flags |= 0x40
+        payload += encode_string(password)
+    body = encode_string("MQTT") + bytes([4, flags]) + _UINT16.pack(keepalive) + payload
+    return encode_packet(CONNECT, 0, body)
+
+
+def encode_publish(topic, payload, qos=0, packet_id=None, dup=False):
+    body = encode_string(topic)
+    if qos:
+        body += _UINT16.pack(packet_id)
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return encode_packet(PUBLISH, (0x08 if dup else 0) | (qos << 1), body + payload)
+
+
+def read_packet(sock):
+    """读取一个完整报文，返回 (类型, 标志, 报文体)；连接关闭时返回None"""
+    header = _recv_exact(sock, 1)
+    if header is None:
+        return None
+    multiplier, length = 1, 0
+    while True:
+        byte = _recv_exact(sock, 1)
+        if byte is None:
+            return None
+        length += (byte[0] & 0x7F) * multiplier
+        if not byte[0] & 0x80:
+            break
+        multiplier *= 128
+    body = _recv_exact(sock, length) if length else b""
+    if body is None:
+        return None
+    return header[0] >> 4, header[0] & 0x0F, body
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        try:
+            chunk = sock.recv(size)
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_string(body, offset):
+    length = _UINT16.unpack_from(body, offset)[0]
+    offset += 2
+    return body[offset:offset + length].decode("utf-8"), offset + length
+
+
+def topic_matches(pattern, topic):
+    """主题是否匹配订阅（+ 单层，# 多层）"""
+    pattern_levels = pattern.split("/")
+    levels = topic.split("/")
+    for index, pattern_level in enumerate(pattern_levels):
+        if pattern_level == "#":
+            return True
+        if index >= len(levels) or (pattern_level != "+" and pattern_level != levels[index]):
+            return False
+    return len(pattern_levels) == len(levels)
+
+
+# ========== 服务器 ==========
+class _Session:
+    """一个客户端连接"""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.client_id = None
+        self.clean_session = True
+        self.subscriptions = {}  # 订阅主题 -> QoS
+        self.send_lock = threading.Lock()
+        self.next_packet_id = 0
+        self.alive = True
+
+    def send(self, data):
+        with self.send_lock:
+            try:
+                self.sock.sendall(data)
+                return True
+            except OSError:
+                self.alive = False
+                return False
+
+    def packet_id(self):
+        self.next_packet_id = self.next_packet_id % 0xFFFF + 1
+        return self.next_packet_id
+
+    def close(self):
+        self.alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class LocalBroker:
+    """本机MQTT服务器替身：每个连接一个线程，按订阅转发；持久会话离线期间的消息缓存到重连"""
+
+    def __init__(self, host="127.0.0.1", port=0, max_queued=DEFAULT_MAX_QUEUED):
+        self.host = host
+        self.port = port
+        self.max_queued = max_queued
+        self._server = None
+        self._thread = None
+        self._sessions = []
+        # 离线持久会话：client_id -> (订阅字典, 缓存消息deque[(主题, payload, QoS)])
+        self._offline = {}
+        self._lock = threading.Lock()
+        self._running = False
+        # 统计
+        self.messages_in = 0         # 收到的PUBLISH
+        self.messages_out = 0        # 转发给订阅者的PUBLISH（含重连后补发）
+        self.messages_queued = 0     # 为离线持久会话缓存的PUBLISH
+        self.messages_unrouted = 0   # 没有任何订阅者的PUBLISH（订阅方离线且非持久会话时即丢失）
+        self.queue_overflow = 0      # 离线缓存满被丢弃的PUBLISH
+        self.connections = 0
+        self.kicked = 0
+
+    def start(self):
+        """开始监听（port=0时自动分配端口，启动后读self.port）"""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(128)
+        self.port = self._server.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, name="LocalBroker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        try:
+            self._server.close()
+        except OSError:
+            pass
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.close()
+
+    def kick(self, client_id_prefix=""):
+        """强制断开client_id以指定前缀开头的连接（模拟网络中断），返回断开数"""
+        with self._lock:
+            targets = [s for s in self._sessions if s.client_id and s.client_id.startswith(client_id_prefix)]
+        for session in targets:
+            session.close()
+        with self._lock:
+            self.kicked += len(targets)
+        return len(targets)
+
+    def get_stats(self):
+        with self._lock:
+            clients = len(self._sessions)
+        return {
+            "clients": clients,
+            "connections": self.connections,
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "messages_queued": self.messages_queued,
+            "messages_unrouted": self.messages_unrouted,
+            "queue_overflow": self.queue_overflow,
+            "kicked": self.kicked,
+        }
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, address = self._server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(sock, address)
+            with self._lock:
+                self._sessions.append(session)
+                self.connections += 1
+            threading.Thread(target=self._session_loop, args=(session,), daemon=True).start()
+
+    def _session_loop(self, session):
+        try:
+            while session.alive:
+                packet = read_packet(session.sock)
+                if packet is None:
+                    break
+                if not self._handle(session, *packet):
+                    break
+        except (ValueError, struct.error, UnicodeDecodeError):
+            pass  # 报文格式错误：直接断开
+        finally:
+            session.close()
+            with self._lock:
+                if session in self._sessions:
+                    self._sessions.remove(session)
+                    # 持久会话：保留订阅，开始缓存消息（已被同ID新连接接管的不保留）
+                    if session.client_id and not session.clean_session:
+                        self._offline[session.client_id] = (
+                            dict(session.subscriptions), collections.deque(maxlen=self.max_queued))
+
+    def _handle(self, session, packet_type, flags, body):
+        """处理一个报文，返回False表示断开连接"""
+        if packet_type == CONNECT:
+            return self._connect(session, body)
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, offset = _read_string(body, 0)
+            if qos:
+                packet_id = _UINT16.unpack_from(body, offset)[0]
+                offset += 2
+                session.send(encode_packet(PUBACK, 0, _UINT16.pack(packet_id)))
+            self._route(topic, body[offset:], qos)
+            return True
+        if packet_type == SUBSCRIBE:
+            packet_id = _UINT16.unpack_from(body, 0)[0]
+            offset = 2
+            granted = bytearray()
+            while offset < len(body):
+                pattern, offset = _read_string(body, offset)
+                qos = min(body[offset] & 0x03, 1)
+                offset += 1
+                session.subscriptions[pattern] = qos
+                granted.append(qos)
+            return session.send(encode_packet(SUBACK, 0, _UINT16.pack(packet_id) + bytes(granted)))
+        if packet_type == UNSUBSCRIBE:
+            packet_id = _UINT16.unpack_from(body, 0)[0]
+            offset = 2
+            while offset < len(body):
+                pattern, offset = _read_string(body, offset)
+                session.subscriptions.pop(pattern, None)
+            return session.send(encode_packet(UNSUBACK, 0, _UINT16.pack(packet_id)))
+        if packet_type == PINGREQ:
+            return session.send(encode_packet(PINGRESP, 0, b""))
+        if packet_type == DISCONNECT:
+            return False
+        # PUBACK等：订阅方的确认不需要处理
+        return True
+
+    def _connect(self, session, body):
+        """CONNECT：同ID的旧连接被接管；持久会话恢复订阅并补发离线期间缓存的消息"""
+        _, offset = _read_string(body, 0)
+        connect_flags = body[offset + 1]
+        session.client_id, _ = _read_string(body, offset + 4)
+        session.clean_session = bool(connect_flags & 0x02)
+        with self._lock:
+            previous = [s for s in self._sessions if s is not session and s.client_id == session.client_id]
+            stored = self._offline.pop(session.client_id, None)
+        for old in previous:
+            old.client_id = None  # 不再按持久会话保存
+            old.close()
+        queued = ()
+        if stored is not None and not session.clean_session:
+            session.subscriptions, queued = stored
+        session_present = 1 if stored is not None and not session.clean_session else 0
+        if not session.send(encode_packet(CONNACK, 0, bytes([session_present, 0]))):
+            return False
+        for topic, payload, qos in queued:
+            packet_id = session.packet_id() if qos else None
+            if not session.send(encode_publish(topic, payload, qos, packet_id)):
+                return False
+        with self._lock:
+            self.messages_out += len(queued)
+        return True
+
+    @staticmethod
+    def _granted_qos(subscriptions, topic):
+        """按订阅表求该主题的最高QoS，没有匹配的订阅时返回None"""
+        granted = None
+        for pattern, sub_qos in subscriptions.items():
+            if topic_matches(pattern, topic):
+                granted = sub_qos if granted is None else max(granted, sub_qos)
+        return granted
+
+    def _route(self, topic, payload, qos):
+        with self._lock:
+            self.messages_in += 1
+            sessions = list(self._sessions)
+            # 离线持久会话：匹配的消息进缓存（QoS0也缓存）
+            queued = 0
+            for subscriptions, pending in self._offline.values():
+                granted = self._granted_qos(subscriptions, topic)
+                if granted is None:
+                    continue
+                if len(pending) == pending.maxlen:
+                    self.queue_overflow += 1
+                pending.append((topic, payload, min(granted, qos)))
+                queued += 1
+            self.messages_queued += queued
+        delivered = 0
+        for session in sessions:
+            granted = self._granted_qos(session.subscriptions, topic)
+            if granted is None or not session.alive:
+                continue
+            out_qos = min(granted, qos)
+            packet_id = session.packet_id() if out_qos else None
+            if session.send(encode_publish(topic, payload, out_qos, packet_id)):
+                delivered += 1
+        with self._lock:
+            self.messages_out += delivered
+            if not delivered and not queued:
+                self.messages_unrouted += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本机MQTT服务器替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = LocalBroker(args.host, args.port).start()
+    print(f"MQTT服务器替身已启动：{broker.host}:{broker.port}（Ctrl+C退出）")
+    try:
+        while True:
+            time.sleep(5)
+            print(broker.get_stats())
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -18,7 +18,7 @@ android.minapi = 21
 android.ndk = 24b
 android.ndk_api = 21
 android.sdk = 31
-exclude_patterns = **/test/*, **/tests/*
+exclude_patterns = **/test/*, **/tests/*, **/benchmarks/*
 android.gradle_plugin = 7.2.0
 p4a.gradle_dependencies = gradle:7.2.0
 p4a.bootstrap = sdl2
@@ -0,0 +1,80 @@
+# device_registry.py：多设备状态表（每台ESP32探头的最新读数和在线情况）
+import threading
+import time
+
+# 超过该时间没有收到数据即视为离线（探头通常每秒上报一次）
+DEFAULT_FRESH_TIMEOUT_S = 30
+
+
+class DeviceState:
+    """单台设备的状态：最新读数、最新数据时间戳、最后一次收到数据的时间、累计消息数"""
+
+    __slots__ = ("device_id", "values", "latest_ts", "last_seen_ms", "last_seen_monotonic", "message_count")
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.values = {}
+        self.latest_ts = None  # 收到的最新一条数据的时间戳（设备时间，未带时间戳时为接收时刻）
+        self.last_seen_ms = None
+        self.last_seen_monotonic = None
+        self.message_count = 0
+
+    def age_s(self, now=None):
+        """距最后一次收到数据的秒数，从未收到时返回None"""
+        if self.last_seen_monotonic is None:
+            return None
+        return (now if now is not None else time.monotonic()) - self.last_seen_monotonic
+
+
+class DeviceRegistry:
+    """设备ID -> DeviceState；网络线程写、主线程读，全部操作O(1)（列表/统计按设备数）"""
+
+    def __init__(self, fresh_timeout_s=DEFAULT_FRESH_TIMEOUT_S):
+        self.fresh_timeout_s = fresh_timeout_s
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    def update(self, device_id, values, ts_ms=None):
+        """记录一台设备的新读数（values为解析后的数据字典，缺少的项沿用旧值）
+        ts_ms为这批数据最新一条的时间戳（None表示未带时间戳，取接收时刻），latest_ts只前进不后退
+        """
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                state = self._devices[device_id] = DeviceState(device_id)
+            if isinstance(values, dict):
+                state.values.update(values)
+            state.last_seen_ms = int(time.time() * 1000)
+            ts_ms = state.last_seen_ms if ts_ms is None else ts_ms
+            if state.latest_ts is None or ts_ms > state.latest_ts:
+                state.latest_ts = ts_ms
+            state.last_seen_monotonic = time.monotonic()
+            state.message_count += 1
+            return state
+
+    def get(self, device_id):
+        """单台设备的状态，未知设备返回None"""
+        with self._lock:
+            return self._devices.get(device_id)
+
+    def is_fresh(self, device_id, now=None):
+        """设备是否在线（fresh_timeout_s内收到过数据）"""
+        state = self.get(device_id)
+        if state is None:
+            return False
+        age = state.age_s(now)
+        return age is not None and age <= self.fresh_timeout_s
+
+    def devices(self):
+        """全部设备状态（按设备ID排序）"""
+        with self._lock:
+            return [self._devices[device_id] for device_id in sorted(self._devices)]
+
+    def online_count(self):
+        """在线设备数"""
+        now = time.monotonic()
+        ages = (state.age_s(now) for state in self.devices())
+        return sum(1 for age in ages if age is not None and age <= self.fresh_timeout_s)
+
+    def __len__(self):
+        return len(self._devices)
@@ -1,37 +1,256 @@
 import paho.mqtt.client as mqtt
-from threading import Thread
+from threading import Thread, Lock, Event
+import queue
+from concurrent.futures import Future
 import json
+import random
+import socket
 import time
 import ssl
+import uuid
+from collections import OrderedDict
 from kivy.clock import Clock
+from storage import get_query_executor
+from storage.outbox import CommandOutbox
+from ingest_queue import IngestQueue, DEFAULT_INGEST_MAXLEN, POLICY_DROP_OLDEST
+from device_registry import DeviceRegistry
+from sensor_payload import SensorBatch, decode_sensor_payload, payload_text
+from topic_router import TopicRouter, THREAD_MAIN, THREAD_WORKER
+from latency_trace import get_latency_tracer, STAGE_PARSED, STAGE_DISPATCH
+from log_store import get_log_store, Lazy, SOURCE_MQTT, SOURCE_MQTT_CONN, SOURCE_MQTT_RX
+from event_bus import get_event_bus, EVENT_MQTT_STATUS
+
+# 接收队列条目：(类型, 处理器, 主题, 设备ID, 原始payload, 解码结果/日志文本/错误信息)
+INGEST_MESSAGE = "message"  # 已在网络线程解码，交给主线程处理器
+INGEST_HANDLED = "handled"  # 已在网络线程处理完（worker处理器），只记日志
+INGEST_ERROR = "error"      # 解码失败
+
+# 订阅主题：单设备旧主题的设备ID为空；多设备主题中"+"所在层级即设备ID（esp32/<设备ID>/sensor）
+SENSOR_TOPIC = "esp32/sensor"
+DEVICE_SENSOR_TOPIC = "esp32/+/sensor"
+# 阈值设置：APP发到esp32/threshold（带req_id），设备在esp32/threshold_response回复（带回req_id）
+THRESHOLD_TOPIC = "esp32/threshold"
+THRESHOLD_RESPONSE_TOPIC = "esp32/threshold_response"
+# 补传协议：重连后每台设备第一次上报时，APP向 esp32[/<设备ID>]/backfill/request 发布 {"since": 已入库的最新时间戳}
+# 设备把该时间之后缓存的数据（带ts的批量格式，二进制或JSON，可分多条）发到 esp32[/<设备ID>]/backfill
+BACKFILL_TOPIC = "esp32/backfill"
+DEVICE_BACKFILL_TOPIC = "esp32/+/backfill"
+# 等待设备响应的超时时间（秒）：超时后请求的Future以TimeoutError结束
+REQUEST_TIMEOUT_S = 30
+# 订阅QoS：配合持久会话，断线期间服务器缓存的消息重连后补发
+SUBSCRIBE_QOS = 1
+# 指令最长有效期（秒）：离线积压超过此时长的指令重连后不再发送（几分钟前的开关指令已无意义），Future以TimeoutError结束
+COMMAND_MAX_AGE_S = 300
+# 先于publish()返回到达的确认最多保留几秒（只在发件箱指令发送期间暂存，过期清理，避免mid回绕后误判）
+EARLY_ACK_TTL_S = 5
+# 指令线程任务类型
+_TASK_COMMAND = "command"  # 新指令：入库，在线时立即发送
+_TASK_REPLAY = "replay"    # 连接成功：清理过期指令，重发积压指令
+_TASK_FLUSH = "flush"      # 等待之前提交的任务完成
+# 固定客户端ID保存文件（持久会话按客户端ID识别，每次启动必须相同）
+CLIENT_ID_FILENAME = "mqtt_client_id.txt"
+
+
+# 连接状态机
+STATE_IDLE = "idle"              # 尚未启动
+STATE_CONNECTING = "connecting"  # 正在建立TCP/TLS连接并等待CONNACK
+STATE_CONNECTED = "connected"    # 已连接
+STATE_BACKOFF = "backoff"        # 连接失败/断开，退避等待后重连
+STATE_STOPPED = "stopped"        # 已主动停止，不再重连
+STATE_NAMES = {
+    STATE_IDLE: "未启动",
+    STATE_CONNECTING: "连接中",
+    STATE_CONNECTED: "已连接",
+    STATE_BACKOFF: "等待重连",
+    STATE_STOPPED: "已停止",
+}
+
+# 重连退避：第n次失败后等待 min(上限, 基础 * 2^n) 秒，再在[一半, 全部]之间随机抖动，避免大量客户端同时重连
+RECONNECT_BASE_DELAY_S = 1.0
+RECONNECT_MAX_DELAY_S = 120.0
+# 网络循环单次等待时间（秒）：同时决定stop_mqtt的响应速度
+LOOP_TIMEOUT_S = 1.0
+KEEPALIVE_S = 60
+
+# CONNACK返回码说明
+CONNACK_MESSAGES = {
+    0: "连接成功",
+    1: "协议版本错误",
+    2: "客户端ID无效",
+    3: "服务器不可用",
+    4: "用户名/密码错误",
+    5: "未授权连接",
+    6: "服务器忙",
+    7: "连接超时"
+}
+
+
+def load_client_id(path, prefix="esp32_android"):
+    """读取（首次运行时生成并保存）本机固定的MQTT客户端ID"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            client_id = f.read().strip()
+        if client_id:
+            return client_id
+    except OSError:
+        pass
+    client_id = f"{prefix}_{uuid.uuid4().hex[:12]}"
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(client_id)
+    except OSError as e:
+        print(f"保存MQTT客户端ID失败（本次运行仍可使用）：{e}")
+    return client_id
+
+
+def backfill_request_topic(device_id):
+    """设备的补传请求主题（单设备旧主题的设备ID为空）"""
+    return f"esp32/{device_id}/backfill/request" if device_id else "esp32/backfill/request"
+
+
+def decode_response(device_id, payload, trace=None):
+    """设备响应 -> 字典：JSON对象原样返回，其它JSON值或非JSON文本放在"result"/"text"中（不因格式问题丢弃响应）"""
+    try:
+        response = json.loads(payload)
+    except ValueError:
+        return {"text": payload_text(payload)}
+    return response if isinstance(response, dict) else {"result": response}
+
+
+def backoff_delay(attempt, base=RECONNECT_BASE_DELAY_S, cap=RECONNECT_MAX_DELAY_S, rng=random):
+    """第attempt次（从1开始）连续失败后的等待秒数：指数增长 + 抖动，最长不超过cap"""
+    delay = min(cap, base * (2 ** min(attempt - 1, 30)))
+    return rng.uniform(delay / 2, delay)
+
 
 class Esp32MqttClient:
-    def __init__(self, broker, port, username, password, data_callback):
+    def __init__(self, broker, port, username, password, data_callback,
+                 ingest_maxlen=DEFAULT_INGEST_MAXLEN, ingest_policy=POLICY_DROP_OLDEST, outbox=None, tls=True,
+                 client_id=None, clean_session=False, backfill_since=None, log_telemetry=False,
+                 command_max_age_s=COMMAND_MAX_AGE_S):
         self.broker = broker
         self.port = port
         self.username = username
         self.password = password
+        # data_callback(文本)：连接状态、指令收发等客户端日志的回调（主线程，每帧最多一次，本帧多条以换行连接）
+        # 收到的消息只写入日志存储
         self.data_callback = data_callback
+        self.log_store = get_log_store()
+        self.event_bus = get_event_bus()
+        self.tls = tls  # False：明文TCP（本机压测用的MQTT服务器替身）
+        # 持久会话：固定客户端ID + clean_session=False，服务器在断线期间保留订阅并缓存QoS1消息
+        # 未指定client_id时本进程内固定（跨重启需由调用方传入load_client_id的结果）
+        self.client_id = client_id or f"esp32_android_{uuid.uuid4().hex[:12]}"
+        self.clean_session = clean_session
+        # 补传：backfill_since(设备ID, before_ms) -> 该设备已入库的早于before_ms的最新时间戳（或None），为None时不发补传请求
+        # 本次运行已收到过的设备直接用内存中的最新时间戳，只有启动后第一次上报才在查询线程读库
+        self.backfill_since = backfill_since
+        self.backfill_callback = None
+        self._backfill_requested = set()  # 本次连接已请求过补传的设备
+        self.total_backfill_requests = 0
+        self.total_backfill_samples = 0
+        self.session_present = False
         self.mqtt_client = None
         self.mqtt_thread = None
         self.connected = False
+        # 连接状态机（客户端实例和TLS上下文只创建一次，重连时复用）
+        self.state = STATE_IDLE
+        self._ssl_context = None
+        self._stop_event = Event()
+        self._wake_event = Event()  # 唤醒退避等待（stop_mqtt/reconnect_now）
+        self._connect_called = False
+        self._rng = random.Random()
+        self.connect_attempts = 0        # 当前连续失败次数
+        self.total_connects = 0          # 累计连接成功次数
+        self.total_connect_failures = 0  # 累计连接失败次数
+        self.disconnected_at = None      # 最近一次断开的时刻（monotonic），用于计算重连耗时
+        self.last_reconnect_ms = None    # 最近一次断开 -> 重新连上的耗时
+        self.max_reconnect_ms = None
+        self.total_reconnect_ms = 0.0
+        self.total_reconnects = 0
+        self.next_retry_delay_s = None
         self.parsed_data_callback = None
-        self.latest_data = {}
+        self.parsed_batch_callback = None
+        self.latest_data = {}  # 最近一条传感器数据（任意设备）
+        # 每台设备的最新读数和在线情况
+        self.devices = DeviceRegistry()
+        # 主题路由：具体主题首次出现时匹配一次，之后按字典O(1)分发，设备再多也不影响接收速度
+        self.router = TopicRouter()
+        self._register_default_handlers(log_telemetry)
+        # 等待设备响应的请求：响应主题 -> {req_id: Future}（按发送顺序；只在主线程访问）
+        self._pending_requests = {}
+        # 网络线程收到的消息先进有界队列，由主线程每帧统一处理
+        self.ingest_queue = IngestQueue(ingest_maxlen, ingest_policy)
+        self._drain_event = None
+        # 端到端延迟追踪（默认关闭）
+        self.tracer = get_latency_tracer()
+        # 指令发件箱（CommandOutbox）：先入库再发送，离线指令重连后按顺序重发；None时使用内存发件箱
+        self.outbox = outbox if outbox is not None else CommandOutbox(":memory:")
+        self.command_max_age_s = command_max_age_s
+        # 发件箱读写和指令发送都在指令线程按顺序执行（入库不占主线程，重发和新指令不会重复/乱序）
+        self._command_tasks = queue.Queue()
+        self._command_thread = None
+        self._command_thread_lock = Lock()
+        self.total_commands_expired = 0
+        self._publish_lock = Lock()
+        self._futures = {}      # 指令ID -> Future（收到服务器确认时完成）
+        self._inflight = {}     # 当前客户端实例的消息mid -> 指令ID（已发出、等待确认）
+        self._early_acks = {}   # 确认先于publish()返回到达的mid -> 到达时刻（QoS0可能在publish内同步确认）
+        self._sending = 0       # 正在调用publish()的发件箱指令数（只在此期间暂存未知mid的确认）
 
     def set_parsed_data_callback(self, callback):
+        """注册单条数据回调：每帧只用本帧最新的一条数据（字典）调用一次"""
         self.parsed_data_callback = callback
 
+    def set_parsed_batch_callback(self, callback):
+        """注册批量数据回调：callback(本帧收到的全部[(设备ID, SensorBatch)]，按到达顺序)，每帧最多调用一次
+        格式错误的传感器消息以(设备ID, None)出现，便于UI显示数据异常
+        """
+        self.parsed_batch_callback = callback
+
+    def set_backfill_callback(self, callback):
+        """注册补传数据回调：callback(设备ID, SensorBatch)，在网络线程调用（应只做入库投递等轻量操作）"""
+        self.backfill_callback = callback
+
+    def _register_default_handlers(self, log_telemetry):
+        """注册内置主题：传感器数据（高频，默认不记原始消息日志）、补传数据（网络线程直接入库）、阈值响应"""
+        for topic in (SENSOR_TOPIC, DEVICE_SENSOR_TOPIC):
+            self.router.register(topic, self._dispatch_sensor, self._decode_sensor, THREAD_MAIN, log=log_telemetry)
+        for topic in (BACKFILL_TOPIC, DEVICE_BACKFILL_TOPIC):
+            self.router.register(topic, self._handle_backfill, self._decode_backfill, THREAD_WORKER)
+        self.router.register(THRESHOLD_RESPONSE_TOPIC, self._handle_responses, decode_response)
+
+    def register_topic(self, pattern, handler=None, decoder=None, thread=THREAD_MAIN, log=True):
+        """注册其它主题的处理器（连接前调用，见TopicRouter.register），返回TopicHandler"""
+        return self.router.register(pattern, handler, decoder, thread, log)
+
+    def start_ingest_drain(self):
+        """启动每帧一次的接收队列处理和客户端日志回调（主线程调用，重复调用无副作用）"""
+        if self._drain_event is None:
+            self._drain_event = Clock.schedule_interval(self._drain_ingest, 0)
+            self.event_bus.start()
+            self.event_bus.subscribe(EVENT_MQTT_STATUS, self._deliver_status)
+
+    def get_ingest_stats(self):
+        """接收队列统计（队列深度、丢弃/覆盖条数）"""
+        return self.ingest_queue.get_stats()
+
     def init_mqtt_client(self):
-        """初始化MQTT客户端（核心：修复TLS配置）"""
-        # 1. 创建客户端（增加client_id避免重复连接）
-        self.mqtt_client = mqtt.Client(client_id=f"esp32_android_{int(time.time())}")
+        """初始化MQTT客户端（整个APP生命周期只创建一次，断线重连复用同一实例和TLS上下文）"""
+        if self.mqtt_client is not None:
+            return
+        # 1. 创建客户端（固定client_id + 持久会话，重连后服务器补发断线期间的消息）
+        self.mqtt_client = mqtt.Client(client_id=self.client_id, clean_session=self.clean_session)
         self.mqtt_client.username_pw_set(self.username, self.password)
         
         # 2. 关键修复：跳过TLS证书校验（适配测试服务器）
-        context = ssl.create_default_context()
-        context.check_hostname = False  # 关闭主机名校验
-        context.verify_mode = ssl.CERT_NONE  # 跳过证书验证
-        self.mqtt_client.tls_set_context(context)
+        if self.tls:
+            if self._ssl_context is None:
+                context = ssl.create_default_context()
+                context.check_hostname = False  # 关闭主机名校验
+                context.verify_mode = ssl.CERT_NONE  # 跳过证书验证
+                self._ssl_context = context
+            self.mqtt_client.tls_set_context(self._ssl_context)
         
         # 3. 缩短超时时间（适配手机网络）
         self.mqtt_client.connect_timeout = 10
@@ -40,249 +259,551 @@ class Esp32MqttClient:
         self.mqtt_client.on_connect = self._on_connect
         self.mqtt_client.on_message = self._on_message
         self.mqtt_client.on_disconnect = self._on_disconnect
+        self.mqtt_client.on_publish = self._on_publish
+
+    def _log(self, template, *args, source=SOURCE_MQTT):
+        """写入全局日志存储并发布到事件总线（任意线程；连接状态、指令收发等低频日志），由主线程回调给APP
+        模板+参数分开传：连接类日志按模板合并重复（重连循环只占几行，显示最新的参数和×N）
+        """
+        self.log_store.add(template, *args, source=source)
+        self.event_bus.publish(EVENT_MQTT_STATUS, template.format(*args) if args else template)
+
+    def _deliver_status(self, messages):
+        """事件总线订阅者（主线程）：本帧的客户端日志合并回调一次"""
+        self.data_callback("\n".join(messages))
+
+    def _set_state(self, state):
+        self.state = state
+        self.connected = state == STATE_CONNECTED
 
     def start_mqtt(self):
-        """启动MQTT（增加异常捕获）"""
+        """启动MQTT网络线程（线程内的状态机负责连接、断线重连，永不放弃）"""
         if self.mqtt_thread and self.mqtt_thread.is_alive():
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log("⚠️ MQTT线程已在运行")
-            except ImportError:
-                pass
-            self.data_callback("⚠️ MQTT线程已在运行")
+            self._log("⚠️ MQTT线程已在运行")
             return
         try:
+            self.start_ingest_drain()
             self.init_mqtt_client()
-            self.mqtt_thread = Thread(target=self._mqtt_loop, daemon=True)
+            self._stop_event.clear()
+            self.mqtt_thread = Thread(target=self._mqtt_loop, name="MqttNetwork", daemon=True)
             self.mqtt_thread.start()
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log("📌 MQTT线程启动，开始连接服务器...")
-            except ImportError:
-                pass
-            self.data_callback("📌 MQTT线程启动，开始连接服务器...")
+            self._start_command_thread()
+            self._log("📌 MQTT线程启动，开始连接服务器...")
         except Exception as e:
-            error_msg = f"❌ 启动MQTT失败：{str(e)}"
+            self._log(f"❌ 启动MQTT失败：{str(e)}")
+
+    def stop_mqtt(self, timeout=3):
+        """主动断开并停止重连（先等已提交的指令入库）"""
+        self.flush_commands(timeout)
+        self._stop_event.set()
+        self._wake_event.set()
+        if self.mqtt_client is not None:
             try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
+                self.mqtt_client.disconnect()
+            except Exception:
                 pass
-            self.data_callback(error_msg)
+        if self.mqtt_thread and self.mqtt_thread.is_alive():
+            self.mqtt_thread.join(timeout)
+        self._set_state(STATE_STOPPED)
+
+    def reconnect_now(self):
+        """跳过当前退避等待立即重连（如网络恢复时调用）"""
+        self.connect_attempts = 0
+        self._wake_event.set()
+
+    def get_connection_stats(self):
+        """连接状态和重连耗时统计"""
+        return {
+            "state": self.state,
+            "connect_attempts": self.connect_attempts,
+            "next_retry_delay_s": self.next_retry_delay_s,
+            "total_connects": self.total_connects,
+            "total_connect_failures": self.total_connect_failures,
+            "total_reconnects": self.total_reconnects,
+            "last_reconnect_ms": self.last_reconnect_ms,
+            "max_reconnect_ms": self.max_reconnect_ms,
+            "avg_reconnect_ms": self.total_reconnect_ms / self.total_reconnects if self.total_reconnects else None,
+            "session_present": self.session_present,
+            "total_backfill_requests": self.total_backfill_requests,
+            "total_backfill_samples": self.total_backfill_samples,
+        }
 
     def _on_connect(self, client, userdata, flags, rc):
         """连接回调（详细错误码说明）"""
-        rc_msg = {
-            0: "连接成功",
-            1: "协议版本错误",
-            2: "客户端ID无效",
-            3: "服务器不可用",
-            4: "用户名/密码错误",
-            5: "未授权连接",
-            6: "服务器忙",
-            7: "连接超时"
-        }
         if rc == 0:
-            self.connected = True
-            success_msg = f"✅ MQTT{rc_msg[rc]}，已进入稳定连接状态"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(success_msg)
-            except ImportError:
-                pass
-            self.data_callback(success_msg)
-            # 订阅主题
-            client.subscribe("esp32/sensor", qos=0)
-            client.subscribe("esp32/threshold_response", qos=0)
+            self._set_state(STATE_CONNECTED)
+            self.connect_attempts = 0
+            self.next_retry_delay_s = None
+            self.total_connects += 1
+            # 服务器是否保留了上次的会话（订阅和离线消息）
+            self.session_present = bool(flags.get("session present")) if isinstance(flags, dict) else False
+            self._backfill_requested.clear()
+            # 断线 -> 重新连上的耗时
+            if self.disconnected_at is not None:
+                reconnect_ms = (time.monotonic() - self.disconnected_at) * 1000.0
+                self.disconnected_at = None
+                self.last_reconnect_ms = reconnect_ms
+                self.max_reconnect_ms = max(self.max_reconnect_ms or 0.0, reconnect_ms)
+                self.total_reconnect_ms += reconnect_ms
+                self.total_reconnects += 1
+                self._log("✅ MQTT{}，断线{:.1f}秒后恢复", CONNACK_MESSAGES[rc], reconnect_ms / 1000.0,
+                          source=SOURCE_MQTT_CONN)
+            else:
+                self._log("✅ MQTT{}，已进入稳定连接状态", CONNACK_MESSAGES[rc], source=SOURCE_MQTT_CONN)
+            if self.session_present:
+                self._log("📌 服务器保留了会话，断线期间的消息将补发", source=SOURCE_MQTT_CONN)
+            # 订阅主题（含多设备通配主题）；持久会话下重复订阅无副作用
+            client.subscribe([(pattern, SUBSCRIBE_QOS) for pattern in self.router.patterns()])
+            # 按提交顺序重发离线期间积压的指令（交给指令线程，读发件箱不占网络线程）
+            self._command_tasks.put((_TASK_REPLAY, None))
+            self._start_command_thread()
         else:
-            self.connected = False
-            error_msg = f"❌ MQTT连接失败：{rc_msg.get(rc, f'未知错误({rc})')}"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
+            # 服务器拒绝：网络循环随后返回错误，由状态机退避重连
+            self._set_state(STATE_BACKOFF)
+            self._log("❌ MQTT连接失败：{}", CONNACK_MESSAGES.get(rc, f"未知错误({rc})"), source=SOURCE_MQTT_CONN)
 
     def _on_disconnect(self, client, userdata, rc):
-        """断开连接回调（仅异常断开时重连）"""
-        self.connected = False
-        # 只有 rc != 0 时才是「异常断开」，才触发重连
-        if rc != 0:
-            error_msg = f"⚠️ MQTT意外断开（错误码{rc}），5秒后重连"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
-            # 自动重连（仅异常断开时执行）
-            Clock.schedule_once(lambda dt: self.start_mqtt(), 5)
+        """断开连接回调：只更新状态，重连由网络线程的状态机负责"""
+        if self.disconnected_at is None and self.state == STATE_CONNECTED:
+            self.disconnected_at = time.monotonic()
+        # QoS1是"至少一次"：在途指令回到待发状态，重连后重发（可能重复，但不会丢）
+        with self._publish_lock:
+            self._inflight.clear()
+            self._early_acks.clear()
+        if self._stop_event.is_set() or rc == 0:
+            self._set_state(STATE_STOPPED if self._stop_event.is_set() else STATE_BACKOFF)
+            self._log("📌 MQTT正常断开连接", source=SOURCE_MQTT_CONN)
         else:
-            info_msg = "📌 MQTT正常断开连接，不触发重连"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(info_msg)
-            except ImportError:
-                pass
-            self.data_callback(info_msg)
+            self._set_state(STATE_BACKOFF)
+            self._log("⚠️ MQTT意外断开（错误码{}），准备重连", rc, source=SOURCE_MQTT_CONN)
 
     def _on_message(self, client, userdata, msg):
-        """消息接收回调"""
+        """消息接收回调（网络线程）：按主题路由，在网络线程解码，主线程处理器的结果放入接收队列，不碰UI、不调度Clock"""
+        trace = self.tracer.begin()
+        topic = msg.topic
+        payload = msg.payload
+        topic_handler = None
+        device_id = ""
         try:
-            # 解析原始消息
-            topic = msg.topic
-            payload = msg.payload.decode("utf-8")
-            recv_msg = f"📥 [{topic}] {payload}"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(recv_msg)
-            except ImportError:
-                pass
-            self.data_callback(recv_msg)
-
-            # 解析传感器数据（JSON格式）
-            if topic == "esp32/sensor":
-                parsed_data = json.loads(payload)
-                self.latest_data = parsed_data
-                # 转发解析后的数据到UI（主线程）
-                if self.parsed_data_callback:
-                    Clock.schedule_once(lambda dt: self.parsed_data_callback(parsed_data))
-
-        except json.JSONDecodeError:
-            error_msg = f"❌ 数据格式错误：{payload}"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
+            topic_handler, device_id = self.router.resolve(topic)
+            if topic_handler is None:
+                # 不在注册表中的主题（如服务器转发的其它订阅）：只记日志
+                self.ingest_queue.put((INGEST_MESSAGE, None, topic, device_id, payload, None), key=topic)
+                return
+            result = payload
+            if topic_handler.decoder is not None:
+                result = topic_handler.decoder(device_id, payload, trace)
+            if topic_handler.thread == THREAD_WORKER:
+                text = topic_handler.handler(topic, device_id, result) if topic_handler.handler else None
+                if topic_handler.log:
+                    self.ingest_queue.put((INGEST_HANDLED, topic_handler, topic, device_id, payload, text), key=topic)
+            elif result is not None or topic_handler.log:
+                # 原始payload原样入队，日志文本在主线程需要时再生成
+                self.ingest_queue.put((INGEST_MESSAGE, topic_handler, topic, device_id, payload, result), key=topic)
+        except ValueError:
+            # 含json.JSONDecodeError和二进制格式错误
+            self.ingest_queue.put((INGEST_ERROR, topic_handler, topic, device_id, payload,
+                                   f"❌ 数据格式错误：{payload_text(payload)}"), key=INGEST_ERROR)
         except Exception as e:
-            error_msg = f"❌ 接收数据失败：{str(e)}"
+            self.ingest_queue.put((INGEST_ERROR, topic_handler, topic, device_id, payload,
+                                   f"❌ 接收数据失败：{str(e)}"), key=INGEST_ERROR)
+
+    def _drain_ingest(self, dt):
+        """主线程每帧调用：取出本帧之前到达的全部消息，日志合并回调一次，每个主线程处理函数最多调用一次
+        （多个主题注册同一处理函数时合并，如单设备和多设备传感器主题）
+        """
+        entries = self.ingest_queue.drain()
+        if not entries:
+            return
+        log_entries = []  # [(模板, 参数, 来源)]：只存原始payload，日志页面显示时才转成文本
+        batches = {}  # 处理函数 -> 本帧的[(主题, 设备ID, 结果)]（按首次到达顺序调用）
+        for kind, topic_handler, topic, device_id, payload, data in entries:
+            if kind == INGEST_ERROR:
+                log_entries.append(("📥 [{}] {}", (topic, Lazy(payload_text, payload)), SOURCE_MQTT_RX))
+                log_entries.append((data, (), SOURCE_MQTT))
+                # 格式错误也通知主线程处理器（如传感器主题：UI显示数据异常）
+                if topic_handler is not None and topic_handler.thread == THREAD_MAIN and topic_handler.handler:
+                    batches.setdefault(topic_handler.handler, []).append((topic, device_id, None))
+                continue
+            if topic_handler is None or topic_handler.log:
+                text = data if kind == INGEST_HANDLED and data else Lazy(payload_text, payload)
+                log_entries.append(("📥 [{}] {}", (topic, text), SOURCE_MQTT_RX))
+            if kind == INGEST_MESSAGE and topic_handler is not None and topic_handler.handler and data is not None:
+                batches.setdefault(topic_handler.handler, []).append((topic, device_id, data))
+        # 收到的消息只写入日志存储（一帧一次，不回调data_callback）；原始内容回显按mqtt.rx类别限速
+        self.log_store.extend(log_entries)
+        for handler, messages in batches.items():
             try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
+                handler(messages)
+            except Exception as e:
+                print(f"处理[{messages[0][0]}]消息失败：{e}")
 
-    def _mqtt_loop(self):
-        """MQTT循环（连接成功后稳定运行，仅首次失败时重试）"""
-        reconnect_count = 0
-        max_retry = 15  # 仅首次连接失败时的重试次数
-        connected_successfully = False  # 标记是否成功连接过
+    # ========== 内置主题处理器 ==========
+    def _decode_sensor(self, device_id, payload, trace):
+        """传感器数据（网络线程）：一条消息（单条或批量）解码为一个SensorBatch，空消息返回None"""
+        _, batch = decode_sensor_payload(payload)
+        if self.backfill_since is not None and device_id not in self._backfill_requested:
+            # 重连后该设备第一次上报：请求补传断线期间的数据（起点取本条之前的最新数据，不会漏掉空档）
+            self._request_backfill(device_id, batch)
+        if not len(batch):
+            return None
+        if trace is not None:
+            self.tracer.set_device_time(trace, batch.ts[-1])
+            self.tracer.stamp(trace, STAGE_PARSED)
+            batch.trace = trace
+        latest = batch.latest()
+        self.latest_data = latest
+        self.devices.update(device_id, latest, batch.ts[-1])
+        return batch
+
+    def _dispatch_sensor(self, messages):
+        """传感器数据（主线程）：本帧全部数据合并成一次UI回调"""
+        readings = [(device_id, batch) for _, device_id, batch in messages]
+        traces = [batch.trace for _, batch in readings if batch is not None and batch.trace is not None]
+        if traces:
+            self.tracer.stamp_all(traces, STAGE_DISPATCH)
+        if self.parsed_batch_callback:
+            self.parsed_batch_callback(readings)
+        elif self.parsed_data_callback and readings[-1][1] is not None:
+            self.parsed_data_callback(readings[-1][1].latest())
+
+    # ========== 补传 ==========
+    def _request_backfill(self, device_id, batch):
+        """请求设备补传断线前最新数据之后的数据（网络线程，不读库；补传请求不进发件箱，过期的请求没有意义）
+        本次运行收到过该设备的数据：起点为内存中的最新时间戳（设备注册表，本条数据尚未记入）；
+        启动后第一次上报：到查询线程读已入库的、早于本条数据的最新时间戳，查到后在主线程发送请求
+        （接收队列过载时丢弃的数据不会再补传）
+        """
+        self._backfill_requested.add(device_id)
+        state = self.devices.get(device_id)
+        if state is not None and state.latest_ts is not None:
+            self._send_backfill_request(device_id, state.latest_ts)
+            return
+        # 本条未带时间戳时入库时间不早于此刻
+        before_ms = next((ts_ms for ts_ms in batch.ts if ts_ms is not None), None) or int(time.time() * 1000)
+        try:
+            get_query_executor().submit(
+                self.backfill_since, device_id, before_ms,
+                on_result=lambda since: self._send_backfill_request(device_id, since),
+                on_error=lambda e: print(f"查询补传起点失败：{e}"))
+        except Exception as e:
+            print(f"查询补传起点失败：{e}")
+
+    def _send_backfill_request(self, device_id, since):
+        """发布补传请求（网络线程或主线程）；连接已断开时不发，下次重连后重新请求"""
+        if not (self.connected and self.mqtt_client):
+            return
+        try:
+            self.mqtt_client.publish(backfill_request_topic(device_id),
+                                     json.dumps({"since": since or 0}), qos=1)
+            self.total_backfill_requests += 1
+        except Exception as e:
+            print(f"发送补传请求失败：{e}")
+
+    def _decode_backfill(self, device_id, payload, trace):
+        """补传数据（网络线程）：解码为SensorBatch"""
+        return decode_sensor_payload(payload)[1]
 
-        while reconnect_count < max_retry and not connected_successfully:
+    def _handle_backfill(self, topic, device_id, batch):
+        """补传数据（网络线程）：整块交给回调批量入库，不经过每帧的接收队列和界面更新
+        没有时间戳的数据无法定位，丢弃；返回日志文本
+        """
+        return f"补传{self._ingest_backfill(device_id, batch)}条数据"
+
+    def _ingest_backfill(self, device_id, batch):
+        """补传的一批数据交给回调批量入库，返回入库条数"""
+        if not any(ts is None for ts in batch.ts):
+            samples = batch
+        else:
+            keep = [i for i, ts in enumerate(batch.ts) if ts is not None]
+            samples = SensorBatch([batch.ts[i] for i in keep], [batch.do[i] for i in keep],
+                                  [batch.ph[i] for i in keep], [batch.temp[i] for i in keep])
+        if not len(samples) or self.backfill_callback is None:
+            return 0
+        self.backfill_callback(device_id, samples)
+        self.total_backfill_samples += len(samples)
+        return len(samples)
+
+    def _connect_once(self):
+        """建立一次连接（首次connect，之后reconnect复用同一客户端）；失败时抛出异常"""
+        self._set_state(STATE_CONNECTING)
+        if not self._connect_called:
+            # connect()即使失败也已记下服务器地址，之后统一用reconnect()
+            self._connect_called = True
+            self.mqtt_client.connect(self.broker, self.port, KEEPALIVE_S)
+        else:
+            self.mqtt_client.reconnect()
+
+    def _connect_error_message(self, error, delay):
+        """连接异常 -> 日志(模板, 参数)：同类异常模板相同，重连循环中合并为一行"""
+        args = (self.connect_attempts, delay)
+        if isinstance(error, ConnectionRefusedError):
+            return "❌ 连接被拒绝（第{}次，{:.1f}秒后重试）：请检查服务器地址/端口/账号密码", args
+        if isinstance(error, (TimeoutError, socket.timeout)):
+            return "❌ 连接超时（第{}次，{:.1f}秒后重试）：请检查手机网络/服务器是否在线", args
+        if isinstance(error, ssl.SSLError):
+            return "❌ TLS加密失败（第{}次，{:.1f}秒后重试）：服务器可能未开启TLS", args
+        return "❌ 连接失败（第{}次，{:.1f}秒后重试）：{}", args + (str(error),)
+
+    def _mqtt_loop(self):
+        """网络线程：连接 -> 收发循环 -> 断开后指数退避（带抖动）-> 重连，直到stop_mqtt"""
+        while not self._stop_event.is_set():
+            error = None
+            connects_before = self.total_connects
             try:
-                self.mqtt_client.connect(self.broker, self.port, 60)
-                self.connected = True
-                connected_successfully = True  # 标记为已成功连接
-                success_msg = "✅ MQTT连接成功，进入稳定运行模式"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(success_msg)
-                except ImportError:
-                    pass
-                # loop_forever：连接成功后持续运行，直到主动断开
-                self.mqtt_client.loop_forever(retry_first_connection=True)
-                break  # 正常断开后退出循环，不重试
-            except ConnectionRefusedError:
-                reconnect_count += 1
-                error_msg = f"❌ 连接被拒绝（第{reconnect_count}/{max_retry}次）：请检查服务器地址/端口/账号密码"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(error_msg)
-                except ImportError:
-                    pass
-                self.data_callback(error_msg)
-            except TimeoutError:
-                reconnect_count += 1
-                error_msg = f"❌ 连接超时（第{reconnect_count}/{max_retry}次）：请检查手机网络/服务器是否在线"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(error_msg)
-                except ImportError:
-                    pass
-                self.data_callback(error_msg)
-            except ssl.SSLError:
-                reconnect_count += 1
-                error_msg = f"❌ TLS加密失败（第{reconnect_count}/{max_retry}次）：服务器可能未开启TLS"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(error_msg)
-                except ImportError:
-                    pass
-                self.data_callback(error_msg)
+                self._connect_once()
+                # 收发循环：连接断开或CONNACK被拒绝时loop()返回非0
+                while not self._stop_event.is_set():
+                    rc = self.mqtt_client.loop(timeout=LOOP_TIMEOUT_S)
+                    if rc != mqtt.MQTT_ERR_SUCCESS:
+                        break
             except Exception as e:
-                reconnect_count += 1
-                error_msg = f"❌ 连接失败（第{reconnect_count}/{max_retry}次）：{str(e)}"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(error_msg)
-                except ImportError:
-                    pass
-                self.data_callback(error_msg)
-            
-            if reconnect_count < max_retry:
-                time.sleep(5)  # 重试间隔5秒
-        
-        # 仅首次连接失败且达到最大次数时提示
-        if not connected_successfully and reconnect_count >= max_retry:
-            error_msg = "❌ 达到最大重连次数，请检查：\n1. 服务器地址/端口/账号密码\n2. 手机网络是否能访问服务器\n3. 服务器是否开启8883端口"
+                error = e
+            if self._stop_event.is_set():
+                break
+
+            # 连接失败或断开：退避等待后重连（期间不占CPU，可被reconnect_now/stop_mqtt唤醒）
+            if self.total_connects == connects_before:
+                self.total_connect_failures += 1
+            # 曾经连上过才计算重连耗时（首次连接的耗时不算）
+            if self.disconnected_at is None and self.total_connects > 0:
+                self.disconnected_at = time.monotonic()
+            self._set_state(STATE_BACKOFF)
+            self.connect_attempts += 1
+            delay = backoff_delay(self.connect_attempts, rng=self._rng)
+            self.next_retry_delay_s = delay
+            if error is not None:
+                template, args = self._connect_error_message(error, delay)
+                self._log(template, *args, source=SOURCE_MQTT_CONN)
+            else:
+                self._log("⚠️ MQTT连接异常，{:.1f}秒后重连（第{}次）", delay, self.connect_attempts,
+                          source=SOURCE_MQTT_CONN)
+            self._wake_event.wait(delay)
+            self._wake_event.clear()
+
+        self._set_state(STATE_STOPPED)
+
+    # ========== 异步发布（发件箱 + Future） ==========
+    def publish(self, topic, payload, qos=1, callback=None):
+        """异步发布指令：交给指令线程入库并发送，立即返回Future，不等待磁盘和网络
+        Future的结果为投递延迟（毫秒，提交 -> 服务器确认）；离线或发送出错时保持未完成，重连后按提交顺序重发
+        入库失败或积压超过command_max_age_s未发出时以异常结束
+        callback(future)在Future完成后经Clock在主线程调用
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(lambda done: Clock.schedule_once(lambda dt: callback(done)))
+        self._command_tasks.put((_TASK_COMMAND, (topic, payload, qos, future)))
+        self._start_command_thread()
+        return future
+
+    def flush_commands(self, timeout=3):
+        """等待已提交的指令入库/发送完成（停止前调用）；返回是否在timeout内完成"""
+        if not (self._command_thread and self._command_thread.is_alive()):
+            return False
+        done = Event()
+        self._command_tasks.put((_TASK_FLUSH, done))
+        return done.wait(timeout)
+
+    def _start_command_thread(self):
+        """启动指令线程（任意线程调用，重复调用无副作用；守护线程，随APP进程退出）"""
+        with self._command_thread_lock:
+            if self._command_thread and self._command_thread.is_alive():
+                return
+            self._command_thread = Thread(target=self._command_loop, name="MqttCommandWriter", daemon=True)
+            self._command_thread.start()
+
+    def _command_loop(self):
+        """指令线程主循环：唯一读写发件箱待发指令并发送的线程，新指令和重发按提交顺序执行"""
+        while True:
+            task, arg = self._command_tasks.get()
             try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
+                if task == _TASK_COMMAND:
+                    self._store_and_send(*arg)
+                elif task == _TASK_REPLAY:
+                    self._replay_outbox()
+                elif task == _TASK_FLUSH:
+                    arg.set()
+            except Exception as e:
+                print(f"指令线程任务失败（{task}）：{e}")
+
+    def _store_and_send(self, topic, payload, qos, future):
+        """指令线程：入库后在线立即发送；入库成功后发送出错只记日志，指令留在发件箱等重连重发"""
+        try:
+            command = self.outbox.add(topic, payload, qos)
+        except Exception as e:
+            self._log("❌ 指令保存失败，未发送：{}", e)
+            future.set_exception(e)
+            return
+        with self._publish_lock:
+            self._futures[command.command_id] = future
+        if not (self.connected and self.mqtt_client):
+            return
+        try:
+            self._send_command(command)
+        except Exception as e:
+            self._log("⚠️ 指令发送出错，已保留在待发队列，重连后重发：{}", e)
+
+    def _send_command(self, command):
+        """发送一条发件箱指令（不等待确认，确认在_on_publish中处理）；返回是否已交给网络层"""
+        self.outbox.mark_sent(command.command_id)
+        # publish时不持锁：paho可能在publish内部（持有自己的回调锁）同步回调_on_publish，持锁会与网络线程互相等待
+        # 发送期间（直到mid登记进在途表）到达的未知确认会暂存，登记和减计数在同一次持锁内完成，不会漏掉确认
+        with self._publish_lock:
+            self._sending += 1
+        try:
+            info = self.mqtt_client.publish(command.topic, command.payload, qos=command.qos)
+        except Exception:
+            with self._publish_lock:
+                self._sending -= 1
+            raise
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            with self._publish_lock:
+                self._sending -= 1
+            # 未发出（如连接刚断开）：留在发件箱，重连后重发
+            return False
+        acked = False
+        with self._publish_lock:
+            self._sending -= 1
+            acked_at = self._early_acks.pop(info.mid, None)
+            if acked_at is not None and time.monotonic() - acked_at <= EARLY_ACK_TTL_S:
+                acked = True
+            else:
+                self._inflight[info.mid] = command.command_id
+        if acked:
+            self._complete_command(command.command_id)
+        return True
+
+    def _expire_commands(self):
+        """指令线程：删除积压超过command_max_age_s的未确认指令，对应Future以TimeoutError结束"""
+        if not self.command_max_age_s:
+            return
+        expired_ids = self.outbox.expire(int((time.time() - self.command_max_age_s) * 1000))
+        if not expired_ids:
+            return
+        self.total_commands_expired += len(expired_ids)
+        with self._publish_lock:
+            futures = [self._futures.pop(command_id, None) for command_id in expired_ids]
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(TimeoutError(f"指令积压超过{self.command_max_age_s}秒未发出，已取消"))
+        self._log("⚠️ {}条指令积压超过{}秒未发出，已过期不再发送", len(expired_ids), self.command_max_age_s)
 
-    def publish_command(self, topic, command):
-        """发布指令（增加空值保护）"""
+    def _replay_outbox(self):
+        """重发发件箱中全部未过期、未确认、且不在当前连接在途的指令（指令线程，连接成功后执行）"""
+        try:
+            self._expire_commands()
+            if not self.connected:
+                return
+            with self._publish_lock:
+                inflight_ids = set(self._inflight.values())
+            for command in self.outbox.pending():
+                if command.command_id in inflight_ids:
+                    continue
+                with self._publish_lock:
+                    # 上次运行遗留的指令：没有调用方等待，补一个Future只用于记录
+                    self._futures.setdefault(command.command_id, Future())
+                if not self._send_command(command):
+                    break  # 连接又断了：保持顺序，剩余的等下次重连
+        except Exception as e:
+            print(f"重发积压指令失败：{e}")
+
+    def _on_publish(self, client, userdata, mid):
+        """发布确认回调（QoS1为收到PUBACK，QoS0为已写入网络）
+        不在在途表中的mid：发件箱指令正在发送时可能是它的确认先到了，暂存等publish()返回后认领；
+        否则是非发件箱消息（如补传请求）的确认，直接忽略
+        """
+        with self._publish_lock:
+            command_id = self._inflight.pop(mid, None)
+            if command_id is None:
+                if self._sending:
+                    now = time.monotonic()
+                    # 清理过期的暂存（并发发送时混入的其它消息确认）
+                    for stale_mid in [m for m, at in self._early_acks.items() if now - at > EARLY_ACK_TTL_S]:
+                        del self._early_acks[stale_mid]
+                    self._early_acks[mid] = now
+                return
+        self._complete_command(command_id)
+
+    def _complete_command(self, command_id):
+        """指令已送达：记录投递延迟并完成Future"""
+        try:
+            delivery_ms, _ = self.outbox.mark_acked(command_id)
+        except Exception as e:
+            print(f"记录指令确认失败：{e}")
+            delivery_ms = None
+        with self._publish_lock:
+            future = self._futures.pop(command_id, None)
+        if future is not None and not future.done():
+            future.set_result(delivery_ms)
+
+    def get_outbox_stats(self):
+        """发件箱统计（待发条数、最近平均投递延迟、累计过期条数）"""
+        stats = self.outbox.get_stats()
+        stats["total_expired"] = self.total_commands_expired
+        return stats
+
+    def publish_command(self, topic, command, qos=1, callback=None):
+        """发布指令（异步，不阻塞UI）：返回True表示已提交（在线立即发送，离线进入发件箱等待重连）
+        callback(future)在送达或失败（入库失败、积压过期）后于主线程调用，
+        成功时future.result()为投递延迟毫秒，失败时future.exception()为原因
+        """
         if not self.mqtt_client:
             error_msg = "❌ MQTT客户端未初始化"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
+            self._log(error_msg)
             return False
+
+        def on_delivered(future):
+            error = future.exception()
+            if error is not None:
+                self._log(f"❌ 指令未送达：{command}（{error}）")
+            else:
+                self._log(f"📤 已送达：{command}（{future.result()}ms）")
+            if callback is not None:
+                callback(future)
+
+        self.publish(topic, command, qos, on_delivered)
         if not self.connected:
-            error_msg = "❌ MQTT未连接，无法发送指令"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
-            return False
-        try:
-            result = self.mqtt_client.publish(topic, command, qos=0)
-            result.wait_for_publish()
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                success_msg = f"📤 已发送：{command}"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(success_msg)
-                except ImportError:
-                    pass
-                self.data_callback(success_msg)
-                return True
+            info_msg = f"⚠️ MQTT未连接，指令已加入待发队列，重连后发送：{command}"
+        else:
+            info_msg = f"📤 已提交发送：{command}"
+        self._log(info_msg)
+        return True
+
+    # ========== 请求/响应（如阈值设置 -> 设备确认） ==========
+    def send_request(self, topic, payload, response_topic=THRESHOLD_RESPONSE_TOPIC, timeout_s=REQUEST_TIMEOUT_S,
+                     on_delivered=None, on_response=None):
+        """发送需要设备响应的指令（主线程调用）：payload字典加上req_id后经发件箱发布
+        返回响应Future（提交失败时返回None）：设备在response_topic回复相同req_id（设备不回传req_id时按先后顺序
+        对应最早的待响应请求）时完成，结果为响应字典；timeout_s秒内未响应时以TimeoutError结束
+        on_delivered(future)在送达服务器后调用，on_response(future)在响应或超时后调用，均在主线程
+        """
+        req_id = uuid.uuid4().hex[:8]
+        message = dict(payload, req_id=req_id)
+        if not self.publish_command(topic, json.dumps(message, ensure_ascii=False), callback=on_delivered):
+            return None
+        future = Future()
+        if on_response is not None:
+            future.add_done_callback(on_response)
+        self._pending_requests.setdefault(response_topic, OrderedDict())[req_id] = future
+        Clock.schedule_once(lambda dt: self._expire_request(response_topic, req_id, timeout_s), timeout_s)
+        return future
+
+    def _expire_request(self, response_topic, req_id, timeout_s):
+        future = self._pending_requests.get(response_topic, {}).pop(req_id, None)
+        if future is not None and not future.done():
+            future.set_exception(TimeoutError(f"{timeout_s}秒内未收到设备响应"))
+
+    def _handle_responses(self, messages):
+        """响应主题（主线程）：按req_id完成对应的待响应请求"""
+        for topic, _, response in messages:
+            pending = self._pending_requests.get(topic)
+            if response is None or not pending:
+                continue
+            req_id = response.get("req_id")
+            if req_id is not None:
+                future = pending.pop(str(req_id), None)
             else:
-                error_msg = f"❌ 发布失败（错误码{result.rc}）"
-                try:
-                    from app_ui_pages import add_global_log
-                    add_global_log(error_msg)
-                except ImportError:
-                    pass
-                self.data_callback(error_msg)
-                return False
-        except Exception as e:
-            error_msg = f"❌ 发送指令失败：{str(e)}"
-            try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
-            except ImportError:
-                pass
-            self.data_callback(error_msg)
-            return False
\ No newline at end of file
+                future = pending.popitem(last=False)[1]
+            if future is not None and not future.done():
+                future.set_result(response)
@@ -0,0 +1,116 @@
+# event_bus.py：任意线程 -> Kivy主线程的事件总线
+# 生产者（MQTT网络线程、日志存储、存储写线程等）只在一把小锁内把事件追加到待处理表，不碰UI
+# 同一帧内第一次发布时触发一次主线程分发（Clock触发器，本帧已触发过则不再调度），
+# 分发时每个主题的订阅者只调用一次，参数为本帧该主题的全部事件（按发布顺序）
+# 只关心"有变化"的主题（如日志新增）发布时不带事件，一帧内多次发布合并成一次通知
+import threading
+from functools import partial
+
+from kivy.clock import Clock
+
+from log_store import get_log_store
+
+# 日志存储有新记录（不带事件：订阅者自行从日志存储增量读取）
+EVENT_LOG_APPENDED = "log.appended"
+# MQTT客户端的连接状态、指令收发日志（事件为消息文本）
+EVENT_MQTT_STATUS = "mqtt.status"
+
+# 每个主题一帧内最多缓存的事件数：主线程卡住时超出的事件丢弃（只计数），不无限占用内存
+MAX_PENDING_EVENTS = 1000
+
+
+class EventBus:
+    """多生产者（任意线程）/单消费者（主线程）事件总线
+    publish可在任意线程调用；subscribe/unsubscribe和订阅者回调都在主线程
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = {}      # 主题 -> 本帧的事件列表（按首次发布的顺序分发）
+        self._scheduled = False  # 本帧是否已触发分发
+        self._subscribers = {}  # 主题 -> [回调]
+        self._trigger = None
+        self.total_published = 0
+        self.total_dispatches = 0
+        self.total_dropped = 0
+
+    def start(self):
+        """创建主线程分发触发器（主线程调用，重复调用无副作用）；启动前发布的事件在启动后一并分发"""
+        if self._trigger is None:
+            self._trigger = Clock.create_trigger(self.dispatch, 0)
+            if self._scheduled:
+                self._trigger()
+
+    def subscribe(self, topic, callback):
+        """订阅主题（主线程）：callback(本帧的事件列表)，不带事件的主题为空列表"""
+        callbacks = self._subscribers.setdefault(topic, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def unsubscribe(self, topic, callback):
+        callbacks = self._subscribers.get(topic)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, topic, event=None):
+        """发布事件（任意线程，不阻塞）：event为None时只通知该主题有变化"""
+        with self._lock:
+            self.total_published += 1
+            events = self._pending.get(topic)
+            if events is None:
+                events = self._pending[topic] = []
+            if event is not None:
+                if len(events) < self.max_pending:
+                    events.append(event)
+                else:
+                    self.total_dropped += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        if self._trigger is not None:
+            self._trigger()
+
+    def publisher(self, topic):
+        """绑定主题的发布函数（无参数，可直接作为日志存储等的监听回调）"""
+        return partial(self.publish, topic)
+
+    def dispatch(self, *args):
+        """主线程：取出本帧的全部事件，每个主题的订阅者调用一次"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        if not pending:
+            return
+        self.total_dispatches += 1
+        for topic, events in pending.items():
+            for callback in list(self._subscribers.get(topic, ())):
+                try:
+                    callback(events)
+                except Exception as e:
+                    print(f"事件回调失败（{topic}）：{e}")
+
+    def get_stats(self):
+        return {
+            "topics": len(self._subscribers),
+            "total_published": self.total_published,
+            "total_dispatches": self.total_dispatches,
+            "total_dropped": self.total_dropped,
+        }
+
+
+# 全局事件总线（创建时接上全局日志存储：日志新增 -> EVENT_LOG_APPENDED）
+_EVENT_BUS = None
+_EVENT_BUS_LOCK = threading.Lock()
+
+
+def get_event_bus():
+    """获取（必要时创建）全局事件总线；主线程需调用一次start()后才开始分发"""
+    global _EVENT_BUS
+    if _EVENT_BUS is None:
+        with _EVENT_BUS_LOCK:
+            if _EVENT_BUS is None:
+                bus = EventBus()
+                get_log_store().listeners.append(bus.publisher(EVENT_LOG_APPENDED))
+                _EVENT_BUS = bus
+    return _EVENT_BUS
@@ -0,0 +1,101 @@
+# ingest_queue.py：MQTT网络线程 -> Kivy主线程的有界接收队列
+# 网络线程只做put（不碰UI、不调度Clock），主线程每帧drain一次，同一帧内到达的多条数据合并成一次UI更新
+import threading
+from collections import deque
+
+# 背压策略：
+# drop_oldest：队列满时丢弃最旧的一条（默认；正常负载下每条数据都会入库）
+# coalesce_latest：同一key（主题/设备）只保留最新一条，未处理的旧数据直接被覆盖（只关心最新值时使用）
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_COALESCE_LATEST = "coalesce_latest"
+POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE_LATEST)
+
+# 默认容量：10Hz数据源下主线程卡顿约100秒才会开始丢数据
+DEFAULT_INGEST_MAXLEN = 1000
+
+
+class IngestQueue:
+    """单生产者（网络线程）/单消费者（主线程）有界队列
+    drop_oldest基于deque(maxlen)：append/popleft在GIL下是原子操作，生产和消费都不加锁
+    coalesce_latest需要同时维护key顺序和最新值，用一把只保护两步字典操作的小锁
+    """
+
+    def __init__(self, maxlen=DEFAULT_INGEST_MAXLEN, policy=POLICY_DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"未知的背压策略：{policy}（可选：{', '.join(POLICIES)}）")
+        if maxlen < 1:
+            raise ValueError("队列容量至少为1")
+        self.maxlen = maxlen
+        self.policy = policy
+        self._items = deque(maxlen=maxlen)  # drop_oldest：条目；coalesce_latest：待处理的key
+        self._latest = {}                   # coalesce_latest：key -> 最新条目
+        self._lock = threading.Lock()
+        self.total_put = 0
+        self.total_drained = 0
+        self.total_dropped = 0    # 因队列满被丢弃的条数
+        self.total_coalesced = 0  # 被同key新数据覆盖的条数
+        self.max_depth = 0
+
+    def put(self, item, key=None):
+        """放入一条数据（网络线程调用，不阻塞）；返回False表示有旧数据被丢弃或覆盖"""
+        self.total_put += 1
+        if self.policy == POLICY_DROP_OLDEST:
+            full = len(self._items) >= self.maxlen
+            self._items.append(item)  # 满时deque自动挤掉最旧一条
+            if full:
+                self.total_dropped += 1
+            else:
+                self.max_depth = max(self.max_depth, len(self._items))
+            return not full
+
+        with self._lock:
+            if key in self._latest:
+                self._latest[key] = item
+                self.total_coalesced += 1
+                return False
+            dropped = False
+            if len(self._items) >= self.maxlen:
+                self._latest.pop(self._items.popleft(), None)
+                self.total_dropped += 1
+                dropped = True
+            self._items.append(key)
+            self._latest[key] = item
+            self.max_depth = max(self.max_depth, len(self._items))
+            return not dropped
+
+    def drain(self, limit=None):
+        """取出当前队列中的全部数据（主线程每帧调用一次），按到达顺序返回列表
+        limit限制单帧最多处理条数，避免极端情况下一帧处理过久；本帧之后到达的数据留到下一帧
+        """
+        count = len(self._items)
+        if limit is not None:
+            count = min(count, limit)
+        drained = []
+        if self.policy == POLICY_DROP_OLDEST:
+            popleft = self._items.popleft
+            for _ in range(count):
+                try:
+                    drained.append(popleft())
+                except IndexError:
+                    break
+        else:
+            with self._lock:
+                for _ in range(count):
+                    drained.append(self._latest.pop(self._items.popleft()))
+        self.total_drained += len(drained)
+        return drained
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_stats(self):
+        """队列统计：当前深度、历史最大深度、丢弃/覆盖条数"""
+        return {
+            "policy": self.policy,
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "total_put": self.total_put,
+            "total_drained": self.total_drained,
+            "total_dropped": self.total_dropped,
+            "total_coalesced": self.total_coalesced,
+        }
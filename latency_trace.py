@@ -0,0 +1,199 @@
+# latency_trace.py：传感器数据端到端延迟追踪（ESP32采样 -> 界面更新 -> 入库提交）
+# 每条传感器消息（单条或批量，以其中最新一条数据为准）带一个Trace，沿途各处打时间戳：
+#   device   设备采样时间（消息带ts时）
+#   receive  网络线程_on_message收到
+#   parsed   网络线程解析完成
+#   dispatch 主线程每帧处理接收队列
+#   ui       首页标签更新完成
+#   commit   存储写线程提交事务
+# 相邻时间戳之差按段累计到对数分桶直方图，可在"我的"页面查看p50/p95/p99并导出为JSON文件
+# 关闭时（默认）只多一次enabled判断，不创建Trace、不取时间
+import bisect
+import datetime
+import json
+import threading
+import time
+
+STAGE_DEVICE = "device"
+STAGE_RECEIVE = "receive"
+STAGE_PARSED = "parsed"
+STAGE_DISPATCH = "dispatch"
+STAGE_UI = "ui"
+STAGE_COMMIT = "commit"
+
+# 统计段：(名称, 起点, 终点, 说明)；终点时间戳打上时记录该段
+SEGMENTS = (
+    ("network", STAGE_DEVICE, STAGE_RECEIVE, "设备->收到"),
+    ("parse", STAGE_RECEIVE, STAGE_PARSED, "解析"),
+    ("queue", STAGE_PARSED, STAGE_DISPATCH, "排队等帧"),
+    ("ui", STAGE_DISPATCH, STAGE_UI, "界面更新"),
+    ("commit", STAGE_DISPATCH, STAGE_COMMIT, "入库提交"),
+    ("receive_to_ui", STAGE_RECEIVE, STAGE_UI, "收到->界面"),
+    ("device_to_ui", STAGE_DEVICE, STAGE_UI, "设备->界面"),
+)
+# 终点 -> 以它结束的统计段
+_SEGMENTS_BY_END = {}
+for _name, _start, _end, _ in SEGMENTS:
+    _SEGMENTS_BY_END.setdefault(_end, []).append((_name, _start))
+
+# 直方图分桶上界（毫秒）：0.05ms起每档×2^(1/4)（相对误差约19%），最后一档约1小时，超出的计入溢出桶
+BUCKET_BOUNDS_MS = tuple(0.05 * 2 ** (i / 4.0) for i in range(122))
+PERCENTILES = (50, 95, 99)
+LATENCY_DUMP_FILENAME = "latency_trace.json"
+
+
+def _now_ms():
+    """与设备时间戳同一基准的当前时间（epoch毫秒，浮点）"""
+    return time.time() * 1000.0
+
+
+class LatencyHistogram:
+    """对数分桶直方图：记录O(log桶数)，分位数在所在桶内线性插值（误差不超过一档）"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, value_ms):
+        # 设备与手机时钟不同步时"设备->收到"可能为负，计入最小一档
+        value_ms = max(0.0, value_ms)
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, p):
+        """第p百分位（毫秒），没有数据时返回None"""
+        if not self.count:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index >= len(BUCKET_BOUNDS_MS):
+                    return self.max_ms
+                lower = BUCKET_BOUNDS_MS[index - 1] if index else 0.0
+                upper = min(BUCKET_BOUNDS_MS[index], self.max_ms)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max_ms
+
+    def summary(self):
+        result = {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "max_ms": self.max_ms if self.count else None,
+        }
+        for p in PERCENTILES:
+            result[f"p{p}_ms"] = self.percentile(p)
+        return result
+
+
+class Trace:
+    """一条消息沿途的时间戳（epoch毫秒）"""
+
+    __slots__ = ("stamps",)
+
+    def __init__(self):
+        self.stamps = {STAGE_RECEIVE: _now_ms()}
+
+
+class LatencyTracer:
+    """按段汇总延迟：网络线程、主线程、写线程都会打点，直方图更新在一把锁内完成"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {name: LatencyHistogram() for name, _, _, _ in SEGMENTS}
+        self.started_at = datetime.datetime.now()
+
+    def begin(self):
+        """网络线程收到消息时调用：关闭时返回None"""
+        if not self.enabled:
+            return None
+        return Trace()
+
+    def stamp(self, trace, stage, now_ms=None):
+        """给trace打上stage时间戳，并记录以stage结束的各段（trace为None时直接返回）"""
+        if trace is None:
+            return
+        stamps = trace.stamps
+        if stage in stamps:
+            return  # 同一条消息只记第一次（如一批数据分多次提交）
+        now_ms = _now_ms() if now_ms is None else now_ms
+        stamps[stage] = now_ms
+        segments = _SEGMENTS_BY_END.get(stage)
+        if not segments:
+            return
+        with self._lock:
+            for name, start in segments:
+                start_ms = stamps.get(start)
+                if start_ms is not None:
+                    self._histograms[name].record(now_ms - start_ms)
+
+    def stamp_all(self, traces, stage):
+        """同一时刻给多条trace打点（主线程一帧、写线程一次提交）"""
+        now_ms = _now_ms()
+        for trace in traces:
+            self.stamp(trace, stage, now_ms)
+
+    def set_device_time(self, trace, device_ts_ms):
+        """记录设备采样时间（消息解码后才知道），同时补记已经打过终点的"设备->收到"段"""
+        if trace is None or device_ts_ms is None:
+            return
+        stamps = trace.stamps
+        stamps[STAGE_DEVICE] = float(device_ts_ms)
+        with self._lock:
+            for name, start, end, _ in SEGMENTS:
+                if start == STAGE_DEVICE and end in stamps:
+                    self._histograms[name].record(stamps[end] - stamps[STAGE_DEVICE])
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: LatencyHistogram() for name, _, _, _ in SEGMENTS}
+            self.started_at = datetime.datetime.now()
+
+    def get_stats(self):
+        """各段统计 {段名: {count, mean_ms, max_ms, p50_ms, p95_ms, p99_ms}}"""
+        with self._lock:
+            return {name: self._histograms[name].summary() for name, _, _, _ in SEGMENTS}
+
+    def format_stats(self):
+        """界面显示用：每段一行"""
+        stats = self.get_stats()
+        lines = []
+        for name, _, _, label in SEGMENTS:
+            segment = stats[name]
+            if not segment["count"]:
+                continue
+            lines.append(f"{label}：p50 {segment['p50_ms']:.1f} | p95 {segment['p95_ms']:.1f} | "
+                         f"p99 {segment['p99_ms']:.1f}ms（{segment['count']}条）")
+        return "\n".join(lines) if lines else "暂无数据"
+
+    def dump(self, path):
+        """把各段统计和直方图原始分桶写入JSON文件"""
+        with self._lock:
+            histograms = {name: {"summary": histogram.summary(), "counts": list(histogram.counts)}
+                          for name, histogram in self._histograms.items()}
+        report = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "dumped_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "bucket_bounds_ms": list(BUCKET_BOUNDS_MS),
+            "segments": {name: {"from": start, "to": end, "label": label} for name, start, end, label in SEGMENTS},
+            "histograms": histograms,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+
+# 全局追踪器（默认关闭，在"我的"页面开关）
+_TRACER = LatencyTracer()
+
+
+def get_latency_tracer():
+    """全局延迟追踪器（网络线程、主线程、写线程共用）"""
+    return _TRACER
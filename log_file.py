@@ -0,0 +1,305 @@
+# log_file.py：运行日志落盘（后台写线程 + 按大小滚动 + 旧文件gzip压缩）和文件检索
+# 写线程由日志存储的监听回调唤醒，每隔FLUSH_INTERVAL_S秒把这段时间的新日志一次写入（一次write + flush）
+# 文件在应用私有目录logs/下：当前文件app.log，写满后改名为app.<滚动时间>-<序号>.log并压缩为.gz，最多保留MAX_LOG_FILES个
+# 每行一条日志，制表符分隔：时间（YYYY-mm-dd HH:MM:SS.fff）\t级别代码\t来源\t消息（换行转义为\n）
+# 检索逐行流式读取（gzip文件边解压边读），不把文件整个读进内存；按时间范围跳过整个文件、按子串先粗筛再解析
+import gzip
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+from log_store import get_log_store, LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR
+
+LOG_DIRNAME = "logs"
+CURRENT_LOG_FILENAME = "app.log"
+ROTATED_PREFIX = "app."
+# 单个文件写满后滚动（字节）
+MAX_LOG_FILE_BYTES = 1024 * 1024
+# 最多保留的文件数（含当前文件），超出时删除最旧的
+MAX_LOG_FILES = 20
+# 写线程合并写入的间隔（秒）：同一间隔内的日志一次写入
+FLUSH_INTERVAL_S = 1.0
+# 单次检索最多返回的条数（返回最新的）
+DEFAULT_SEARCH_LIMIT = 500
+# 检索每读多少行检查一次是否已取消（另外每个文件开始前检查）
+SEARCH_CANCEL_CHECK_LINES = 5000
+
+LEVEL_CODES = {LEVEL_DEBUG: "D", LEVEL_INFO: "I", LEVEL_WARNING: "W", LEVEL_ERROR: "E"}
+_LEVELS_BY_CODE = {code: level for level, code in LEVEL_CODES.items()}
+_TIME_TEXT_LEN = len("2026-01-01 00:00:00.000")
+
+
+def format_time(dt):
+    """datetime -> 日志文件中的时间文本（按字符串比较即按时间比较）"""
+    return dt.strftime("%Y-%m-%d %H:%M:%S.") + f"{dt.microsecond // 1000:03d}"
+
+
+def format_line(record):
+    """LogRecord -> 文件中的一行"""
+    message = record.display_message.replace("\\", "\\\\").replace("\n", "\\n").replace("\t", " ")
+    return f"{format_time(record.wall_time)}\t{LEVEL_CODES.get(record.level, 'I')}\t{record.source}\t{message}\n"
+
+
+class FileLogEntry:
+    """从日志文件读出的一条日志（与LogRecord同样提供level和format()，可直接显示在日志列表中）"""
+
+    __slots__ = ("time_text", "level", "source", "message")
+
+    def __init__(self, time_text, level, source, message):
+        self.time_text = time_text
+        self.level = level
+        self.source = source
+        self.message = message
+
+    def format(self):
+        """显示文本：[月-日 时:分:秒] 消息"""
+        return f"[{self.time_text[5:19]}] {self.message}"
+
+
+def parse_line(line):
+    """文件中的一行 -> FileLogEntry，格式不符时返回None"""
+    parts = line.rstrip("\n").split("\t", 3)
+    if len(parts) != 4:
+        return None
+    time_text, code, source, message = parts
+    message = message.replace("\\n", "\n").replace("\\\\", "\\")
+    return FileLogEntry(time_text, _LEVELS_BY_CODE.get(code, LEVEL_INFO), source, message)
+
+
+def list_log_files(directory):
+    """日志文件列表（从旧到新）：滚动文件按文件名中的滚动时间排序，当前文件最后"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    rotated = sorted(name for name in names if name.startswith(ROTATED_PREFIX) and name != CURRENT_LOG_FILENAME
+                     and (name.endswith(".log") or name.endswith(".log.gz")))
+    files = [os.path.join(directory, name) for name in rotated]
+    if CURRENT_LOG_FILENAME in names:
+        files.append(os.path.join(directory, CURRENT_LOG_FILENAME))
+    return files
+
+
+def _open_log_file(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def _rotated_end_time(path):
+    """滚动文件名中的滚动时间（即文件最后一条日志的时间上界，文本格式同日志时间），当前文件返回None"""
+    name = os.path.basename(path)
+    if name == CURRENT_LOG_FILENAME:
+        return None
+    stamp = name[len(ROTATED_PREFIX):len(ROTATED_PREFIX) + 15]  # YYYYmmdd-HHMMSS
+    if len(stamp) != 15 or stamp[8] != "-":
+        return None
+    return f"{stamp[0:4]}-{stamp[4:6]}-{stamp[6:8]} {stamp[9:11]}:{stamp[11:13]}:{stamp[13:15]}.999"
+
+
+def search_log_files(directory, min_level=None, start_text=None, end_text=None, substring=None,
+                     limit=DEFAULT_SEARCH_LIMIT, should_stop=None):
+    """检索日志文件，返回满足条件的最新limit条FileLogEntry（按时间正序）
+    min_level：最低级别；start_text/end_text：时间范围[start, end)（format_time格式的文本，可只给前缀如"2026-01-01"）
+    substring：消息子串（区分大小写）；文件逐行流式读取，内存占用只与limit有关
+    should_stop()：返回True时提前结束（每个文件开始前和每SEARCH_CANCEL_CHECK_LINES行检查一次），返回已找到的部分
+    """
+    matches = deque(maxlen=limit)
+    files = list_log_files(directory)
+    for index, path in enumerate(files):
+        if should_stop is not None and should_stop():
+            break
+        # 整个文件都早于起始时间：上一个滚动文件的滚动时间之后才是本文件的范围，结束时间早于起点即可跳过
+        end_of_file = _rotated_end_time(path)
+        if start_text and end_of_file and end_of_file < start_text:
+            continue
+        if end_text and index > 0:
+            start_of_file = _rotated_end_time(files[index - 1])
+            if start_of_file and start_of_file >= end_text:
+                break
+        try:
+            with _open_log_file(path) as f:
+                for line_number, line in enumerate(f, 1):
+                    if should_stop is not None and line_number % SEARCH_CANCEL_CHECK_LINES == 0 and should_stop():
+                        break
+                    # 先按子串和时间前缀粗筛，命中后才拆分字段
+                    if substring and substring not in line:
+                        continue
+                    time_text = line[:_TIME_TEXT_LEN]
+                    if start_text and time_text < start_text:
+                        continue
+                    if end_text and time_text >= end_text:
+                        break  # 文件内按时间递增
+                    entry = parse_line(line)
+                    if entry is None:
+                        continue
+                    if min_level is not None and entry.level < min_level:
+                        continue
+                    if substring and substring not in entry.message:
+                        continue
+                    matches.append(entry)
+        except (OSError, EOFError) as e:
+            print(f"读取日志文件失败（{path}）：{e}")
+    return list(matches)
+
+
+class LogFileSink:
+    """把日志存储中的新记录写入滚动文件（后台写线程；调用方不做任何文件IO）"""
+
+    def __init__(self, directory, store=None, max_bytes=MAX_LOG_FILE_BYTES, max_files=MAX_LOG_FILES,
+                 compress=True, flush_interval_s=FLUSH_INTERVAL_S):
+        self.directory = directory
+        self.store = store if store is not None else get_log_store()
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.compress = compress
+        self.flush_interval_s = flush_interval_s
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._last_seq = 0  # 已写入的最后一条日志序号（启动前已在内存中的日志也会写入）
+        self.total_written = 0
+        self.total_missed = 0  # 写线程跟不上、已被日志存储挤掉的条数
+        self.total_rotations = 0
+
+    @property
+    def current_path(self):
+        return os.path.join(self.directory, CURRENT_LOG_FILENAME)
+
+    def start(self):
+        """启动写线程（重复调用无副作用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop_event.clear()
+        if self._wake not in self.store.listeners:
+            self.store.listeners.append(self._wake)
+        self._thread = threading.Thread(target=self._writer_loop, name="LogFileWriter", daemon=True)
+        self._thread.start()
+        self._wake_event.set()
+
+    def stop(self, timeout=3):
+        """写完剩余日志后停止写线程并关闭文件"""
+        if self._wake in self.store.listeners:
+            self.store.listeners.remove(self._wake)
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _wake(self):
+        """日志存储的监听回调（任意线程）：只设置事件，不做IO"""
+        self._wake_event.set()
+
+    def _writer_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait()
+            self._wake_event.clear()
+            self.flush()
+            # 攒一个间隔再写下一批：高频日志时每秒最多一次write
+            self._stop_event.wait(self.flush_interval_s)
+
+    def flush(self):
+        """把尚未写入的日志写入文件（写线程定期调用；APP进入后台时也可直接调用）"""
+        with self._flush_lock:
+            # 漏写的条数以日志存储实际挤掉的记录为准（合并重复的日志会跳号，序号不连续不代表丢失）
+            records, missed = self.store.read_since(self._last_seq)
+            if not records:
+                return 0
+            self._last_seq = records[-1].seq
+            lines = [format_line(record) for record in records]
+            if missed > 0:
+                self.total_missed += missed
+                lines.insert(0, f"{format_time(records[0].wall_time)}\tW\tlog\t⚠️ 写入跟不上，丢失{missed}条日志\n")
+            try:
+                self._write("".join(lines))
+            except OSError as e:
+                print(f"写入日志文件失败：{e}")
+                return 0
+            self.total_written += len(records)
+            return len(records)
+
+    def _write(self, text):
+        if self._file is None:
+            self._file = open(self.current_path, "a", encoding="utf-8")
+        self._file.write(text)
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """当前文件改名为带滚动时间的文件（可选压缩），删除超出数量的旧文件"""
+        self._file.close()
+        self._file = None
+        # 文件名：app.<滚动时间>-<序号>.log，同一秒内滚动多次（文件很小时）按序号区分，文件名排序即先后顺序
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = 0
+        while True:
+            rotated_path = os.path.join(self.directory, f"{ROTATED_PREFIX}{stamp}-{suffix:02d}.log")
+            if not (os.path.exists(rotated_path) or os.path.exists(rotated_path + ".gz")):
+                break
+            suffix += 1
+        os.replace(self.current_path, rotated_path)
+        if self.compress:
+            try:
+                with open(rotated_path, "rb") as src, gzip.open(rotated_path + ".gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(rotated_path)
+            except OSError as e:
+                print(f"压缩日志文件失败：{e}")
+        self.total_rotations += 1
+        files = list_log_files(self.directory)
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        return {
+            "directory": self.directory,
+            "files": len(list_log_files(self.directory)),
+            "total_written": self.total_written,
+            "total_missed": self.total_missed,
+            "total_rotations": self.total_rotations,
+        }
+
+
+# 全局日志文件写入器（APP启动时start，退出时stop）
+_LOG_FILE_SINK = None
+
+
+def get_log_directory():
+    """日志文件目录（应用私有目录下的logs/）"""
+    from storage import get_data_path
+    return os.path.dirname(get_data_path(os.path.join(LOG_DIRNAME, CURRENT_LOG_FILENAME)))
+
+
+# 日志检索专用的后台执行器（与历史数据查询分开：大文件检索不会挡住"加载更多"，反之亦然）
+_LOG_SEARCH_EXECUTOR = None
+
+
+def get_log_search_executor():
+    """获取（必要时创建）日志检索执行器（单个工作线程，首次提交时启动）"""
+    global _LOG_SEARCH_EXECUTOR
+    if _LOG_SEARCH_EXECUTOR is None:
+        from storage.query_executor import QueryExecutor
+        _LOG_SEARCH_EXECUTOR = QueryExecutor(name="log-search")
+    return _LOG_SEARCH_EXECUTOR
+
+
+def get_log_file_sink():
+    """获取（必要时创建）全局日志文件写入器，不自动启动"""
+    global _LOG_FILE_SINK
+    if _LOG_FILE_SINK is None:
+        _LOG_FILE_SINK = LogFileSink(get_log_directory())
+    return _LOG_FILE_SINK
@@ -0,0 +1,357 @@
+# log_store.py：结构化运行日志（全APP共用一个环形缓冲）
+# 每条日志是一条紧凑记录：墙上时间戳（time.time()浮点秒） + 级别 + 来源 + 消息模板 + 参数
+# 追加时不转日期、不拼字符串，只有日志页面真正显示某条记录时才格式化（结果缓存在记录上）
+# 时间戳不能用单调时钟换算：安卓休眠期间CLOCK_MONOTONIC停走，换算出的时间会落后休眠的时长；单调时钟只用于限速
+# 基于deque(maxlen)：追加O(1)，满时自动挤掉最旧一条，容量设到数千条也没有额外的追加开销
+# 按来源（类别）配置策略：与最近几条同类日志相同时合并为"×N"计数并移到末尾（不占新的一行），
+# 高频类别按令牌桶限速，超出的只计数，在下一条放行的日志上注明省略了多少条
+import datetime
+import threading
+import time
+from collections import deque
+
+LEVEL_DEBUG = 10
+LEVEL_INFO = 20
+LEVEL_WARNING = 30
+LEVEL_ERROR = 40
+LEVEL_NAMES = {
+    LEVEL_DEBUG: "调试",
+    LEVEL_INFO: "信息",
+    LEVEL_WARNING: "警告",
+    LEVEL_ERROR: "错误",
+}
+
+# 日志来源（同时是限速/合并策略的类别）
+SOURCE_APP = "app"             # 页面操作、APP生命周期
+SOURCE_MQTT = "mqtt"           # MQTT指令收发等
+SOURCE_MQTT_CONN = "mqtt.conn"  # MQTT连接、断线、重连
+SOURCE_MQTT_RX = "mqtt.rx"     # 收到消息的原始内容回显（高频）
+SOURCE_SENSOR = "sensor"       # 传感器数据更新（每帧一条，高频）
+
+# 合并方式：exact为模板和参数都相同才合并；template为模板相同即合并（显示最新一次的参数，如重连次数）
+COLLAPSE_NONE = None
+COLLAPSE_EXACT = "exact"
+COLLAPSE_TEMPLATE = "template"
+# 合并时最多往回查找的条数上限（日志列表据此识别被合并后移到末尾的行）
+MAX_COLLAPSE_WINDOW = 8
+
+# 默认容量（条）
+DEFAULT_LOG_CAPACITY = 5000
+
+
+class LogPolicy:
+    """一个类别的日志策略
+    collapse：合并重复日志的方式；window：往回查找最近几条（只看缓冲末尾，如重连循环中交替出现的2~3种日志）
+    rate_per_s/burst：令牌桶限速（每秒条数/突发条数），None为不限速
+    """
+
+    __slots__ = ("collapse", "window", "rate_per_s", "burst", "_tokens", "_refilled_at", "suppressed")
+
+    def __init__(self, collapse=COLLAPSE_EXACT, rate_per_s=None, burst=None, window=1):
+        self.collapse = collapse
+        self.window = max(1, min(window, MAX_COLLAPSE_WINDOW))
+        self.rate_per_s = rate_per_s
+        self.burst = burst if burst is not None else max(1, rate_per_s or 1)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self.suppressed = 0  # 上一条放行的日志之后被限速丢弃的条数
+
+    def allow(self, now):
+        """令牌桶：有令牌时放行并消耗一个"""
+        if self.rate_per_s is None:
+            return True
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        self.suppressed += 1
+        return False
+
+
+# 默认策略：原始消息回显每秒最多5条（突发20条）；传感器数据更新每秒最多1条（10Hz×多设备时不挤掉其它日志）；
+# 连接类日志在最近4条内按模板合并，重连循环只占几行；其它类别只合并与上一条完全相同的日志
+DEFAULT_POLICIES = {
+    SOURCE_MQTT_RX: {"rate_per_s": 5, "burst": 20},
+    SOURCE_SENSOR: {"rate_per_s": 1, "burst": 5},
+    SOURCE_MQTT_CONN: {"collapse": COLLAPSE_TEMPLATE, "window": 4},
+}
+
+
+def infer_level(text):
+    """按消息开头的图标推断级别（兼容原有的纯文本日志）"""
+    if text.startswith("❌"):
+        return LEVEL_ERROR
+    if text.startswith("⚠️"):
+        return LEVEL_WARNING
+    return LEVEL_INFO
+
+
+class Lazy:
+    """延迟求值的日志参数：格式化时才调用func(*args)（如原始payload -> 显示文本）"""
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+    def __eq__(self, other):
+        # 同一函数、同样参数即视为相同（合并重复日志时比较，不求值）
+        return isinstance(other, Lazy) and self.func == other.func and self.args == other.args
+
+    __hash__ = None
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+
+class LogRecord:
+    """一条日志：seq为全局递增序号（增量刷新用；合并重复时更新为最新序号），ts为time.time()秒
+    repeat为合并的次数（含本条），last_ts为最后一次出现的时间；suppressed为本条之前同类别被限速丢弃的条数
+    """
+
+    __slots__ = ("seq", "ts", "last_ts", "level", "source", "template", "args", "repeat", "suppressed", "_message")
+
+    def __init__(self, seq, ts, level, source, template, args):
+        self.seq = seq
+        self.ts = ts
+        self.last_ts = ts
+        self.level = level
+        self.source = source
+        self.template = template
+        self.args = args
+        self.repeat = 1
+        self.suppressed = 0
+        self._message = None
+
+    @property
+    def message(self):
+        """消息文本（第一次访问时按模板格式化；没有参数时模板即文本，含{}也不会被当作占位符）"""
+        if self._message is None:
+            if self.args:
+                try:
+                    self._message = self.template.format(*self.args)
+                except Exception as e:
+                    self._message = f"{self.template} {self.args!r}（格式化失败：{e}）"
+            else:
+                self._message = self.template
+        return self._message
+
+    @property
+    def display_message(self):
+        """带合并计数和限速说明的消息文本（计数会变化，不缓存）"""
+        message = self.message
+        if self.repeat > 1:
+            message = f"{message} ×{self.repeat}"
+        if self.suppressed:
+            message = f"{message}（此前省略{self.suppressed}条）"
+        return message
+
+    @property
+    def wall_time(self):
+        """最后一次出现的墙上时间"""
+        return datetime.datetime.fromtimestamp(self.last_ts)
+
+    def format(self):
+        """显示文本：[时:分:秒] 消息"""
+        return f"[{self.wall_time.strftime('%H:%M:%S')}] {self.display_message}"
+
+
+class LogStore:
+    """环形日志缓冲：任意线程追加，主线程读取
+    序号分配和入队在一把小锁内完成（保证缓冲内序号递增，增量读取不漏记录）；listeners在追加后同步调用（一次extend只调用一次）
+    listeners在追加日志的线程内调用，只能做线程安全的轻量操作（设置事件、发布到事件总线），界面刷新订阅事件总线
+    """
+
+    def __init__(self, capacity=DEFAULT_LOG_CAPACITY):
+        if capacity < 1:
+            raise ValueError("日志容量至少为1")
+        self._records = deque(maxlen=capacity)
+        # 被挤出缓冲的记录序号（递增）：读取方据此判断有没有漏读（合并重复会让序号跳号，不能按跳号推断）
+        # 与缓冲同容量：两次读取之间被挤掉超过容量条时，最多报告容量条
+        self._evicted_seqs = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        self.listeners = []
+        self._policies = {}
+        for source, options in DEFAULT_POLICIES.items():
+            self.set_policy(source, **options)
+        self._default_policy = LogPolicy()
+        self.total_collapsed = 0
+        self.total_suppressed = 0
+        self.total_evicted = 0
+
+    @property
+    def capacity(self):
+        return self._records.maxlen
+
+    def set_capacity(self, capacity):
+        """调整容量（保留最新的记录）"""
+        if capacity < 1:
+            raise ValueError("日志容量至少为1")
+        with self._lock:
+            for _ in range(len(self._records) - capacity):
+                self._evict_oldest()
+            self._records = deque(self._records, maxlen=capacity)
+            self._evicted_seqs = deque(self._evicted_seqs, maxlen=capacity)
+
+    def _evict_oldest(self):
+        """挤掉最旧的一条并记下序号（调用方持锁）"""
+        self._evicted_seqs.append(self._records.popleft().seq)
+        self.total_evicted += 1
+
+    def set_policy(self, source, collapse=COLLAPSE_EXACT, rate_per_s=None, burst=None, window=1):
+        """设置某个类别的合并/限速策略"""
+        with self._lock:
+            self._policies[source] = LogPolicy(collapse, rate_per_s, burst, window)
+
+    def _find_duplicate(self, policy, template, args, level, source):
+        """在缓冲末尾policy.window条内找可合并的日志，返回(倒数位置, 记录)，没有时返回(None, None)"""
+        records = self._records
+        for offset in range(1, min(policy.window, len(records)) + 1):
+            record = records[-offset]
+            if (record.source == source and record.level == level and record.template == template
+                    and (policy.collapse == COLLAPSE_TEMPLATE or record.args == args)):
+                return offset, record
+        return None, None
+
+    def _append(self, template, args, level, source):
+        """按策略合并/限速后分配序号并入队（调用方持锁）；被限速丢弃时返回None"""
+        now = time.monotonic()  # 限速用（不受系统改时间影响）
+        wall_now = time.time()
+        if level is None:
+            level = infer_level(template)
+        policy = self._policies.get(source, self._default_policy)
+        if policy.collapse:
+            offset, duplicate = self._find_duplicate(policy, template, args, level, source)
+            if duplicate is not None:
+                # 合并：计数加一，移到缓冲末尾并更新为最新序号（缓冲内序号保持递增），增量刷新时该行移到最后重绘
+                if offset > 1:
+                    del self._records[-offset]
+                    self._records.append(duplicate)
+                self.last_seq += 1
+                duplicate.seq = self.last_seq
+                duplicate.last_ts = wall_now
+                duplicate.repeat += 1
+                if duplicate.args != args:
+                    duplicate.args = args
+                    duplicate._message = None
+                self.total_collapsed += 1
+                return duplicate
+        if not policy.allow(now):
+            self.total_suppressed += 1
+            return None
+        self.last_seq += 1
+        record = LogRecord(self.last_seq, wall_now, level, source, template, args)
+        record.suppressed, policy.suppressed = policy.suppressed, 0
+        if len(self._records) == self._records.maxlen:
+            self._evict_oldest()
+        self._records.append(record)
+        return record
+
+    def add(self, template, *args, level=None, source=SOURCE_APP):
+        """追加一条日志（args非空时按str.format延迟格式化；level为None时按图标推断）
+        返回LogRecord（与上一条合并时为上一条），被限速丢弃时返回None
+        """
+        with self._lock:
+            record = self._append(template, args, level, source)
+        if record is not None:
+            self._notify()
+        return record
+
+    def extend(self, entries):
+        """一次追加多条 [(模板, 参数元组, 来源)]，监听者只通知一次"""
+        if not entries:
+            return
+        appended = False
+        with self._lock:
+            for template, args, source in entries:
+                appended = self._append(template, args, None, source) is not None or appended
+        if appended:
+            self._notify()
+
+    def _notify(self):
+        for listener in list(self.listeners):
+            try:
+                listener()
+            except Exception as e:
+                print(f"日志监听回调失败：{e}")
+
+    def __len__(self):
+        return len(self._records)
+
+    def latest(self, count):
+        """最新的count条（按时间正序）"""
+        records = []
+        with self._lock:  # 遍历期间不允许其它线程追加（deque迭代中被修改会抛异常）
+            for record in reversed(self._records):
+                if len(records) >= count:
+                    break
+                records.append(record)
+        records.reverse()
+        return records
+
+    def since(self, seq):
+        """序号大于seq的全部记录（按时间正序）：增量刷新时只遍历新增部分"""
+        records = []
+        with self._lock:
+            for record in reversed(self._records):
+                if record.seq <= seq:
+                    break
+                records.append(record)
+        records.reverse()
+        return records
+
+    def read_since(self, seq):
+        """增量读取：返回(序号大于seq的全部记录, 序号大于seq但读取前已被挤出缓冲的条数)，两者在同一把锁内取得"""
+        records = []
+        evicted = 0
+        with self._lock:
+            for record in reversed(self._records):
+                if record.seq <= seq:
+                    break
+                records.append(record)
+            for evicted_seq in reversed(self._evicted_seqs):
+                if evicted_seq <= seq:
+                    break
+                evicted += 1
+        records.reverse()
+        return records, evicted
+
+    def records(self):
+        """全部记录（按时间正序）的快照"""
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+        self._notify()
+
+    def get_stats(self):
+        return {
+            "capacity": self.capacity,
+            "size": len(self._records),
+            "total_logged": self.last_seq,
+            "total_collapsed": self.total_collapsed,
+            "total_suppressed": self.total_suppressed,
+            "total_evicted": self.total_evicted,
+        }
+
+
+def format_records(records, separator="\n"):
+    """记录列表 -> 显示文本"""
+    return separator.join(record.format() for record in records)
+
+
+# 全局日志存储
+_LOG_STORE = LogStore()
+
+
+def get_log_store():
+    """全局日志存储（MQTT网络线程、主线程、各页面共用）"""
+    return _LOG_STORE
@@ -4,9 +4,6 @@ kivy.require('2.2.1')  # 固定Kivy版本，避免兼容问题
 
 from kivy.config import Config
 
-# 全局变量：存储接收的数据（用于UI展示）
-recv_data_list = []
-
 # 配置手机端窗口（竖屏，适配手机分辨率）
 Config.set('graphics', 'width', '360')   # 手机宽度
 Config.set('graphics', 'height', '640')  # 手机高度
@@ -17,6 +14,8 @@ Config.set('graphics', 'fullscreen', '0')   # 非全屏（测试用，发布可
 from kivy.utils import platform
 from kivymd.app import MDApp
 from kivy.clock import Clock
+from log_store import get_log_store, format_records
+from event_bus import get_event_bus, EVENT_LOG_APPENDED
 
 # ========== 安卓权限申请（放在最前面，确保优先执行） ==========
 if platform == 'android':
@@ -55,14 +54,28 @@ class Esp32MobileApp(MDApp):
         self.mqtt_client = None
         self.page_container = None  # 页面容器
         self.current_page = None    # 当前页面
+        self.log_store = get_log_store()
+        self.me_page_log_lines = 20  # 个人中心显示的日志条数（build时取app_ui_pages中的配置）
+        self.me_page_log_label = None  # 个人中心显示期间的日志标签（离开页面时置空）
 
     def build(self):
         """程序构建入口：先创建UI，再分步初始化"""
         self.title = "水质监控APP"  # 手机端标题栏
         
         # 延迟加载业务模块（避免启动时加载过重）
-        from app_ui_pages import create_app_ui
+        from app_ui_pages import create_app_ui, ME_PAGE_LOG_LINES
+        self.me_page_log_lines = ME_PAGE_LOG_LINES
         main_layout = create_app_ui(self)
+
+        # 事件总线：各线程的通知每帧在主线程合并分发一次（个人中心显示期间订阅日志新增）
+        get_event_bus().start()
+
+        # 运行日志落盘（后台写线程，重启后仍可在日志页面检索）
+        try:
+            from log_file import get_log_file_sink
+            get_log_file_sink().start()
+        except Exception as e:
+            print(f"启动日志文件写入失败：{e}")
         
         # 分步初始化（按优先级，避免闪退）
         if platform == 'android':
@@ -86,61 +99,120 @@ class Esp32MobileApp(MDApp):
         
         return main_layout
 
+    def on_pause(self):
+        """APP进入后台：立即提交写缓冲（安卓可能随时杀进程）"""
+        try:
+            from storage import flush_sensor_storage
+            flush_sensor_storage()
+        except Exception as e:
+            print(f"提交数据库缓冲失败：{e}")
+        try:
+            from log_file import get_log_file_sink
+            get_log_file_sink().flush()
+        except Exception as e:
+            print(f"写入日志文件失败：{e}")
+        return True
+
+    def on_resume(self):
+        """APP回到前台：网络可能已经恢复，跳过退避等待立即重连"""
+        try:
+            if self.mqtt_client and not self.mqtt_client.connected:
+                self.mqtt_client.reconnect_now()
+        except Exception as e:
+            print(f"恢复MQTT连接失败：{e}")
+
+    def on_stop(self):
+        """APP退出：断开MQTT，写完队列中的数据并关闭数据库连接"""
+        try:
+            if self.mqtt_client:
+                self.mqtt_client.stop_mqtt()
+        except Exception as e:
+            print(f"断开MQTT失败：{e}")
+        try:
+            from storage import close_sensor_storage
+            close_sensor_storage()
+        except Exception as e:
+            print(f"关闭数据库失败：{e}")
+        try:
+            from log_file import get_log_file_sink
+            get_log_file_sink().stop()
+        except Exception as e:
+            print(f"关闭日志文件失败：{e}")
+
     def _init_mqtt_client(self):
         """初始化MQTT客户端（增加全量容错）"""
         try:
             # 延迟导入MQTT模块，避免启动时冲突
-            from esp32_mqtt_utils import Esp32MqttClient
-            from app_ui_pages import add_global_log
-            
+            from esp32_mqtt_utils import Esp32MqttClient, load_client_id, CLIENT_ID_FILENAME
+            from app_ui_pages import add_global_log, insert_backfill_batch_to_db, latest_stored_ts
+            from storage import get_data_path
+
+            # 指令发件箱：打开失败时退回内存发件箱（离线指令不跨重启保留）
+            try:
+                from storage import get_command_outbox
+                outbox = get_command_outbox()
+            except Exception as e:
+                print(f"打开指令发件箱失败：{e}")
+                outbox = None
+
             self.mqtt_client = Esp32MqttClient(
                 broker=self.mqtt_config["broker"],
                 port=self.mqtt_config["port"],
                 username=self.mqtt_config["username"],
                 password=self.mqtt_config["password"],
-                data_callback=self._update_recv_data
+                data_callback=self._update_recv_data,
+                outbox=outbox,
+                # 固定客户端ID + 持久会话：断线期间服务器缓存消息，重连后补发
+                client_id=load_client_id(get_data_path(CLIENT_ID_FILENAME)),
+                clean_session=False,
+                # 重连后请求设备补传已入库最新时间之后的数据，补传数据整块入库
+                backfill_since=latest_stored_ts
             )
+            self.mqtt_client.set_backfill_callback(insert_backfill_batch_to_db)
             # MQTT启动失败不影响APP运行
             self.mqtt_client.start_mqtt()
             add_global_log("✅ MQTT客户端初始化完成")  # 写入全局日志
         except Exception as e:
             error_msg = f"❌ MQTT初始化失败：{str(e)}"
-            # 容错：即使MQTT失败，也要写入日志，不崩溃
+            # 容错：即使MQTT失败，也要写入日志，不崩溃（日志存储已在模块加载时导入）
             try:
-                from app_ui_pages import add_global_log
-                add_global_log(error_msg)
+                self.log_store.add(error_msg)
                 self._update_recv_data(error_msg)
-            except:
+            except Exception:
                 print(error_msg)  # 最低级容错：打印到控制台
 
+    def attach_me_page_log(self, log_label):
+        """个人中心页面创建时调用：记住日志标签并订阅日志新增（重建页面时替换标签，订阅不重复）"""
+        self.me_page_log_label = log_label
+        get_event_bus().subscribe(EVENT_LOG_APPENDED, self._refresh_me_page_log)
+
+    def detach_me_page_log(self):
+        """离开个人中心时调用：取消订阅（否则离开后仍每帧刷新已不可见的标签）"""
+        get_event_bus().unsubscribe(EVENT_LOG_APPENDED, self._refresh_me_page_log)
+        self.me_page_log_label = None
+
+    def _refresh_me_page_log(self, events):
+        """事件总线订阅者（主线程，每帧最多一次）：个人中心日志显示最新几条（全量容错）"""
+        log_label = self.me_page_log_label
+        if log_label is None:
+            return
+        try:
+            log_label.text = format_records(self.log_store.latest(self.me_page_log_lines)) + "\n"
+            # 自动滚动到最新日志（判空）
+            if log_label.parent and hasattr(log_label.parent, 'scroll_y'):
+                log_label.parent.scroll_y = 0
+        except Exception as e:
+            print(f"更新日志失败：{e}")  # 容错：不崩溃
+
     def _update_recv_data(self, content):
-        """更新日志数据（线程安全+全量容错）"""
+        """MQTT客户端日志回调（经事件总线在主线程调用，本帧多条以换行连接）：连接状态变化时刷新个人中心
+        日志文本已由客户端写入日志存储，个人中心的日志显示随EVENT_LOG_APPENDED更新
+        """
         try:
-            # 1. 写入全局日志（手机日志页面可见）
-            from app_ui_pages import add_global_log
-            add_global_log(content)
-            
-            # 2. 原有逻辑：更新个人中心日志
-            global recv_data_list
-            recv_data_list.append(content)
-            # 限制日志条数，避免内存溢出
-            if len(recv_data_list) > 20:
-                recv_data_list = recv_data_list[-20:]
-            
-            # 更新个人中心的日志显示（增加多层判空）
-            if hasattr(self, 'current_page') and self.current_page:
-                for child in self.current_page.walk():
-                    if hasattr(child, 'is_log_label') and child.is_log_label:
-                        child.text = "\n".join(recv_data_list) + "\n"
-                        # 自动滚动到最新日志（判空）
-                        if child.parent and hasattr(child.parent, 'scroll_y'):
-                            child.parent.scroll_y = 0
-
-            # 更新个人中心连接状态（容错）
             if any(keyword in content for keyword in ["MQTT连接成功", "MQTT连接失败", "连接异常"]):
                 self.update_me_page_status()
         except Exception as e:
-            print(f"更新日志失败：{e}")  # 容错：不崩溃
+            print(f"更新连接状态失败：{e}")  # 容错：不崩溃
 
     def update_me_page_status(self):
         """更新个人中心的连接状态（增加容错）"""
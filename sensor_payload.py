@@ -0,0 +1,171 @@
+# sensor_payload.py：传感器消息格式（JSON / 紧凑二进制），按消息自动识别
+# 二进制格式（小端）：
+#   文件头 6字节：魔数b"SN" + 版本uint8 + 标志uint8 + 条数uint16
+#   标志含FLAG_TIMESTAMPS时：基准时间戳int64(epoch毫秒)，每条数据为 相对毫秒uint32 + do/ph/temp float32
+#   否则：每条数据为 do/ph/temp float32（12字节）
+# JSON格式：单条 {"do": 7.2, "ph": 7.0, "temp": 25.1}（保持不变）
+#   批量 [{"ts": 1767225600000, "do": 7.2, ...}, ...] 或 {"samples": [...]}（ts可省略，省略时取接收时刻）
+# 解码结果统一为SensorBatch（按列存储），一条消息无论多少条数据都整块处理
+import json
+import struct
+from functools import lru_cache
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+BINARY_MAGIC = b"SN"
+BINARY_VERSION = 1
+FLAG_TIMESTAMPS = 0x1
+
+# 预编译的结构体：解码时不再解析格式字符串
+_HEADER = struct.Struct("<2sBBH")
+_BASE_TS = struct.Struct("<q")
+_READING = struct.Struct("<fff")
+_TIMED_READING = struct.Struct("<Ifff")
+# 单条消息最多条数（uint16）
+MAX_BINARY_SAMPLES = 0xFFFF
+# 数据列名
+FIELDS = ("do", "ph", "temp")
+
+
+class SensorBatch:
+    """一条消息中的一组数据，按列存储：ts/do/ph/temp为等长列表
+    ts中的None表示消息未带时间戳（入库时取本机时间）；do/ph/temp中的None表示该条缺少此项
+    trace为延迟追踪的Trace（追踪关闭时为None）
+    """
+
+    __slots__ = ("ts", "do", "ph", "temp", "trace")
+
+    def __init__(self, ts, do, ph, temp):
+        self.ts = ts
+        self.do = do
+        self.ph = ph
+        self.temp = temp
+        self.trace = None
+
+    def __len__(self):
+        return len(self.do)
+
+    def latest(self):
+        """最后一条数据的字典（缺少的项不出现），空批次返回{}"""
+        if not len(self):
+            return {}
+        latest = {name: getattr(self, name)[-1] for name in FIELDS if getattr(self, name)[-1] is not None}
+        if self.ts[-1] is not None:
+            latest["ts"] = self.ts[-1]
+        return latest
+
+
+@lru_cache(maxsize=64)
+def _block_struct(record_format, count):
+    """count条定长记录整块解码用的结构体（按条数缓存，一次unpack得到全部字段）"""
+    return struct.Struct("<" + record_format * count)
+
+
+def is_binary_payload(payload):
+    """是否为二进制格式（按魔数判断；JSON必然以{、[或空白开头，不会与魔数冲突）"""
+    return payload[:2] == BINARY_MAGIC
+
+
+def encode_binary(readings, base_ts_ms=None):
+    """把读数编码为二进制消息（ESP32端格式的参考实现，也用于测试/基准/压测）
+    readings：[(do, ph, temp)]；base_ts_ms不为None时readings为[(ts_ms, do, ph, temp)]，时间戳相对基准存储
+    """
+    if len(readings) > MAX_BINARY_SAMPLES:
+        raise ValueError(f"单条消息最多{MAX_BINARY_SAMPLES}条数据")
+    if base_ts_ms is None:
+        parts = [_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(readings))]
+        parts.extend(_READING.pack(do, ph, temp) for do, ph, temp in readings)
+    else:
+        parts = [_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, FLAG_TIMESTAMPS, len(readings)),
+                 _BASE_TS.pack(base_ts_ms)]
+        parts.extend(_TIMED_READING.pack(ts_ms - base_ts_ms, do, ph, temp) for ts_ms, do, ph, temp in readings)
+    return b"".join(parts)
+
+
+def decode_binary(payload):
+    """解码二进制消息为SensorBatch：整块unpack后按步长切出各列，不逐条构造对象"""
+    if len(payload) < _HEADER.size:
+        raise ValueError("二进制消息长度不足")
+    magic, version, flags, count = _HEADER.unpack_from(payload)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f"不支持的二进制消息（版本{version}）")
+    offset = _HEADER.size
+    timed = flags & FLAG_TIMESTAMPS
+    if timed:
+        base_ts_ms = _BASE_TS.unpack_from(payload, offset)[0]
+        offset += _BASE_TS.size
+        record = _TIMED_READING
+    else:
+        record = _READING
+    if len(payload) - offset != count * record.size:
+        raise ValueError(f"二进制消息长度不符：声明{count}条，实际{(len(payload) - offset) // record.size}条")
+    if not count:
+        return SensorBatch([], [], [], [])
+    values = _block_struct("Ifff" if timed else "fff", count).unpack_from(payload, offset)
+    if timed:
+        ts = [base_ts_ms + offset_ms for offset_ms in values[0::4]]
+        return SensorBatch(ts, list(values[1::4]), list(values[2::4]), list(values[3::4]))
+    return SensorBatch([None] * count, list(values[0::3]), list(values[1::3]), list(values[2::3]))
+
+
+def _optional_float(value):
+    return None if value is None else float(value)
+
+
+def batch_from_json(data):
+    """JSON解析结果 -> SensorBatch（单条字典、数据列表或{"samples": [...]}），一次遍历完成校验和转换
+    任意一条格式错误时整条消息作废（抛出ValueError）
+    """
+    if isinstance(data, dict):
+        samples = data["samples"] if "samples" in data else [data]
+    else:
+        samples = data
+    if not isinstance(samples, list):
+        raise ValueError("数据格式错误：samples必须为列表")
+    ts, do, ph, temp = [], [], [], []
+    try:
+        for sample in samples:
+            sample_ts = sample.get("ts")
+            ts.append(None if sample_ts is None else int(sample_ts))
+            do.append(_optional_float(sample.get("do")))
+            ph.append(_optional_float(sample.get("ph")))
+            temp.append(_optional_float(sample.get("temp")))
+    except (TypeError, AttributeError) as e:
+        raise ValueError(f"数据格式错误：{e}")
+    return SensorBatch(ts, do, ph, temp)
+
+
+def batch_rows(device_id, batch, last_values):
+    """SensorBatch -> 入库行 [(device_id, ts_ms或None, do, ph, temp)]
+    按列补齐缺失项（沿用该设备上一条的值），last_values为该设备最近读数字典（含do/ph/temp），原地更新
+    """
+    do, ph, temp = last_values["do"], last_values["ph"], last_values["temp"]
+    rows = []
+    for ts_ms, do_value, ph_value, temp_value in zip(batch.ts, batch.do, batch.ph, batch.temp):
+        if do_value is not None:
+            do = do_value
+        if ph_value is not None:
+            ph = ph_value
+        if temp_value is not None:
+            temp = temp_value
+        rows.append((device_id, ts_ms, do, ph, temp))
+    last_values["do"], last_values["ph"], last_values["temp"] = do, ph, temp
+    return rows
+
+
+def decode_sensor_payload(payload):
+    """自动识别格式并解码，返回 (格式, SensorBatch)；格式错误时抛出ValueError（含JSONDecodeError）"""
+    if is_binary_payload(payload):
+        return FORMAT_BINARY, decode_binary(payload)
+    # json.loads直接接受bytes（自动识别UTF-8），省去一次decode
+    return FORMAT_JSON, batch_from_json(json.loads(payload))
+
+
+def payload_text(payload):
+    """日志中显示的消息内容（二进制消息只显示长度，不逐字节展开）"""
+    if isinstance(payload, str):
+        return payload
+    if is_binary_payload(payload):
+        return f"<二进制消息 {len(payload)}字节>"
+    return payload.decode("utf-8", errors="replace")
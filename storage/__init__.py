@@ -0,0 +1,118 @@
+# storage：传感器数据存储（统一接口 + 可替换后端）
+# sqlite：默认后端，WAL长连接 + 写线程批量提交 + 汇总表
+# memory：内存后端，用于测试和基准对比
+# binary：紧凑追加写二进制文件后端
+# 页面查询通过QueryExecutor在后台线程执行，结果经Clock回到主线程
+# MQTT指令发件箱（CommandOutbox）单独一个SQLite文件
+import threading
+
+from storage.base import (
+    StorageBackend, SensorSample, DEFAULT_PAGE_SIZE,
+    MINUTE_MS, HOUR_MS, ROLLUP_MINUTE, ROLLUP_HOUR,
+    datetime_to_ms, ms_to_datetime, day_range_ms,
+)
+from storage.paths import get_app_files_dir, get_data_path, get_db_path
+from storage.sqlite_backend import SQLiteBackend
+from storage.memory_backend import MemoryBackend
+from storage.binary_backend import BinaryFileBackend
+from storage.retention import RetentionPolicy, RetentionScheduler, DEFAULT_RETENTION_DAYS
+from storage.ring_buffer import RingBuffer, DEFAULT_RING_CAPACITY, RING_FILENAME
+from storage.query_executor import QueryExecutor, QueryRequest
+from storage.outbox import CommandOutbox, OutboxCommand, OUTBOX_FILENAME
+
+# 后端注册表：名称 -> 后端类
+BACKENDS = {
+    SQLiteBackend.name: SQLiteBackend,
+    MemoryBackend.name: MemoryBackend,
+    BinaryFileBackend.name: BinaryFileBackend,
+}
+DEFAULT_BACKEND = SQLiteBackend.name
+
+
+def create_backend(name=DEFAULT_BACKEND, path=None, **kwargs):
+    """按名称创建后端（未指定路径时使用应用私有目录下的默认文件），不自动启动"""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"未知的存储后端：{name}（可选：{', '.join(BACKENDS)}）")
+    if path is None and backend_cls.default_filename:
+        path = get_data_path(backend_cls.default_filename)
+    return backend_cls(path, **kwargs)
+
+
+# ========== 全局单例（整个APP共享一个后端实例/一个环形缓冲/一个查询执行器） ==========
+_STORAGE = None
+_RECENT_BUFFER = None
+_QUERY_EXECUTOR = None
+_OUTBOX = None
+_STORAGE_LOCK = threading.Lock()
+
+
+def get_sensor_storage(path=None, backend=DEFAULT_BACKEND):
+    """获取（必要时创建并启动）全局存储实例；参数只在首次创建时生效"""
+    global _STORAGE
+    with _STORAGE_LOCK:
+        if _STORAGE is None:
+            _STORAGE = create_backend(backend, path)
+        _STORAGE.start()
+        return _STORAGE
+
+
+def get_recent_buffer(capacity=DEFAULT_RING_CAPACITY):
+    """获取（必要时创建并打开）全局最近数据环形缓冲，文件与数据库在同一目录"""
+    global _RECENT_BUFFER
+    with _STORAGE_LOCK:
+        if _RECENT_BUFFER is None:
+            _RECENT_BUFFER = RingBuffer(get_data_path(RING_FILENAME), capacity)
+            _RECENT_BUFFER.open()
+        return _RECENT_BUFFER
+
+
+def get_query_executor():
+    """获取（必要时创建并启动）全局后台查询执行器"""
+    global _QUERY_EXECUTOR
+    with _STORAGE_LOCK:
+        if _QUERY_EXECUTOR is None:
+            _QUERY_EXECUTOR = QueryExecutor()
+            _QUERY_EXECUTOR.start()
+        return _QUERY_EXECUTOR
+
+
+def get_command_outbox():
+    """获取（必要时创建并打开）全局MQTT指令发件箱"""
+    global _OUTBOX
+    with _STORAGE_LOCK:
+        if _OUTBOX is None:
+            _OUTBOX = CommandOutbox(get_data_path(OUTBOX_FILENAME))
+            _OUTBOX.open()
+        return _OUTBOX
+
+
+def flush_sensor_storage(timeout=5):
+    """立即提交全局存储的写缓冲并同步环形缓冲（APP进入后台时调用）"""
+    with _STORAGE_LOCK:
+        storage = _STORAGE
+        recent_buffer = _RECENT_BUFFER
+    if recent_buffer is not None:
+        recent_buffer.flush()
+    if storage is not None:
+        return storage.flush(timeout)
+    return False
+
+
+def close_sensor_storage():
+    """关闭查询执行器、全局存储实例、环形缓冲和指令发件箱（APP退出时调用）"""
+    global _STORAGE, _RECENT_BUFFER, _QUERY_EXECUTOR, _OUTBOX
+    with _STORAGE_LOCK:
+        if _QUERY_EXECUTOR is not None:
+            _QUERY_EXECUTOR.stop()
+            _QUERY_EXECUTOR = None
+        if _STORAGE is not None:
+            _STORAGE.close()
+            _STORAGE = None
+        if _RECENT_BUFFER is not None:
+            _RECENT_BUFFER.close()
+            _RECENT_BUFFER = None
+        if _OUTBOX is not None:
+            _OUTBOX.close()
+            _OUTBOX = None
@@ -0,0 +1,217 @@
+# storage/base.py：存储后端接口 + 各后端共用的时间工具/常量
+import datetime
+import sqlite3
+import time
+from collections import namedtuple
+
+# 汇总粒度：时间桶起点见bucket_start_ms（小时桶对齐本地整点）
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+# 汇总数据源名称（SQLite后端中即汇总表名）
+ROLLUP_MINUTE = "sensor_rollup_minute"
+ROLLUP_HOUR = "sensor_rollup_hour"
+# 查询跨度超过这些阈值时改读汇总数据（返回行数与总数据量无关）
+RAW_QUERY_MAX_SPAN_MS = 3 * HOUR_MS
+MINUTE_QUERY_MAX_SPAN_MS = 3 * 24 * HOUR_MS
+# 默认分页大小
+DEFAULT_PAGE_SIZE = 100
+# 查询最新时间戳时的时间上界（足够远的未来）
+LATEST_TS_UPPER_MS = 2 ** 62
+
+# 查询返回的轻量行类型（元组，无额外对象开销；展示字符串由UI按需格式化）
+SensorSample = namedtuple("SensorSample", ["device_id", "ts", "do", "ph", "temp"])
+
+
+def open_sqlite_connection(db_path, check_same_thread=True):
+    """打开SQLite连接并设置PRAGMA（WAL日志 + NORMAL同步，WAL下NORMAL不会损坏数据库）；数据库和发件箱共用"""
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def datetime_to_ms(dt):
+    """本地时间datetime -> epoch毫秒"""
+    return int(dt.timestamp() * 1000)
+
+
+def ms_to_datetime(ts_ms):
+    """epoch毫秒 -> 本地时间datetime"""
+    return datetime.datetime.fromtimestamp(ts_ms / 1000.0)
+
+
+def day_range_ms(day):
+    """某一天（date）的本地时间范围 [当天0点, 次日0点)，单位epoch毫秒"""
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    return datetime_to_ms(start), datetime_to_ms(end)
+
+
+def _local_hour_offset_ms():
+    """本地时区UTC偏移中不足一小时的部分（毫秒）：整小时时区为0，UTC+5:30为30分钟"""
+    try:
+        return (time.localtime().tm_gmtoff * 1000) % HOUR_MS
+    except (AttributeError, TypeError):
+        return 0
+
+
+# 小时桶对齐偏移（进程启动时取一次）：整小时时区为0，即按epoch整点对齐；半小时/45分时区下桶起点仍是本地整点
+# 已写入的汇总不随之后的时区变更重新对齐（只影响改时区前后几个小时桶的起点）
+HOUR_ALIGN_OFFSET_MS = _local_hour_offset_ms()
+
+
+def bucket_start_ms(ts_ms, bucket_ms):
+    """时间戳所在汇总桶的起点（分钟桶按整分钟；小时桶按本地整点）"""
+    return ts_ms - (ts_ms + HOUR_ALIGN_OFFSET_MS) % bucket_ms
+
+
+def rollup_bucket_ms(table):
+    """汇总数据源对应的时间桶长度"""
+    return MINUTE_MS if table == ROLLUP_MINUTE else HOUR_MS
+
+
+def accumulate_rollup(cells, key, do, ph, temp):
+    """把一条数据累加进汇总单元 [count, do_min, do_max, do_sum, ph_min, ph_max, ph_sum, temp_min, temp_max, temp_sum]"""
+    cell = cells.get(key)
+    if cell is None:
+        cells[key] = [1, do, do, do, ph, ph, ph, temp, temp, temp]
+        return
+    cell[0] += 1
+    for offset, value in ((1, do), (4, ph), (7, temp)):
+        if value < cell[offset]:
+            cell[offset] = value
+        if value > cell[offset + 1]:
+            cell[offset + 1] = value
+        cell[offset + 2] += value
+
+
+def merge_rollup_cell(target, cell):
+    """合并两个汇总单元（多设备同一时间桶合并为一行）"""
+    target[0] += cell[0]
+    for offset in (1, 4, 7):
+        target[offset] = min(target[offset], cell[offset])
+        target[offset + 1] = max(target[offset + 1], cell[offset + 1])
+        target[offset + 2] += cell[offset + 2]
+
+
+def rollup_cells_to_rows(cells_by_bucket):
+    """{bucket_ts: 汇总单元} -> 与SQLite后端一致的汇总行（按时间桶倒序，sum换算为均值）"""
+    rows = []
+    for bucket_ts in sorted(cells_by_bucket, reverse=True):
+        count, do_min, do_max, do_sum, ph_min, ph_max, ph_sum, temp_min, temp_max, temp_sum = cells_by_bucket[bucket_ts]
+        rows.append((bucket_ts, count,
+                     do_min, do_max, do_sum / count,
+                     ph_min, ph_max, ph_sum / count,
+                     temp_min, temp_max, temp_sum / count))
+    return rows
+
+
+class StorageBackend:
+    """存储后端接口：写入只投递不阻塞，查询返回SensorSample/汇总元组
+    子类必须实现抛出NotImplementedError的方法；分页迭代、按跨度选源、按日查询由基类统一实现
+    """
+
+    name = "base"
+    # 默认数据文件名（在应用私有目录下），None表示不落盘
+    default_filename = None
+    # 最近一次本地打的时间戳
+    _last_local_ts = 0
+
+    def start(self):
+        """启动后端（重复调用无副作用）"""
+
+    def close(self, timeout=5):
+        """写完已投递的数据并释放资源"""
+
+    def insert_record(self, do, ph, temp, ts_ms=None, device_id=""):
+        """投递一条传感器数据，未指定时间戳时取调用时刻；返回实际使用的时间戳"""
+        raise NotImplementedError
+
+    def insert_batch(self, rows, on_commit=None):
+        """投递一批数据 [(device_id, ts_ms或None, do, ph, temp)]，返回各条实际使用的时间戳
+        on_commit()在这批数据真正写入后调用（可能在写线程中，只应做轻量工作，如延迟追踪打点）
+        默认逐条调用insert_record后立即回调；能整块提交的后端应覆盖此方法
+        """
+        ts_list = [self.insert_record(do, ph, temp, ts_ms=ts_ms, device_id=device_id)
+                   for device_id, ts_ms, do, ph, temp in rows]
+        if on_commit is not None:
+            on_commit()
+        return ts_list
+
+    def flush(self, timeout=5):
+        """立即提交所有已投递的数据，成功返回True"""
+        raise NotImplementedError
+
+    def clean_expired(self, cutoff_ms):
+        """删除cutoff_ms之前的原始数据"""
+        raise NotImplementedError
+
+    def clean_expired_rollups(self, minute_cutoff_ms, hour_cutoff_ms):
+        """删除过期的分钟/小时汇总数据"""
+        raise NotImplementedError
+
+    def get_stats(self):
+        """写入统计（至少包含pending_rows/last_flush_size/last_flush_latency_ms）"""
+        raise NotImplementedError
+
+    def query_page(self, start_ms, end_ms, limit=DEFAULT_PAGE_SIZE, after=None, device_id=None):
+        """分页查询[start_ms, end_ms)内的原始数据（按(ts, device_id)倒序）
+        after为上一页返回的游标；返回 (SensorSample列表, 下一页游标)，没有下一页时游标为None
+        """
+        raise NotImplementedError
+
+    def query_rollups(self, start_ms, end_ms, table=ROLLUP_HOUR, device_id=None):
+        """查询汇总数据（按时间桶倒序）
+        每行：(bucket_ts, count, do_min, do_max, do_avg, ph_min, ph_max, ph_avg, temp_min, temp_max, temp_avg)
+        """
+        raise NotImplementedError
+
+    def _local_ts_ms(self):
+        """本地时间戳，保持严格递增避免同一毫秒的两条数据冲突（调用方需持锁）"""
+        ts_ms = max(int(time.time() * 1000), self._last_local_ts + 1)
+        self._last_local_ts = ts_ms
+        return ts_ms
+
+    @property
+    def pending_rows(self):
+        """已投递但尚未提交的行数"""
+        return self.get_stats()["pending_rows"]
+
+    def iter_pages(self, start_ms, end_ms, page_size=DEFAULT_PAGE_SIZE, device_id=None):
+        """惰性逐页生成数据（只有取下一页时才查询）"""
+        cursor = None
+        while True:
+            samples, cursor = self.query_page(start_ms, end_ms, page_size, cursor, device_id)
+            if samples:
+                yield samples
+            if cursor is None:
+                return
+
+    def query_range(self, start_ms, end_ms, device_id=None):
+        """查询[start_ms, end_ms)内的全部原始数据（按时间倒序）"""
+        rows = []
+        for samples in self.iter_pages(start_ms, end_ms, device_id=device_id):
+            rows.extend(samples)
+        return rows
+
+    def query_series(self, start_ms, end_ms, device_id=None):
+        """按跨度自动选择数据源：短跨度读原始数据，长跨度读分钟/小时汇总
+        返回 (来源, 行列表)，来源为 "raw" / ROLLUP_MINUTE / ROLLUP_HOUR
+        """
+        span_ms = end_ms - start_ms
+        if span_ms <= RAW_QUERY_MAX_SPAN_MS:
+            return "raw", self.query_range(start_ms, end_ms, device_id)
+        table = ROLLUP_MINUTE if span_ms <= MINUTE_QUERY_MAX_SPAN_MS else ROLLUP_HOUR
+        return table, self.query_rollups(start_ms, end_ms, table, device_id)
+
+    def latest_ts(self, device_id=None, before_ms=None):
+        """已写入的最新一条数据的时间戳（device_id为None时不区分设备；before_ms只看更早的数据），没有数据时返回None"""
+        end_ms = LATEST_TS_UPPER_MS if before_ms is None else before_ms
+        samples, _ = self.query_page(0, end_ms, 1, device_id=device_id)
+        return samples[0].ts if samples else None
+
+    def query_by_date(self, target_date, device_id=None):
+        """查询某一天（date）的原始数据（按时间倒序）"""
+        start_ms, end_ms = day_range_ms(target_date)
+        return self.query_range(start_ms, end_ms, device_id)
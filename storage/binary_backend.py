@@ -0,0 +1,383 @@
+# storage/binary_backend.py：紧凑追加写二进制文件后端
+# 每条数据固定22字节（时间戳int64 + 设备序号uint16 + 3个float32），写入只追加，查询用mmap直接读文件
+# 写缓冲的定时追加和过期压缩在后台维护线程执行，调用方（主线程的定时清理等）不等待文件重写
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+from storage.base import (
+    StorageBackend, SensorSample, DEFAULT_PAGE_SIZE, ROLLUP_HOUR,
+    rollup_bucket_ms, bucket_start_ms, accumulate_rollup, rollup_cells_to_rows,
+)
+
+# 文件头：魔数、版本、标志位、保留
+_HEADER = struct.Struct("<4sHHQ")
+_MAGIC = b"SNSB"
+_VERSION = 1
+# 标志位：出现过乱序写入（时间戳比上一条小），此时查询退化为全文件扫描，过期清理时重新排序
+_FLAG_UNSORTED = 0x1
+_FLAGS_OFFSET = 6
+_RECORD = struct.Struct("<qHfff")
+_TS = struct.Struct("<q")
+
+# 写缓冲默认参数：攒够N条或距首条缓冲数据超过T毫秒即追加到文件
+DEFAULT_FLUSH_ROWS = 200
+DEFAULT_FLUSH_INTERVAL_MS = 1000
+
+# 维护线程任务类型
+_TASK_WAKE = "wake"    # 写缓冲有了新的截止时刻，重新计算等待时间
+_TASK_CLEAN = "clean"  # 过期压缩
+_TASK_STOP = "stop"
+
+
+class BinaryFileBackend(StorageBackend):
+    """追加写二进制文件后端：写入代价最低、文件最小；按时间有序时范围查询为二分查找
+    不做重复数据去重；汇总数据在查询时由保留的原始数据现算
+    """
+
+    name = "binary"
+    default_filename = "sensor_data.bin"
+
+    def __init__(self, path, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS):
+        self.path = path
+        self.devices_path = path + ".devices"
+        self.flush_rows = flush_rows
+        self.flush_interval_ms = flush_interval_ms
+        self._lock = threading.RLock()
+        self._file = None
+        self._flags = 0
+        self._last_ts = None
+        self._devices = []       # 序号 -> 设备ID
+        self._device_index = {}  # 设备ID -> 序号
+        self._buffer = bytearray()
+        self._buffer_rows = 0
+        self._commit_callbacks = []  # 随当前缓冲写入文件后调用的on_commit回调
+        self._buffer_deadline = None
+        self.last_flush_size = 0
+        self.last_flush_latency_ms = 0.0
+        self.total_flushes = 0
+        self.total_rows_written = 0
+        self.total_rows_expired = 0
+        self._tasks = queue.Queue()
+        self._worker_thread = None
+
+    def start(self):
+        """打开（必要时创建）数据文件，加载设备表，启动维护线程"""
+        with self._lock:
+            if self._file is not None:
+                return
+            self._open_file()
+            if not (self._worker_thread and self._worker_thread.is_alive()):
+                self._worker_thread = threading.Thread(target=self._worker_loop, name="SensorBinaryWriter",
+                                                       daemon=True)
+                self._worker_thread.start()
+
+    def _open_file(self):
+        """打开数据文件（调用方需持锁）"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < _HEADER.size:
+            with open(self.path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, 0, 0))
+        self._file = open(self.path, "r+b")
+        magic, version, self._flags, _ = _HEADER.unpack(self._file.read(_HEADER.size))
+        if magic != _MAGIC:
+            self._file.close()
+            self._file = None
+            raise ValueError(f"不是传感器数据文件：{self.path}")
+        # 截掉被杀进程时写了一半的记录
+        size = self._file.seek(0, os.SEEK_END)
+        usable = size - (size - _HEADER.size) % _RECORD.size
+        if usable != size:
+            self._file.truncate(usable)
+            self._file.seek(0, os.SEEK_END)
+        self._last_ts = None
+        if usable > _HEADER.size:
+            self._file.seek(usable - _RECORD.size)
+            self._last_ts = _TS.unpack(self._file.read(_TS.size))[0]
+            self._file.seek(0, os.SEEK_END)
+        self._devices = []
+        if os.path.exists(self.devices_path):
+            with open(self.devices_path, encoding="utf-8") as f:
+                self._devices = [line.rstrip("\n") for line in f]
+        self._device_index = {device_id: index for index, device_id in enumerate(self._devices)}
+
+    def close(self, timeout=5):
+        """停止维护线程（等进行中的压缩完成），写完缓冲并关闭文件"""
+        worker = self._worker_thread
+        if worker and worker.is_alive():
+            self._tasks.put((_TASK_STOP, None))
+            worker.join(timeout)
+        with self._lock:
+            if self._file is None:
+                return
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _device_number(self, device_id):
+        """设备ID -> 序号（新设备追加到设备表文件）"""
+        number = self._device_index.get(device_id)
+        if number is None:
+            number = len(self._devices)
+            with open(self.devices_path, "a", encoding="utf-8") as f:
+                f.write(device_id + "\n")
+            self._devices.append(device_id)
+            self._device_index[device_id] = number
+        return number
+
+    def insert_record(self, do, ph, temp, ts_ms=None, device_id=""):
+        """写入一条传感器数据（先进内存缓冲，攒够一批再追加到文件）"""
+        with self._lock:
+            self.start()
+            if ts_ms is None:
+                ts_ms = self._local_ts_ms()
+            if self._last_ts is not None and ts_ms < self._last_ts and not self._flags & _FLAG_UNSORTED:
+                self._set_flags(self._flags | _FLAG_UNSORTED)
+            self._last_ts = ts_ms if self._last_ts is None else max(self._last_ts, ts_ms)
+            self._buffer += _RECORD.pack(ts_ms, self._device_number(device_id), do, ph, temp)
+            self._buffer_rows += 1
+            now = time.monotonic()
+            if self._buffer_deadline is None:
+                self._buffer_deadline = now + self.flush_interval_ms / 1000.0
+                # 之后没有新数据时由维护线程按时追加
+                self._tasks.put((_TASK_WAKE, None))
+            if self._buffer_rows >= self.flush_rows or now >= self._buffer_deadline:
+                self._write_buffer()
+        return ts_ms
+
+    def insert_batch(self, rows, on_commit=None):
+        """投递一批数据（持一次锁逐条进缓冲），on_commit()在缓冲追加到文件后调用"""
+        with self._lock:
+            ts_list = [self.insert_record(do, ph, temp, ts_ms=ts_ms, device_id=device_id)
+                       for device_id, ts_ms, do, ph, temp in rows]
+            if on_commit is not None:
+                if self._buffer_rows:
+                    self._commit_callbacks.append(on_commit)
+                else:
+                    on_commit()
+            return ts_list
+
+    def _set_flags(self, flags):
+        """改写文件头标志位（调用方需持锁）"""
+        self._flags = flags
+        self._file.seek(_FLAGS_OFFSET)
+        self._file.write(struct.pack("<H", flags))
+        self._file.seek(0, os.SEEK_END)
+
+    def _write_buffer(self):
+        """把缓冲追加到文件（调用方需持锁）"""
+        if not self._buffer_rows:
+            return
+        start = time.perf_counter()
+        self._file.write(self._buffer)
+        self._file.flush()
+        self.last_flush_size = self._buffer_rows
+        self.last_flush_latency_ms = (time.perf_counter() - start) * 1000.0
+        self.total_flushes += 1
+        self.total_rows_written += self._buffer_rows
+        self._buffer.clear()
+        self._buffer_rows = 0
+        self._buffer_deadline = None
+        callbacks, self._commit_callbacks = self._commit_callbacks, []
+        for on_commit in callbacks:
+            on_commit()
+
+    def flush(self, timeout=5):
+        """把缓冲写入文件并同步到磁盘"""
+        with self._lock:
+            if self._file is None:
+                return False
+            self._write_buffer()
+            os.fsync(self._file.fileno())
+            return True
+
+    # ========== 维护线程 ==========
+    def _worker_loop(self):
+        """维护线程主循环：缓冲到期时追加到文件，执行过期压缩"""
+        while True:
+            with self._lock:
+                deadline = self._buffer_deadline
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                task, args = self._tasks.get(timeout=timeout)
+            except queue.Empty:
+                # 缓冲超时：追加当前窗口
+                try:
+                    with self._lock:
+                        if self._file is not None and self._buffer_deadline is not None \
+                                and time.monotonic() >= self._buffer_deadline:
+                            self._write_buffer()
+                except Exception as e:
+                    print(f"二进制数据文件写入失败：{e}")
+                continue
+            if task == _TASK_CLEAN:
+                try:
+                    self._compact(args)
+                except Exception as e:
+                    print(f"二进制数据文件压缩失败：{e}")
+            elif task == _TASK_STOP:
+                return
+
+    def get_stats(self):
+        """写入统计"""
+        with self._lock:
+            return {
+                "pending_rows": self._buffer_rows,
+                "last_flush_size": self.last_flush_size,
+                "last_flush_latency_ms": self.last_flush_latency_ms,
+                "total_flushes": self.total_flushes,
+                "total_rows_written": self.total_rows_written,
+                "total_rows_expired": self.total_rows_expired,
+            }
+
+    # ========== 读取 ==========
+    def _snapshot(self):
+        """写出缓冲后返回 (mmap, 记录数, 是否有序)；文件只有文件头时mmap为None"""
+        with self._lock:
+            self.start()
+            self._write_buffer()
+            sorted_records = not self._flags & _FLAG_UNSORTED
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                count = (size - _HEADER.size) // _RECORD.size
+                if count <= 0:
+                    return None, 0, sorted_records
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), count, sorted_records
+
+    @staticmethod
+    def _lower_bound(mm, count, ts_ms):
+        """有序文件中第一条时间戳 >= ts_ms 的记录序号（二分查找）"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _TS.unpack_from(mm, _HEADER.size + mid * _RECORD.size)[0] < ts_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _iter_records(self, mm, count, sorted_records, start_ms, end_ms, reverse=False):
+        """逐条生成[start_ms, end_ms]内的记录 (ts, 设备序号, do, ph, temp)"""
+        if not sorted_records:
+            view = memoryview(mm)[_HEADER.size:_HEADER.size + count * _RECORD.size]
+            for record in _RECORD.iter_unpack(view):
+                if start_ms <= record[0] <= end_ms:
+                    yield record
+            view.release()
+            return
+        lo = self._lower_bound(mm, count, start_ms)
+        hi = self._lower_bound(mm, count, end_ms + 1)
+        indexes = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+        for index in indexes:
+            yield _RECORD.unpack_from(mm, _HEADER.size + index * _RECORD.size)
+
+    def query_page(self, start_ms, end_ms, limit=DEFAULT_PAGE_SIZE, after=None, device_id=None):
+        """分页查询（有序文件从游标位置逆序读取，乱序文件全扫描）"""
+        cursor = min(after, (end_ms, "")) if after is not None else (end_ms, "")
+        mm, count, sorted_records = self._snapshot()
+        if mm is None:
+            return [], None
+        devices = self._devices
+        samples = []
+        try:
+            for ts_ms, number, do, ph, temp in self._iter_records(mm, count, sorted_records, start_ms, cursor[0], True):
+                # 有序文件逆序读取：凑够一页且时间戳已小于页内最早一条时即可停止
+                if sorted_records and len(samples) >= limit and ts_ms < samples[-1].ts:
+                    break
+                sample_device = devices[number]
+                if device_id is not None and sample_device != device_id:
+                    continue
+                if (ts_ms, sample_device) >= cursor:
+                    continue
+                samples.append(SensorSample(sample_device, ts_ms, do, ph, temp))
+        finally:
+            mm.close()
+        samples.sort(key=lambda sample: (sample.ts, sample.device_id), reverse=True)
+        del samples[limit:]
+        next_cursor = None
+        if len(samples) == limit:
+            last = samples[-1]
+            next_cursor = (last.ts, last.device_id)
+        return samples, next_cursor
+
+    def query_rollups(self, start_ms, end_ms, table=ROLLUP_HOUR, device_id=None):
+        """汇总查询：扫描范围内原始数据现算（多设备同一时间桶合并为一行）"""
+        bucket_ms = rollup_bucket_ms(table)
+        mm, count, sorted_records = self._snapshot()
+        if mm is None:
+            return []
+        wanted = self._device_index.get(device_id, -1) if device_id is not None else None
+        by_bucket = {}
+        try:
+            for ts_ms, number, do, ph, temp in self._iter_records(mm, count, sorted_records, start_ms, end_ms - 1):
+                if wanted is not None and number != wanted:
+                    continue
+                accumulate_rollup(by_bucket, bucket_start_ms(ts_ms, bucket_ms), do, ph, temp)
+        finally:
+            mm.close()
+        return rollup_cells_to_rows(by_bucket)
+
+    # ========== 过期清理 ==========
+    def clean_expired(self, cutoff_ms):
+        """投递过期压缩任务（维护线程执行，不阻塞调用方）"""
+        self.start()
+        self._tasks.put((_TASK_CLEAN, cutoff_ms))
+
+    def _compact(self, cutoff_ms):
+        """维护线程：压缩文件，只保留cutoff_ms之后的记录（乱序文件同时重新排序）
+        读旧文件、写新文件时不持锁（写入照常追加到旧文件）；最后持锁把期间追加的记录接到新文件末尾再替换
+        """
+        mm, count, sorted_records = self._snapshot()
+        if mm is None:
+            return
+        try:
+            body = memoryview(mm)[_HEADER.size:_HEADER.size + count * _RECORD.size]
+            if sorted_records:
+                first = self._lower_bound(mm, count, cutoff_ms)
+                kept = count - first
+                data = body[first * _RECORD.size:].tobytes()
+            else:
+                records = sorted(r for r in _RECORD.iter_unpack(body) if r[0] >= cutoff_ms)
+                kept = len(records)
+                data = b"".join(_RECORD.pack(*r) for r in records)
+            body.release()
+        finally:
+            mm.close()
+        if kept == count and sorted_records:
+            return
+        last_kept_ts = _TS.unpack_from(data, len(data) - _RECORD.size)[0] if data else None
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, 0, 0))
+            f.write(data)
+        with self._lock:
+            self._write_buffer()
+            self._file.seek(_HEADER.size + count * _RECORD.size)
+            tail = self._file.read()
+            # 期间追加的记录早于已保留的最后一条（或自身乱序）时，新文件标记为乱序
+            flags = 0
+            previous_ts = last_kept_ts
+            for record in _RECORD.iter_unpack(tail):
+                if previous_ts is not None and record[0] < previous_ts:
+                    flags = _FLAG_UNSORTED
+                    break
+                previous_ts = record[0]
+            with open(tmp_path, "r+b") as f:
+                f.seek(0, os.SEEK_END)
+                f.write(tail)
+                f.seek(_FLAGS_OFFSET)
+                f.write(struct.pack("<H", flags))
+                f.flush()
+                os.fsync(f.fileno())
+            last_ts = self._last_ts
+            self._file.close()
+            self._file = None
+            os.replace(tmp_path, self.path)
+            self._open_file()
+            self._last_ts = last_ts
+            self.total_rows_expired += count - kept
+
+    def clean_expired_rollups(self, minute_cutoff_ms, hour_cutoff_ms):
+        """汇总数据由原始数据现算，无需清理"""
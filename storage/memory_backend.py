@@ -0,0 +1,115 @@
+# storage/memory_backend.py：内存存储后端（不落盘，用于测试和基准对比）
+import bisect
+import threading
+
+from storage.base import (
+    StorageBackend, SensorSample, DEFAULT_PAGE_SIZE,
+    MINUTE_MS, HOUR_MS, ROLLUP_MINUTE, ROLLUP_HOUR,
+    accumulate_rollup, bucket_start_ms, merge_rollup_cell, rollup_cells_to_rows,
+)
+
+
+class MemoryBackend(StorageBackend):
+    """内存后端：按(ts, device_id)有序保存数据，写入立即可见，汇总在写入时增量维护"""
+
+    name = "memory"
+
+    def __init__(self, path=None):
+        # path参数仅为与其它后端保持一致的构造方式，内存后端不使用
+        self._lock = threading.Lock()
+        self._keys = []   # 有序的(ts, device_id)
+        self._values = {}  # (ts, device_id) -> (do, ph, temp)
+        self._rollups = {ROLLUP_MINUTE: {}, ROLLUP_HOUR: {}}  # 表名 -> {(device_id, bucket_ts): 汇总单元}
+        self.total_rows_written = 0
+        self.total_rows_expired = 0
+
+    def insert_record(self, do, ph, temp, ts_ms=None, device_id=""):
+        """写入一条传感器数据（同一设备同一毫秒的重复数据忽略）"""
+        with self._lock:
+            if ts_ms is None:
+                ts_ms = self._local_ts_ms()
+            key = (ts_ms, device_id)
+            if key in self._values:
+                return ts_ms
+            # 按时间顺序到达时insort等价于append
+            if not self._keys or key > self._keys[-1]:
+                self._keys.append(key)
+            else:
+                bisect.insort(self._keys, key)
+            self._values[key] = (do, ph, temp)
+            accumulate_rollup(self._rollups[ROLLUP_MINUTE], (device_id, bucket_start_ms(ts_ms, MINUTE_MS)),
+                              do, ph, temp)
+            accumulate_rollup(self._rollups[ROLLUP_HOUR], (device_id, bucket_start_ms(ts_ms, HOUR_MS)),
+                              do, ph, temp)
+            self.total_rows_written += 1
+        return ts_ms
+
+    def flush(self, timeout=5):
+        """内存后端写入即生效，无需提交"""
+        return True
+
+    def clean_expired(self, cutoff_ms):
+        """删除cutoff_ms之前的原始数据（有序列表直接截断）"""
+        with self._lock:
+            end = bisect.bisect_left(self._keys, (cutoff_ms, ""))
+            for key in self._keys[:end]:
+                del self._values[key]
+            del self._keys[:end]
+            self.total_rows_expired += end
+
+    def clean_expired_rollups(self, minute_cutoff_ms, hour_cutoff_ms):
+        """删除过期的分钟/小时汇总"""
+        with self._lock:
+            for table, cutoff_ms in ((ROLLUP_MINUTE, minute_cutoff_ms), (ROLLUP_HOUR, hour_cutoff_ms)):
+                cells = self._rollups[table]
+                for key in [key for key in cells if key[1] < cutoff_ms]:
+                    del cells[key]
+
+    def get_stats(self):
+        """写入统计（内存后端没有待提交数据）"""
+        with self._lock:
+            return {
+                "pending_rows": 0,
+                "last_flush_size": 0,
+                "last_flush_latency_ms": 0.0,
+                "total_flushes": 0,
+                "total_rows_written": self.total_rows_written,
+                "total_rows_expired": self.total_rows_expired,
+            }
+
+    def query_page(self, start_ms, end_ms, limit=DEFAULT_PAGE_SIZE, after=None, device_id=None):
+        """分页查询（从游标位置向前逆序扫描有序列表）"""
+        cursor = after if after is not None else (end_ms, "")
+        upper = min(cursor, (end_ms, ""))
+        samples = []
+        with self._lock:
+            index = bisect.bisect_left(self._keys, (upper[0], upper[1]))
+            while index > 0 and len(samples) < limit:
+                index -= 1
+                ts_ms, sample_device = self._keys[index]
+                if ts_ms < start_ms:
+                    break
+                if device_id is not None and sample_device != device_id:
+                    continue
+                do, ph, temp = self._values[(ts_ms, sample_device)]
+                samples.append(SensorSample(sample_device, ts_ms, do, ph, temp))
+        next_cursor = None
+        if len(samples) == limit:
+            last = samples[-1]
+            next_cursor = (last.ts, last.device_id)
+        return samples, next_cursor
+
+    def query_rollups(self, start_ms, end_ms, table=ROLLUP_HOUR, device_id=None):
+        """查询汇总数据（多设备同一时间桶合并为一行）"""
+        by_bucket = {}
+        with self._lock:
+            for (cell_device, bucket_ts), cell in self._rollups[table].items():
+                if bucket_ts < start_ms or bucket_ts >= end_ms:
+                    continue
+                if device_id is not None and cell_device != device_id:
+                    continue
+                if bucket_ts in by_bucket:
+                    merge_rollup_cell(by_bucket[bucket_ts], cell)
+                else:
+                    by_bucket[bucket_ts] = list(cell)
+        return rollup_cells_to_rows(by_bucket)
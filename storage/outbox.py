@@ -0,0 +1,153 @@
+# storage/outbox.py：MQTT指令发件箱（SQLite持久化）
+# 每条指令先入库再发送；离线时发出的指令保留在库中，重连后按提交顺序重发；收到确认后记录投递延迟
+import sqlite3
+import threading
+import time
+
+from storage.base import open_sqlite_connection
+
+OUTBOX_FILENAME = "command_outbox.db"
+# 已确认的指令保留条数（只用于查看最近的投递延迟）
+OUTBOX_KEEP_ACKED = 200
+
+# 指令状态
+STATUS_PENDING = "pending"  # 尚未确认（未发送或已发送未收到确认）
+STATUS_ACKED = "acked"      # 已确认送达服务器
+
+_CREATE_OUTBOX_SQL = """
+    CREATE TABLE IF NOT EXISTS command_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL,
+        payload BLOB NOT NULL,
+        qos INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        created_ms INTEGER NOT NULL,
+        sent_ms INTEGER,
+        acked_ms INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0
+    )
+"""
+_CREATE_STATUS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_command_outbox_status ON command_outbox(status, id)"
+_PRUNE_ACKED_SQL = """
+    DELETE FROM command_outbox WHERE status = 'acked' AND id NOT IN (
+        SELECT id FROM command_outbox WHERE status = 'acked' ORDER BY id DESC LIMIT ?
+    )
+"""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class OutboxCommand:
+    """一条待发送指令"""
+
+    __slots__ = ("command_id", "topic", "payload", "qos", "created_ms")
+
+    def __init__(self, command_id, topic, payload, qos, created_ms):
+        self.command_id = command_id
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.created_ms = created_ms
+
+
+class CommandOutbox:
+    """指令发件箱：MQTT指令线程入库/重发，网络线程回调时标记确认，所有操作在一把锁内完成（指令量很小）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def open(self):
+        """打开（必要时创建）发件箱，并清理过多的已确认记录"""
+        with self._lock:
+            if self._conn is not None:
+                return
+            self._conn = open_sqlite_connection(self.path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(_CREATE_OUTBOX_SQL)
+                self._conn.execute(_CREATE_STATUS_INDEX_SQL)
+                self._conn.execute(_PRUNE_ACKED_SQL, (OUTBOX_KEEP_ACKED,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def add(self, topic, payload, qos):
+        """新指令入库，返回OutboxCommand"""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        created_ms = _now_ms()
+        self.open()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO command_outbox (topic, payload, qos, status, created_ms) VALUES (?, ?, ?, ?, ?)",
+                (topic, sqlite3.Binary(payload), qos, STATUS_PENDING, created_ms))
+        return OutboxCommand(cursor.lastrowid, topic, payload, qos, created_ms)
+
+    def pending(self):
+        """全部未确认指令（按提交顺序）"""
+        self.open()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, topic, payload, qos, created_ms FROM command_outbox WHERE status = ? ORDER BY id",
+                (STATUS_PENDING,)).fetchall()
+        return [OutboxCommand(command_id, topic, bytes(payload), qos, created_ms)
+                for command_id, topic, payload, qos, created_ms in rows]
+
+    def expire(self, before_ms):
+        """删除提交时间早于before_ms的未确认指令（不再发送），返回被删除的指令ID（按提交顺序）"""
+        self.open()
+        with self._lock, self._conn:
+            expired_ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM command_outbox WHERE status = ? AND created_ms < ? ORDER BY id",
+                (STATUS_PENDING, before_ms))]
+            if expired_ids:
+                self._conn.execute(
+                    "DELETE FROM command_outbox WHERE status = ? AND created_ms < ?", (STATUS_PENDING, before_ms))
+        return expired_ids
+
+    def mark_sent(self, command_id):
+        """记录一次发送（重发会累加attempts）"""
+        self.open()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE command_outbox SET sent_ms = ?, attempts = attempts + 1 WHERE id = ?",
+                (_now_ms(), command_id))
+
+    def mark_acked(self, command_id):
+        """标记已送达，返回 (投递延迟毫秒：提交->确认, 发送延迟毫秒：最后一次发送->确认)"""
+        acked_ms = _now_ms()
+        self.open()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE command_outbox SET status = ?, acked_ms = ? WHERE id = ?",
+                (STATUS_ACKED, acked_ms, command_id))
+            row = self._conn.execute(
+                "SELECT created_ms, sent_ms FROM command_outbox WHERE id = ?", (command_id,)).fetchone()
+        if row is None:
+            return None, None
+        created_ms, sent_ms = row
+        return acked_ms - created_ms, (acked_ms - sent_ms) if sent_ms is not None else None
+
+    def get_stats(self, recent=20):
+        """待发条数和最近recent条已确认指令的平均投递延迟"""
+        self.open()
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM command_outbox WHERE status = ?", (STATUS_PENDING,)).fetchone()[0]
+            latency = self._conn.execute(
+                """SELECT AVG(acked_ms - created_ms), AVG(acked_ms - sent_ms), MAX(acked_ms - created_ms)
+                   FROM (SELECT acked_ms, created_ms, sent_ms FROM command_outbox
+                         WHERE status = ? ORDER BY id DESC LIMIT ?)""",
+                (STATUS_ACKED, recent)).fetchone()
+        return {
+            "pending": pending,
+            "avg_delivery_ms": latency[0],
+            "avg_ack_ms": latency[1],
+            "max_delivery_ms": latency[2],
+        }
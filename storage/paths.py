@@ -0,0 +1,52 @@
+# storage/paths.py：数据文件路径（兼容PC/安卓，优先使用应用私有目录）
+import os
+
+DB_FILENAME = "sensor_data.db"
+
+
+def _is_android():
+    """是否运行在安卓上（不强制依赖Kivy，方便在PC上无界面运行基准测试）"""
+    try:
+        from kivy.utils import platform
+        return platform == 'android'
+    except ImportError:
+        return 'ANDROID_ARGUMENT' in os.environ
+
+
+def get_app_files_dir():
+    """
+    获取应用数据目录
+    安卓端：使用应用私有存储（无需额外权限），避免读写外部存储的权限问题
+    PC端（Windows/Linux/Mac）：项目根目录
+    """
+    if _is_android():
+        # 安卓端：获取应用私有目录（推荐），比app_storage_path更稳定
+        from android import mActivity
+        # 获取应用内部存储目录（/data/data/esp32app/files/）
+        return mActivity.getApplicationContext().getFilesDir().getPath()
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_data_path(filename):
+    """获取应用数据目录下的文件路径（确保目录存在）"""
+    try:
+        data_path = os.path.join(get_app_files_dir(), filename)
+        # 确保目录存在（避免创建文件时报错）
+        data_dir = os.path.dirname(data_path)
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        return data_path
+    except Exception as e:
+        # 容错：返回当前目录（避免完全崩溃）
+        print(f"获取数据文件路径失败：{e}")
+        try:
+            from kivymd.toast import toast
+            toast(f"获取数据库路径失败：{str(e)}")
+        except Exception:
+            pass
+        return filename
+
+
+def get_db_path():
+    """获取数据库路径（兼容PC/安卓）"""
+    return get_data_path(DB_FILENAME)
@@ -0,0 +1,127 @@
+# storage/query_executor.py：后台查询执行器（读操作不占用Kivy主线程）
+# 查询在工作线程执行，结果通过Clock.schedule_once回到主线程；同一key的新请求会取消尚未完成的旧请求
+import queue
+import threading
+
+# 默认工作线程数：SQLite后端读连接串行访问，多线程只会排队，一个足够
+DEFAULT_QUERY_WORKERS = 1
+
+
+class QueryRequest:
+    """一次查询请求；cancel()后结果不会再回调（正在执行的查询会跑完，但结果被丢弃）"""
+
+    def __init__(self, func, args, kwargs, on_result, on_error, key):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_result = on_result
+        self.on_error = on_error
+        self.key = key
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class QueryExecutor:
+    """后台查询执行器
+    submit(func, ..., on_result=cb, key="history")：func在工作线程执行，cb(result)在主线程执行
+    """
+
+    def __init__(self, workers=DEFAULT_QUERY_WORKERS, schedule=None, name="sensor-query"):
+        self.workers = workers
+        self.name = name  # 工作线程名前缀
+        # schedule(callback)：把回调交给主线程执行；默认使用Kivy Clock（导入延迟到首次使用，便于无界面运行）
+        self._schedule = schedule
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latest = {}  # key -> 最新请求
+        self.total_submitted = 0
+        self.total_cancelled = 0
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=2):
+        """停止工作线程，未执行的请求全部取消"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            for request in self._latest.values():
+                request.cancel()
+            self._latest.clear()
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, func, *args, on_result=None, on_error=None, key=None, **kwargs):
+        """提交查询，返回QueryRequest；key相同的未完成旧请求会被取消（快速切换今日/昨日时只保留最后一次）"""
+        request = QueryRequest(func, args, kwargs, on_result, on_error, key)
+        with self._lock:
+            if key is not None:
+                previous = self._latest.get(key)
+                if previous is not None and not previous.cancelled:
+                    previous.cancel()
+                    self.total_cancelled += 1
+                self._latest[key] = request
+            self.total_submitted += 1
+        self.start()
+        self._queue.put(request)
+        return request
+
+    def cancel(self, key):
+        """取消某个key下未完成的请求（页面销毁时调用）"""
+        with self._lock:
+            request = self._latest.pop(key, None)
+        if request is not None and not request.cancelled:
+            request.cancel()
+            self.total_cancelled += 1
+
+    def _worker_loop(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            # 排队期间已被新请求取代：直接跳过，不执行查询
+            if request.cancelled:
+                continue
+            try:
+                result = request.func(*request.args, **request.kwargs)
+            except Exception as e:
+                self._deliver(request, request.on_error, e)
+            else:
+                self._deliver(request, request.on_result, result)
+
+    def _deliver(self, request, callback, value):
+        """在主线程执行回调；回调前再检查一次是否已取消"""
+        if request.cancelled:
+            return
+
+        def run(*args):
+            if request.cancelled:
+                return
+            self._forget(request)
+            if callback is not None:
+                callback(value)
+            elif isinstance(value, Exception):
+                print(f"后台查询失败：{value}")
+
+        if self._schedule is not None:
+            self._schedule(run)
+        else:
+            from kivy.clock import Clock
+            Clock.schedule_once(run, 0)
+
+    def _forget(self, request):
+        """请求已完成，从最新请求表中移除"""
+        with self._lock:
+            if request.key is not None and self._latest.get(request.key) is request:
+                del self._latest[request.key]
@@ -0,0 +1,86 @@
+# storage/retention.py：过期数据清理（定时执行，不在写入路径上）
+import datetime
+
+from storage.base import day_range_ms
+
+# 默认保留天数：2 = 今日 + 昨日（与历史数据页面的今日/昨日一致）
+DEFAULT_RETENTION_DAYS = 2
+# 汇总数据保留天数（汇总行数很少，可以保留很久，供长跨度历史查询）
+DEFAULT_MINUTE_ROLLUP_DAYS = 30
+DEFAULT_HOUR_ROLLUP_DAYS = 365
+# 默认清理间隔：每小时一次（另外在跨天时立即执行一次）
+DEFAULT_RETENTION_INTERVAL_S = 3600
+
+
+class RetentionPolicy:
+    """保留策略：原始数据保留最近keep_days个自然日（含今日），汇总数据按各自天数保留"""
+
+    def __init__(self, keep_days=DEFAULT_RETENTION_DAYS,
+                 minute_rollup_days=DEFAULT_MINUTE_ROLLUP_DAYS, hour_rollup_days=DEFAULT_HOUR_ROLLUP_DAYS):
+        if min(keep_days, minute_rollup_days, hour_rollup_days) < 1:
+            raise ValueError("保留天数至少为1（今日）")
+        self.keep_days = keep_days
+        self.minute_rollup_days = minute_rollup_days
+        self.hour_rollup_days = hour_rollup_days
+
+    @staticmethod
+    def _cutoff_for(days, today=None):
+        """保留days天时的截止时间（epoch毫秒）：最早保留日的0点"""
+        today = today or datetime.date.today()
+        first_kept_day = today - datetime.timedelta(days=days - 1)
+        start_ms, _ = day_range_ms(first_kept_day)
+        return start_ms
+
+    def cutoff_ms(self, today=None):
+        """原始数据截止时间，之前的数据全部过期"""
+        return self._cutoff_for(self.keep_days, today)
+
+    def rollup_cutoffs_ms(self, today=None):
+        """(分钟汇总截止时间, 小时汇总截止时间)"""
+        return (self._cutoff_for(self.minute_rollup_days, today),
+                self._cutoff_for(self.hour_rollup_days, today))
+
+
+class RetentionScheduler:
+    """按间隔 + 跨天时刻触发清理，实际删除由存储后端执行（SQLite后端在写线程分块执行）"""
+
+    def __init__(self, storage, policy=None, interval_s=DEFAULT_RETENTION_INTERVAL_S):
+        self.storage = storage
+        self.policy = policy or RetentionPolicy()
+        self.interval_s = interval_s
+        self._interval_event = None
+        self._rollover_event = None
+
+    def start(self):
+        """启动定时清理（启动时先执行一次）"""
+        from kivy.clock import Clock
+        self.stop()
+        self.run_now()
+        self._interval_event = Clock.schedule_interval(self.run_now, self.interval_s)
+        self._schedule_rollover()
+
+    def stop(self):
+        """停止定时清理"""
+        if self._interval_event is not None:
+            self._interval_event.cancel()
+            self._interval_event = None
+        if self._rollover_event is not None:
+            self._rollover_event.cancel()
+            self._rollover_event = None
+
+    def run_now(self, *args):
+        """立即投递一次清理任务（不阻塞调用线程）"""
+        self.storage.clean_expired(self.policy.cutoff_ms())
+        self.storage.clean_expired_rollups(*self.policy.rollup_cutoffs_ms())
+
+    def _schedule_rollover(self):
+        """在下一个0点（多等1秒避开边界）触发清理，之后重新预约"""
+        from kivy.clock import Clock
+        now = datetime.datetime.now()
+        next_midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+        delay = (next_midnight - now).total_seconds() + 1
+        self._rollover_event = Clock.schedule_once(self._on_rollover, delay)
+
+    def _on_rollover(self, *args):
+        self.run_now()
+        self._schedule_rollover()
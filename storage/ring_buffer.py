@@ -0,0 +1,158 @@
+# storage/ring_buffer.py：最近数据环形缓冲（内存映射文件，按列存储）
+# 时间戳/溶解氧/PH/温度各占一列定长数组，首页/图表直接读memoryview切片：无SQL、无逐条Python对象
+import mmap
+import os
+import struct
+import threading
+
+# 文件头：魔数、版本、保留、容量、累计写入条数（下一条写入位置 = 累计条数 % 容量）
+_HEADER = struct.Struct("<4sHHIQ")
+_HEADER_SIZE = 32  # 补齐到8字节对齐，保证各列可直接cast成int64/float64
+_MAGIC = b"SNRB"
+_VERSION = 1
+_TOTAL_OFFSET = 12
+_TOTAL = struct.Struct("<Q")
+_ITEM_SIZE = 8
+
+# 默认容量：10Hz采样约13分钟，文件约256KB
+DEFAULT_RING_CAPACITY = 8192
+RING_FILENAME = "sensor_recent.ring"
+# 列名（顺序即文件中的列顺序）
+COLUMNS = ("ts", "do", "ph", "temp")
+
+
+class RingBuffer:
+    """定长环形缓冲：单写多读，写入为4次定长赋值，读取返回按时间顺序的切片区间"""
+
+    def __init__(self, path, capacity=DEFAULT_RING_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._file = None
+        self._mm = None
+        self.total = 0  # 累计写入条数
+        self.ts = self.do = self.ph = self.temp = None
+
+    def open(self):
+        """打开（必要时创建）映射文件；已有文件容量不同时重建"""
+        with self._lock:
+            if self._mm is not None:
+                return
+            size = _HEADER_SIZE + self.capacity * _ITEM_SIZE * len(COLUMNS)
+            existing_ok = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) == size:
+                with open(self.path, "rb") as f:
+                    magic, version, _, capacity, _ = _HEADER.unpack(f.read(_HEADER.size))
+                existing_ok = magic == _MAGIC and version == _VERSION and capacity == self.capacity
+            if not existing_ok:
+                with open(self.path, "wb") as f:
+                    f.write(_HEADER.pack(_MAGIC, _VERSION, 0, self.capacity, 0))
+                    f.truncate(size)
+            self._file = open(self.path, "r+b")
+            self._mm = mmap.mmap(self._file.fileno(), size)
+            self.total = _TOTAL.unpack_from(self._mm, _TOTAL_OFFSET)[0]
+            view = memoryview(self._mm)
+            column_bytes = self.capacity * _ITEM_SIZE
+            columns = []
+            for index, name in enumerate(COLUMNS):
+                start = _HEADER_SIZE + index * column_bytes
+                columns.append(view[start:start + column_bytes].cast("q" if name == "ts" else "d"))
+            self.ts, self.do, self.ph, self.temp = columns
+
+    def close(self):
+        """同步并关闭映射文件"""
+        with self._lock:
+            if self._mm is None:
+                return
+            for column in (self.ts, self.do, self.ph, self.temp):
+                column.release()
+            self.ts = self.do = self.ph = self.temp = None
+            self._mm.flush()
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+            self._file = None
+
+    def flush(self):
+        """把映射内容同步到磁盘（APP进入后台时调用）"""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    def append(self, ts_ms, do, ph, temp):
+        """写入一条数据（覆盖最旧的一条）"""
+        with self._lock:
+            if self._mm is None:
+                return
+            index = self.total % self.capacity
+            self.ts[index] = ts_ms
+            self.do[index] = do
+            self.ph[index] = ph
+            self.temp[index] = temp
+            self.total += 1
+            _TOTAL.pack_into(self._mm, _TOTAL_OFFSET, self.total)
+
+    def extend(self, rows):
+        """写入一批数据 [(ts, do, ph, temp)]（持一次锁）"""
+        with self._lock:
+            if self._mm is None:
+                return
+            capacity = self.capacity
+            for ts_ms, do, ph, temp in rows:
+                index = self.total % capacity
+                self.ts[index] = ts_ms
+                self.do[index] = do
+                self.ph[index] = ph
+                self.temp[index] = temp
+                self.total += 1
+            _TOTAL.pack_into(self._mm, _TOTAL_OFFSET, self.total)
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def segments(self, count=None):
+        """最近count条（默认全部）在各列中的位置，按时间顺序返回至多两个[start, stop)区间
+        用法：for start, stop in ring.segments(n): ring.do[start:stop]（切片不复制数据）
+        """
+        size = len(self)
+        count = size if count is None else max(0, min(count, size))
+        if count == 0:
+            return []
+        end = self.total % self.capacity
+        start = end - count
+        if start >= 0:
+            return [(start, end)]
+        if end == 0:
+            return [(self.capacity + start, self.capacity)]
+        return [(self.capacity + start, self.capacity), (0, end)]
+
+    def count_since(self, since_ms):
+        """最近多少条数据的时间戳 >= since_ms（按写入顺序二分查找，时间戳需基本递增）"""
+        size = len(self)
+        lo, hi = 0, size  # 在按时间顺序的第[0, size)条中查找
+        oldest = (self.total - size) % self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[(oldest + mid) % self.capacity] < since_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return size - lo
+
+    def latest(self):
+        """最新一条数据 (ts, do, ph, temp)，没有数据时返回None"""
+        if self.total == 0 or self._mm is None:
+            return None
+        index = (self.total - 1) % self.capacity
+        return self.ts[index], self.do[index], self.ph[index], self.temp[index]
+
+    def mean(self, column, count=None):
+        """最近count条数据某一列的均值（直接在映射内存上计算）"""
+        values = getattr(self, column)
+        total = 0.0
+        n = 0
+        for start, stop in self.segments(count):
+            segment = values[start:stop]
+            total += sum(segment)
+            n += len(segment)
+        return total / n if n else None
@@ -0,0 +1,542 @@
+# storage/sqlite_backend.py：SQLite存储后端（单一长连接 + 独立写线程）
+# UI线程/MQTT线程只负责把数据行交给写线程，永远不直接等待磁盘
+import queue
+import threading
+import time
+
+from storage.base import (
+    StorageBackend, SensorSample, DEFAULT_PAGE_SIZE,
+    MINUTE_MS, HOUR_MS, ROLLUP_MINUTE, ROLLUP_HOUR, HOUR_ALIGN_OFFSET_MS, open_sqlite_connection,
+    accumulate_rollup, bucket_start_ms,
+)
+
+# 数据库结构版本（PRAGMA user_version）
+# v1：sensor_records，日期/时间为格式化TEXT，无索引
+# v2：sensor_samples，epoch毫秒整数时间戳 + 设备ID，按(device_id, ts)聚簇存储
+# v3：新增分钟/小时汇总表（min/max/sum/count），随批量写入同一事务维护
+SCHEMA_VERSION = 3
+# 迁移每批搬运的行数（每批一个事务，中途被杀进程下次启动会继续）
+MIGRATION_CHUNK_ROWS = 5000
+# 过期清理每批删除的行数（删不完的部分排到写队列末尾继续，期间新数据照常写入）
+RETENTION_CHUNK_ROWS = 2000
+
+# 固定SQL文本：sqlite3模块按文本缓存预编译语句，长连接下每条语句只编译一次
+_CREATE_SAMPLES_SQL = '''
+    CREATE TABLE IF NOT EXISTS sensor_samples (
+        device_id TEXT NOT NULL DEFAULT '',  -- 设备ID（单设备时为空字符串）
+        ts INTEGER NOT NULL,                 -- 采样时间（epoch毫秒）
+        do_value REAL,                       -- 溶解氧
+        ph_value REAL,                       -- PH值
+        temp_value REAL,                     -- 温度
+        PRIMARY KEY (device_id, ts)
+    ) WITHOUT ROWID
+'''
+# 跨设备的时间范围查询/过期清理走ts索引
+_CREATE_TS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_sensor_samples_ts ON sensor_samples (ts)"
+# 同一设备同一毫秒的重复数据（如设备重发）直接忽略
+_INSERT_SQL = '''
+    INSERT OR IGNORE INTO sensor_samples (device_id, ts, do_value, ph_value, temp_value)
+    VALUES (?, ?, ?, ?, ?)
+'''
+# 分页查询（keyset分页）：游标为上一页最后一行的(ts, device_id)，翻页代价与页码无关
+# 即 (ts, device_id) < (游标ts, 游标设备)；不用行值比较（需SQLite 3.15+，部分安卓系统自带的版本更旧），
+# 展开为 ts <= 游标ts（ts索引的范围上界）且 (ts < 游标ts 或 device_id < 游标设备)
+_QUERY_PAGE_SQL = '''
+    SELECT device_id, ts, do_value, ph_value, temp_value
+    FROM sensor_samples
+    WHERE ts >= ? AND ts <= ? AND (ts < ? OR device_id < ?)
+    ORDER BY ts DESC, device_id DESC
+    LIMIT ?
+'''
+_QUERY_DEVICE_PAGE_SQL = '''
+    SELECT device_id, ts, do_value, ph_value, temp_value
+    FROM sensor_samples
+    WHERE device_id = ? AND ts >= ? AND ts < ?
+    ORDER BY ts DESC
+    LIMIT ?
+'''
+# 汇总表：每个(设备, 时间桶)一行，均值 = sum / sample_count
+_CREATE_ROLLUP_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        device_id TEXT NOT NULL DEFAULT '',
+        bucket_ts INTEGER NOT NULL,          -- 时间桶起点（epoch毫秒）
+        sample_count INTEGER NOT NULL,
+        do_min REAL, do_max REAL, do_sum REAL,
+        ph_min REAL, ph_max REAL, ph_sum REAL,
+        temp_min REAL, temp_max REAL, temp_sum REAL,
+        PRIMARY KEY (device_id, bucket_ts)
+    ) WITHOUT ROWID
+'''
+_ROLLUP_COLUMNS = '''device_id, bucket_ts, sample_count,
+        do_min, do_max, do_sum, ph_min, ph_max, ph_sum, temp_min, temp_max, temp_sum'''
+# 增量汇总（常见情况：本批全部是新数据）：本批数据先在内存中按桶累加，再并入汇总表
+# 桶不存在时插入，已存在时累加count/sum、取min/max（不用UPSERT语法：需SQLite 3.24+）
+_ROLLUP_INSERT_SQL = {
+    table: f"INSERT OR IGNORE INTO {table} ({_ROLLUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    for table in (ROLLUP_MINUTE, ROLLUP_HOUR)
+}
+_ROLLUP_ACCUMULATE_SQL = {
+    table: f'''
+        UPDATE {table} SET sample_count = sample_count + ?,
+            do_min = MIN(do_min, ?), do_max = MAX(do_max, ?), do_sum = do_sum + ?,
+            ph_min = MIN(ph_min, ?), ph_max = MAX(ph_max, ?), ph_sum = ph_sum + ?,
+            temp_min = MIN(temp_min, ?), temp_max = MAX(temp_max, ?), temp_sum = temp_sum + ?
+        WHERE device_id = ? AND bucket_ts = ?
+    '''
+    for table in (ROLLUP_MINUTE, ROLLUP_HOUR)
+}
+# 本批有重复数据被忽略（INSERT OR IGNORE：设备重发、补传与已有数据重叠）时退回按桶重算，重复数据不会被重复计数
+# 只重算数据仍完整的桶：早于原始数据（分钟桶）/分钟汇总（小时桶）清理截止时间的桶不重算，
+# 否则迟到/补传的一条数据会让汇总被"只剩几条"的重算结果整体替换
+_ROLLUP_MINUTE_SQL = f'''
+    INSERT OR REPLACE INTO {ROLLUP_MINUTE} ({_ROLLUP_COLUMNS})
+    SELECT ?, ?, COUNT(*),
+           MIN(do_value), MAX(do_value), SUM(do_value),
+           MIN(ph_value), MAX(ph_value), SUM(ph_value),
+           MIN(temp_value), MAX(temp_value), SUM(temp_value)
+    FROM sensor_samples
+    WHERE device_id = ? AND ts >= ? AND ts < ?
+'''
+_ROLLUP_HOUR_SQL = f'''
+    INSERT OR REPLACE INTO {ROLLUP_HOUR} ({_ROLLUP_COLUMNS})
+    SELECT ?, ?, SUM(sample_count),
+           MIN(do_min), MAX(do_max), SUM(do_sum),
+           MIN(ph_min), MAX(ph_max), SUM(ph_sum),
+           MIN(temp_min), MAX(temp_max), SUM(temp_sum)
+    FROM {ROLLUP_MINUTE}
+    WHERE device_id = ? AND bucket_ts >= ? AND bucket_ts < ?
+'''
+# v2 -> v3：用已有原始数据一次性生成汇总
+_BACKFILL_ROLLUP_MINUTE_SQL = f'''
+    INSERT OR REPLACE INTO {ROLLUP_MINUTE} ({_ROLLUP_COLUMNS})
+    SELECT device_id, ts - ts % {MINUTE_MS}, COUNT(*),
+           MIN(do_value), MAX(do_value), SUM(do_value),
+           MIN(ph_value), MAX(ph_value), SUM(ph_value),
+           MIN(temp_value), MAX(temp_value), SUM(temp_value)
+    FROM sensor_samples
+    GROUP BY device_id, ts - ts % {MINUTE_MS}
+'''
+_BACKFILL_ROLLUP_HOUR_SQL = f'''
+    INSERT OR REPLACE INTO {ROLLUP_HOUR} ({_ROLLUP_COLUMNS})
+    SELECT device_id, bucket_ts - (bucket_ts + {HOUR_ALIGN_OFFSET_MS}) % {HOUR_MS}, SUM(sample_count),
+           MIN(do_min), MAX(do_max), SUM(do_sum),
+           MIN(ph_min), MAX(ph_max), SUM(ph_sum),
+           MIN(temp_min), MAX(temp_max), SUM(temp_sum)
+    FROM {ROLLUP_MINUTE}
+    GROUP BY device_id, bucket_ts - (bucket_ts + {HOUR_ALIGN_OFFSET_MS}) % {HOUR_MS}
+'''
+# 汇总查询：多设备时同一时间桶合并为一行
+_QUERY_ROLLUP_SQL = '''
+    SELECT bucket_ts, SUM(sample_count),
+           MIN(do_min), MAX(do_max), SUM(do_sum) / SUM(sample_count),
+           MIN(ph_min), MAX(ph_max), SUM(ph_sum) / SUM(sample_count),
+           MIN(temp_min), MAX(temp_max), SUM(temp_sum) / SUM(sample_count)
+    FROM {table}
+    WHERE bucket_ts >= ? AND bucket_ts < ? {device_filter}
+    GROUP BY bucket_ts
+    ORDER BY bucket_ts DESC
+'''
+_CLEAN_ROLLUP_SQL = "DELETE FROM {table} WHERE bucket_ts < ?"
+# 按ts索引分块删除：每次删除截止时间前最早的N条（与第N条同一时间戳的几条一并删除），避免一次大事务长时间占用写线程
+# 参数：(截止时间, 截止时间, N - 1, 截止时间)；不足N条时全部删除
+_CLEAN_EXPIRED_CHUNK_SQL = '''
+    DELETE FROM sensor_samples
+    WHERE ts < ? AND ts <= COALESCE(
+        (SELECT ts FROM sensor_samples WHERE ts < ? ORDER BY ts LIMIT 1 OFFSET ?), ?
+    )
+'''
+
+# v1 -> v2 迁移：旧数据只有秒级时间，同一秒内的多条按id顺序依次取该秒的第0、1、2...毫秒
+# （接在该秒已搬运的数据之后，跨批次也不会主键冲突）；时间为空或无法解析的行计数并打印
+_LEGACY_TABLE_EXISTS_SQL = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_records'"
+_LEGACY_CHUNK_END_SQL = "SELECT MAX(id) FROM (SELECT id FROM sensor_records ORDER BY id LIMIT ?)"
+_LEGACY_CHUNK_COUNT_SQL = "SELECT COUNT(*) FROM sensor_records WHERE id <= ?"
+_LEGACY_CHUNK_SQL = '''
+    SELECT CAST(strftime('%s', record_time, 'utc') AS INTEGER) AS seconds, do_value, ph_value, temp_value
+    FROM sensor_records
+    WHERE id <= ? AND seconds IS NOT NULL
+    ORDER BY seconds, id
+'''
+_LEGACY_SECOND_MAX_TS_SQL = "SELECT MAX(ts) FROM sensor_samples WHERE device_id = '' AND ts >= ? AND ts < ?"
+_LEGACY_DELETE_SQL = "DELETE FROM sensor_records WHERE id <= ?"
+
+
+# 写线程任务类型
+_TASK_INSERT = "insert"
+_TASK_INSERT_BATCH = "insert_batch"
+_TASK_CLEAN = "clean"
+_TASK_CLEAN_ROLLUPS = "clean_rollups"
+_TASK_FLUSH = "flush"
+_TASK_STOP = "stop"
+
+# 写缓冲默认参数：攒够N条或距首条缓冲数据超过T毫秒即批量提交（先到先触发）
+DEFAULT_FLUSH_ROWS = 200
+DEFAULT_FLUSH_INTERVAL_MS = 1000
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLite后端：写操作全部投递到独立写线程，读操作使用独立的只读长连接
+    写线程带写缓冲（write-behind）：多条数据合并为一个事务用executemany提交
+    """
+
+    name = "sqlite"
+    default_filename = "sensor_data.db"
+
+    def __init__(self, db_path, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS):
+        self.db_path = db_path
+        self.flush_rows = flush_rows
+        self.flush_interval_ms = flush_interval_ms
+        self._tasks = queue.Queue()
+        self._writer_thread = None
+        self._ready = threading.Event()
+        self._read_conn = None
+        self._read_lock = threading.Lock()
+        self.last_error = None
+        # 随当前写缓冲提交后要调用的on_commit回调（只在写线程内访问）
+        self._commit_callbacks = []
+        # 写缓冲统计（供UI/调试查看）
+        self._stats_lock = threading.Lock()
+        self._pending_rows = 0
+        self.last_flush_size = 0
+        self.last_flush_latency_ms = 0.0
+        self.total_flushes = 0
+        self.total_rows_written = 0   # 只计已提交的行
+        self.total_flush_failures = 0
+        self.total_rows_failed = 0    # 事务失败回滚、没有写入的行
+        self.total_rows_expired = 0
+        self.legacy_rows_migrated = 0
+        self.legacy_rows_skipped = 0  # v1迁移时时间为空/无法解析（或同一秒超过1000条）而未搬运的行
+        # 已开始清理的截止时间（只在写线程内访问）：更早的桶原始数据/分钟汇总可能已删除，不再重算
+        self._raw_cutoff_ms = 0
+        self._minute_cutoff_ms = 0
+
+    def start(self):
+        """启动写线程（重复调用无副作用）"""
+        if self._writer_thread and self._writer_thread.is_alive():
+            return
+        self._ready.clear()
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="SensorStorageWriter", daemon=True)
+        self._writer_thread.start()
+
+    def _writer_loop(self):
+        """写线程主循环：唯一持有写连接"""
+        try:
+            conn = open_sqlite_connection(self.db_path)
+            conn.execute(_CREATE_SAMPLES_SQL)
+            conn.execute(_CREATE_TS_INDEX_SQL)
+            conn.execute(_CREATE_ROLLUP_SQL.format(table=ROLLUP_MINUTE))
+            conn.execute(_CREATE_ROLLUP_SQL.format(table=ROLLUP_HOUR))
+            conn.commit()
+        except Exception as e:
+            self.last_error = e
+            print(f"数据库写线程初始化失败：{e}")
+            self._ready.set()
+            return
+        # 新表已就绪即可查询；旧数据迁移在写线程内分批进行，不阻塞APP启动
+        self._ready.set()
+        try:
+            self._migrate(conn)
+        except Exception as e:
+            self.last_error = e
+            print(f"旧数据迁移失败（下次启动继续）：{e}")
+
+        buffer = []
+        deadline = None  # 缓冲中首条数据的最晚提交时刻
+        cleaned_cutoff_ms = 0  # 已清理完成的截止时间，更早的清理任务直接跳过
+        while True:
+            if buffer:
+                timeout = max(0.0, deadline - time.monotonic())
+            else:
+                timeout = None
+            try:
+                task, args = self._tasks.get(timeout=timeout)
+            except queue.Empty:
+                # 缓冲超时：提交当前窗口
+                self._flush_buffer(conn, buffer)
+                deadline = None
+                continue
+
+            if task == _TASK_INSERT:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval_ms / 1000.0
+                buffer.append(args)
+                if len(buffer) >= self.flush_rows:
+                    self._flush_buffer(conn, buffer)
+                    deadline = None
+                continue
+
+            if task == _TASK_INSERT_BATCH:
+                # 一批数据整块进缓冲，随缓冲一起executemany
+                rows, on_commit = args
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval_ms / 1000.0
+                buffer.extend(rows)
+                if on_commit is not None:
+                    self._commit_callbacks.append(on_commit)
+                if len(buffer) >= self.flush_rows:
+                    self._flush_buffer(conn, buffer)
+                    deadline = None
+                continue
+
+            if task == _TASK_CLEAN:
+                # 清理只删除截止时间之前的数据，不影响缓冲中的新数据，无需先提交缓冲
+                cutoff_ms = args[0]
+                self._raw_cutoff_ms = max(self._raw_cutoff_ms, cutoff_ms)
+                if cutoff_ms <= cleaned_cutoff_ms:
+                    continue
+                try:
+                    with conn:
+                        deleted = conn.execute(
+                            _CLEAN_EXPIRED_CHUNK_SQL,
+                            (cutoff_ms, cutoff_ms, RETENTION_CHUNK_ROWS - 1, cutoff_ms)).rowcount
+                except Exception as e:
+                    self.last_error = e
+                    print(f"数据库清理失败：{e}")
+                    continue
+                with self._stats_lock:
+                    self.total_rows_expired += deleted
+                if deleted >= RETENTION_CHUNK_ROWS:
+                    # 还没删完：排到队尾继续，先让已排队的写入执行
+                    self._tasks.put((_TASK_CLEAN, args))
+                else:
+                    cleaned_cutoff_ms = cutoff_ms
+                continue
+
+            if task == _TASK_CLEAN_ROLLUPS:
+                # 汇总表每天每设备最多1440行，单条DELETE即可
+                self._minute_cutoff_ms = max(self._minute_cutoff_ms, args[0])
+                try:
+                    with conn:
+                        conn.execute(_CLEAN_ROLLUP_SQL.format(table=ROLLUP_MINUTE), (args[0],))
+                        conn.execute(_CLEAN_ROLLUP_SQL.format(table=ROLLUP_HOUR), (args[1],))
+                except Exception as e:
+                    self.last_error = e
+                    print(f"汇总数据清理失败：{e}")
+                continue
+
+            # 停止/强制提交前先提交缓冲，保证数据不丢
+            self._flush_buffer(conn, buffer)
+            deadline = None
+            if task == _TASK_STOP:
+                break
+            if task == _TASK_FLUSH:
+                args.set()
+        conn.close()
+
+    def _migrate(self, conn):
+        """按版本逐级迁移数据库结构（写线程内部调用）"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        if version < 2 and conn.execute(_LEGACY_TABLE_EXISTS_SQL).fetchone():
+            # v1 -> v2：把sensor_records分批搬到sensor_samples
+            while True:
+                chunk_end = conn.execute(_LEGACY_CHUNK_END_SQL, (MIGRATION_CHUNK_ROWS,)).fetchone()[0]
+                if chunk_end is None:
+                    break
+                # 搬运和删除在同一事务内，中途中断不会重复也不会丢
+                with conn:
+                    self._copy_legacy_chunk(conn, chunk_end)
+                    conn.execute(_LEGACY_DELETE_SQL, (chunk_end,))
+            conn.execute("DROP TABLE sensor_records")
+            if self.legacy_rows_skipped:
+                print(f"旧数据迁移完成：搬运{self.legacy_rows_migrated}条，"
+                      f"{self.legacy_rows_skipped}条时间为空或无法解析，未搬运")
+        if version < 3:
+            # v2 -> v3：为已有原始数据生成分钟/小时汇总
+            with conn:
+                conn.execute(_BACKFILL_ROLLUP_MINUTE_SQL)
+                conn.execute(_BACKFILL_ROLLUP_HOUR_SQL)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+    def _copy_legacy_chunk(self, conn, chunk_end):
+        """v1 -> v2 搬运一批（id <= chunk_end，调用方负责事务）：秒级时间 -> 该秒内不重复的毫秒时间戳"""
+        total = conn.execute(_LEGACY_CHUNK_COUNT_SQL, (chunk_end,)).fetchone()[0]
+        rows = []
+        second = None
+        next_ts = end_ts = 0
+        for seconds, do, ph, temp in conn.execute(_LEGACY_CHUNK_SQL, (chunk_end,)).fetchall():
+            if seconds != second:
+                # 新的一秒：接在该秒已搬运（上一批或中断前）的数据之后
+                second = seconds
+                start_ts, end_ts = seconds * 1000, seconds * 1000 + 1000
+                last_ts = conn.execute(_LEGACY_SECOND_MAX_TS_SQL, (start_ts, end_ts)).fetchone()[0]
+                next_ts = start_ts if last_ts is None else last_ts + 1
+            if next_ts >= end_ts:
+                continue  # 同一秒超过1000条（旧版每秒最多几条，实际不会出现）
+            rows.append(("", next_ts, do, ph, temp))
+            next_ts += 1
+        before = conn.total_changes
+        conn.executemany(_INSERT_SQL, rows)
+        migrated = conn.total_changes - before
+        self.legacy_rows_migrated += migrated
+        self.legacy_rows_skipped += total - migrated
+
+    def _flush_buffer(self, conn, buffer):
+        """把缓冲中的数据在一个事务内批量写入（写线程内部调用）"""
+        if not buffer:
+            return
+        size = len(buffer)
+        start = time.perf_counter()
+        committed = False
+        try:
+            with conn:
+                changes = conn.total_changes
+                conn.executemany(_INSERT_SQL, buffer)
+                self._update_rollups(conn, buffer, conn.total_changes - changes)
+            committed = True
+        except Exception as e:
+            self.last_error = e
+            print(f"数据库批量写入失败（{size}条）：{e}")
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        buffer.clear()
+        with self._stats_lock:
+            self._pending_rows -= size
+            self.last_flush_size = size
+            self.last_flush_latency_ms = latency_ms
+            self.total_flushes += 1
+            if committed:
+                self.total_rows_written += size
+            else:
+                self.total_flush_failures += 1
+                self.total_rows_failed += size
+        # 写入失败时不回调（数据没有提交）
+        callbacks, self._commit_callbacks = self._commit_callbacks, []
+        for on_commit in callbacks if committed else ():
+            try:
+                on_commit()
+            except Exception as e:
+                print(f"写入完成回调失败：{e}")
+
+    def _update_rollups(self, conn, rows, inserted):
+        """在写入事务内更新本批数据涉及的分钟桶和小时桶（写线程内部调用），inserted为实际写入的行数
+        全部写入且没有空值时按桶累加，代价只与本批行数有关（迟到的数据照常计入，清理过的桶也不例外）；
+        否则无法区分哪些行被忽略，退回按桶重算：早于清理截止时间的桶保留原有汇总（不会把完整的汇总替换成残缺的）
+        """
+        if inserted == len(rows) and not any(None in row for row in rows):
+            for table, bucket_ms in ((ROLLUP_MINUTE, MINUTE_MS), (ROLLUP_HOUR, HOUR_MS)):
+                cells = {}
+                for device_id, ts_ms, do, ph, temp in rows:
+                    accumulate_rollup(cells, (device_id, bucket_start_ms(ts_ms, bucket_ms)), do, ph, temp)
+                for (device_id, bucket), cell in cells.items():
+                    if not conn.execute(_ROLLUP_INSERT_SQL[table], (device_id, bucket, *cell)).rowcount:
+                        conn.execute(_ROLLUP_ACCUMULATE_SQL[table], (*cell, device_id, bucket))
+            return
+        minute_buckets = set()
+        hour_buckets = set()
+        for device_id, ts_ms, _, _, _ in rows:
+            minute_bucket = bucket_start_ms(ts_ms, MINUTE_MS)
+            if minute_bucket >= self._raw_cutoff_ms:
+                minute_buckets.add((device_id, minute_bucket))
+            hour_bucket = bucket_start_ms(ts_ms, HOUR_MS)
+            if hour_bucket >= self._minute_cutoff_ms:
+                hour_buckets.add((device_id, hour_bucket))
+        conn.executemany(_ROLLUP_MINUTE_SQL, [
+            (device_id, bucket, device_id, bucket, bucket + MINUTE_MS)
+            for device_id, bucket in minute_buckets
+        ])
+        conn.executemany(_ROLLUP_HOUR_SQL, [
+            (device_id, bucket, device_id, bucket, bucket + HOUR_MS)
+            for device_id, bucket in hour_buckets
+        ])
+
+    def insert_record(self, do, ph, temp, ts_ms=None, device_id=""):
+        """投递一条传感器数据（不阻塞调用线程，未指定时间戳时取调用时刻）"""
+        with self._stats_lock:
+            if ts_ms is None:
+                ts_ms = self._local_ts_ms()
+            self._pending_rows += 1
+        self._tasks.put((_TASK_INSERT, (device_id, ts_ms, do, ph, temp)))
+        return ts_ms
+
+    def insert_batch(self, rows, on_commit=None):
+        """投递一批数据（一个写线程任务，随缓冲一起批量提交），返回各条实际使用的时间戳
+        on_commit()在包含这批数据的事务提交后于写线程调用
+        """
+        with self._stats_lock:
+            rows = [(device_id, ts_ms if ts_ms is not None else self._local_ts_ms(), do, ph, temp)
+                    for device_id, ts_ms, do, ph, temp in rows]
+            self._pending_rows += len(rows)
+        if rows:
+            self._tasks.put((_TASK_INSERT_BATCH, (rows, on_commit)))
+        return [row[1] for row in rows]
+
+    def clean_expired(self, cutoff_ms):
+        """投递过期数据清理任务（分块删除cutoff_ms之前的数据）"""
+        self._tasks.put((_TASK_CLEAN, (cutoff_ms,)))
+
+    def clean_expired_rollups(self, minute_cutoff_ms, hour_cutoff_ms):
+        """投递汇总数据清理任务（汇总表保留时间比原始数据长）"""
+        self._tasks.put((_TASK_CLEAN_ROLLUPS, (minute_cutoff_ms, hour_cutoff_ms)))
+
+    def flush(self, timeout=5):
+        """立即提交写缓冲并等待完成（on_pause/on_stop调用，被杀进程最多丢一个窗口）"""
+        if not (self._writer_thread and self._writer_thread.is_alive()):
+            return False
+        done = threading.Event()
+        self._tasks.put((_TASK_FLUSH, done))
+        return done.wait(timeout)
+
+    def get_stats(self):
+        """写缓冲统计：最近一次提交的行数/耗时、待提交行数"""
+        with self._stats_lock:
+            return {
+                "pending_rows": self._pending_rows,
+                "last_flush_size": self.last_flush_size,
+                "last_flush_latency_ms": self.last_flush_latency_ms,
+                "total_flushes": self.total_flushes,
+                "total_rows_written": self.total_rows_written,
+                "total_flush_failures": self.total_flush_failures,
+                "total_rows_failed": self.total_rows_failed,
+                "total_rows_expired": self.total_rows_expired,
+            }
+
+    def query_page(self, start_ms, end_ms, limit=DEFAULT_PAGE_SIZE, after=None, device_id=None):
+        """分页查询[start_ms, end_ms)内的原始数据（按时间倒序）
+        after为上一页返回的游标；返回 (SensorSample列表, 下一页游标)，没有下一页时游标为None
+        """
+        self._ready.wait(5)
+        cursor_ts, cursor_device = after if after is not None else (end_ms, "")
+        with self._read_lock:
+            if self._read_conn is None:
+                self._read_conn = open_sqlite_connection(self.db_path, check_same_thread=False)
+            if device_id is None:
+                rows = self._read_conn.execute(
+                    _QUERY_PAGE_SQL, (start_ms, cursor_ts, cursor_ts, cursor_device, limit)).fetchall()
+            else:
+                rows = self._read_conn.execute(
+                    _QUERY_DEVICE_PAGE_SQL, (device_id, start_ms, min(cursor_ts, end_ms), limit)).fetchall()
+        samples = list(map(SensorSample._make, rows))
+        next_cursor = None
+        if len(samples) == limit:
+            last = samples[-1]
+            next_cursor = (last.ts, last.device_id)
+        return samples, next_cursor
+
+    def query_rollups(self, start_ms, end_ms, table=ROLLUP_HOUR, device_id=None):
+        """查询汇总数据（按时间桶倒序）
+        每行：(bucket_ts, count, do_min, do_max, do_avg, ph_min, ph_max, ph_avg, temp_min, temp_max, temp_avg)
+        """
+        self._ready.wait(5)
+        params = [start_ms, end_ms]
+        device_filter = ""
+        if device_id is not None:
+            device_filter = "AND device_id = ?"
+            params.append(device_id)
+        sql = _QUERY_ROLLUP_SQL.format(table=table, device_filter=device_filter)
+        with self._read_lock:
+            if self._read_conn is None:
+                self._read_conn = open_sqlite_connection(self.db_path, check_same_thread=False)
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def close(self, timeout=5):
+        """停止写线程（先写完队列中已有的数据）并关闭连接"""
+        if self._writer_thread and self._writer_thread.is_alive():
+            self._tasks.put((_TASK_STOP, None))
+            self._writer_thread.join(timeout)
+        self._writer_thread = None
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
@@ -0,0 +1,5 @@
+# 测试从仓库根目录导入APP模块（不依赖Kivy/paho的纯逻辑模块：存储、消息格式、队列、日志）
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
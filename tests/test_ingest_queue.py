@@ -0,0 +1,53 @@
+# 接收队列：两种背压策略
+import pytest
+
+from ingest_queue import IngestQueue, POLICY_COALESCE_LATEST, POLICY_DROP_OLDEST
+
+
+def test_drop_oldest_keeps_newest_items():
+    queue = IngestQueue(3, POLICY_DROP_OLDEST)
+    results = [queue.put(i) for i in range(5)]
+    assert results == [True, True, True, False, False]
+    assert queue.drain() == [2, 3, 4]
+    stats = queue.get_stats()
+    assert stats["total_dropped"] == 2
+    assert stats["max_depth"] == 3
+    assert stats["total_drained"] == 3
+    assert len(queue) == 0
+
+
+def test_drain_limit_leaves_rest_for_next_frame():
+    queue = IngestQueue(10, POLICY_DROP_OLDEST)
+    for i in range(5):
+        queue.put(i)
+    assert queue.drain(limit=2) == [0, 1]
+    assert queue.drain() == [2, 3, 4]
+    assert queue.drain() == []
+
+
+def test_coalesce_latest_keeps_one_item_per_key_in_first_arrival_order():
+    queue = IngestQueue(10, POLICY_COALESCE_LATEST)
+    queue.put("a1", key="a")
+    queue.put("b1", key="b")
+    assert queue.put("a2", key="a") is False
+    assert queue.drain() == ["a2", "b1"]
+    assert queue.get_stats()["total_coalesced"] == 1
+
+    # 取走后同一key重新排队
+    queue.put("a3", key="a")
+    assert queue.drain() == ["a3"]
+
+
+def test_coalesce_latest_drops_oldest_key_when_full():
+    queue = IngestQueue(2, POLICY_COALESCE_LATEST)
+    queue.put("a1", key="a")
+    queue.put("b1", key="b")
+    assert queue.put("c1", key="c") is False
+    assert queue.drain() == ["b1", "c1"]
+    assert queue.get_stats()["total_dropped"] == 1
+
+
+@pytest.mark.parametrize("maxlen, policy", [(0, POLICY_DROP_OLDEST), (10, "unknown")])
+def test_invalid_configuration(maxlen, policy):
+    with pytest.raises(ValueError):
+        IngestQueue(maxlen, policy)
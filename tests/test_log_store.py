@@ -0,0 +1,90 @@
+# 日志存储：重复合并、按类别限速、增量读取
+from log_store import (
+    COLLAPSE_TEMPLATE, LEVEL_ERROR, LEVEL_WARNING, SOURCE_APP, LogStore, Lazy, format_records,
+)
+
+
+def test_identical_lines_collapse_into_counter():
+    store = LogStore(10)
+    store.add("连接成功")
+    store.add("连接成功")
+    store.add("连接成功")
+    (record,) = store.records()
+    assert record.repeat == 3
+    assert record.display_message == "连接成功 ×3"
+    assert store.get_stats()["total_collapsed"] == 2
+
+
+def test_template_collapse_within_window_moves_record_to_end():
+    store = LogStore(10)
+    store.set_policy("conn", collapse=COLLAPSE_TEMPLATE, window=3)
+    store.add("第{}次重连", 1, source="conn")
+    store.add("等待{}秒", 2, source="conn")
+    store.add("第{}次重连", 2, source="conn")
+    messages = [record.display_message for record in store.records()]
+    assert messages == ["等待2秒", "第2次重连 ×2"]
+    # 合并后的记录取最新序号，缓冲内序号保持递增
+    seqs = [record.seq for record in store.records()]
+    assert seqs == sorted(seqs)
+    assert seqs[-1] == store.last_seq
+
+
+def test_different_args_do_not_collapse_by_default():
+    store = LogStore(10)
+    store.add("收到{}", 1)
+    store.add("收到{}", 2)
+    assert [record.message for record in store.records()] == ["收到1", "收到2"]
+
+
+def test_rate_limit_counts_suppressed_lines(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("log_store.time.monotonic", lambda: now[0])
+    store = LogStore(100)
+    store.set_policy("rx", collapse=None, rate_per_s=1, burst=2)
+    added = [store.add("消息{}", i, source="rx") for i in range(5)]
+    assert [record is not None for record in added] == [True, True, False, False, False]
+    assert store.get_stats()["total_suppressed"] == 3
+
+    # 令牌恢复后放行的下一条注明此前省略的条数
+    now[0] += 1.0
+    record = store.add("消息{}", 5, source="rx")
+    assert record.suppressed == 3
+    assert record.display_message == "消息5（此前省略3条）"
+
+
+def test_read_since_reports_evicted_records():
+    store = LogStore(3)
+    for i in range(3):
+        store.add("第{}条", i)
+    last_seq = store.last_seq
+    for i in range(3, 7):
+        store.add("第{}条", i)
+    records, evicted = store.read_since(last_seq)
+    assert [record.message for record in records] == ["第4条", "第5条", "第6条"]
+    assert evicted == 1
+    assert store.read_since(store.last_seq) == ([], 0)
+
+
+def test_level_inferred_from_icon_and_lazy_args():
+    store = LogStore(10)
+    calls = []
+
+    def render(value):
+        calls.append(value)
+        return value.upper()
+
+    error = store.add("❌ 失败：{}", Lazy(render, "abc"))
+    warning = store.add("⚠️ 注意")
+    assert (error.level, warning.level) == (LEVEL_ERROR, LEVEL_WARNING)
+    assert calls == []  # 显示前不求值
+    assert error.message == "❌ 失败：ABC"
+    assert "⚠️ 注意" in format_records(store.latest(1))
+
+
+def test_listeners_notified_once_per_extend():
+    store = LogStore(10)
+    notified = []
+    store.listeners.append(lambda: notified.append(1))
+    store.extend([("a", (), SOURCE_APP), ("b", (), SOURCE_APP)])
+    store.add("c")
+    assert len(notified) == 2
@@ -0,0 +1,65 @@
+# 指令发件箱：按提交顺序重发、确认后移出、积压过期
+from storage.outbox import CommandOutbox
+
+
+def _open(tmp_path):
+    outbox = CommandOutbox(str(tmp_path / "command_outbox.db"))
+    outbox.open()
+    return outbox
+
+
+def test_pending_commands_replay_in_submit_order(tmp_path):
+    outbox = _open(tmp_path)
+    commands = [outbox.add("esp32/switch", payload, 1) for payload in ("yes", "no", b"\x01\x02")]
+    outbox.mark_sent(commands[0].command_id)
+    outbox.mark_acked(commands[1].command_id)
+
+    pending = outbox.pending()
+    assert [command.command_id for command in pending] == [commands[0].command_id, commands[2].command_id]
+    assert [command.payload for command in pending] == [b"yes", b"\x01\x02"]
+    assert outbox.get_stats()["pending"] == 2
+
+
+def test_pending_commands_survive_reopen(tmp_path):
+    outbox = _open(tmp_path)
+    first = outbox.add("a", "1", 1)
+    second = outbox.add("b", "2", 0)
+    outbox.close()
+
+    outbox = _open(tmp_path)
+    pending = outbox.pending()
+    assert [(command.command_id, command.topic, command.qos) for command in pending] == [
+        (first.command_id, "a", 1), (second.command_id, "b", 0),
+    ]
+    # 重开后新指令排在遗留指令之后
+    third = outbox.add("c", "3", 1)
+    assert [command.command_id for command in outbox.pending()][-1] == third.command_id
+    outbox.close()
+
+
+def test_mark_acked_reports_delivery_latency(tmp_path):
+    outbox = _open(tmp_path)
+    command = outbox.add("a", "1", 1)
+    outbox.mark_sent(command.command_id)
+    delivery_ms, ack_ms = outbox.mark_acked(command.command_id)
+    assert delivery_ms >= 0 and ack_ms >= 0
+    assert outbox.pending() == []
+    assert outbox.get_stats()["avg_delivery_ms"] is not None
+
+
+def test_expire_removes_only_old_pending_commands(tmp_path, monkeypatch):
+    now = [1_000_000]
+    monkeypatch.setattr("storage.outbox._now_ms", lambda: now[0])
+    outbox = _open(tmp_path)
+    old = outbox.add("a", "old", 1)
+    acked = outbox.add("a", "acked", 1)
+    outbox.mark_acked(acked.command_id)
+    now[0] += 60_000
+    fresh = outbox.add("a", "fresh", 1)
+
+    assert outbox.expire(fresh.created_ms) == [old.command_id]
+    assert [command.command_id for command in outbox.pending()] == [fresh.command_id]
+    assert outbox.expire(fresh.created_ms) == []
+    # 已确认的指令不受影响
+    assert outbox.expire(fresh.created_ms + 1) == [fresh.command_id]
+    assert outbox.get_stats()["pending"] == 0
@@ -0,0 +1,74 @@
+# 传感器消息格式：二进制/JSON编解码往返、格式识别、错误消息
+import json
+
+import pytest
+
+from sensor_payload import (
+    FORMAT_BINARY, FORMAT_JSON, batch_rows, decode_sensor_payload, encode_binary, payload_text,
+)
+
+
+def _columns(batch):
+    return batch.ts, batch.do, batch.ph, batch.temp
+
+
+def test_binary_round_trip_with_timestamps():
+    readings = [(1_700_000_000_000, 7.25, 7.0, 25.5), (1_700_000_000_500, 6.5, 7.5, 24.0)]
+    fmt, batch = decode_sensor_payload(encode_binary(readings, readings[0][0]))
+    assert fmt == FORMAT_BINARY
+    assert len(batch) == 2
+    # float32存储：取值均为二进制可精确表示的数
+    assert _columns(batch) == ([1_700_000_000_000, 1_700_000_000_500], [7.25, 6.5], [7.0, 7.5], [25.5, 24.0])
+    assert batch.latest() == {"do": 6.5, "ph": 7.5, "temp": 24.0, "ts": 1_700_000_000_500}
+
+
+def test_binary_round_trip_without_timestamps():
+    fmt, batch = decode_sensor_payload(encode_binary([(7.25, 7.0, 25.5)]))
+    assert fmt == FORMAT_BINARY
+    assert _columns(batch) == ([None], [7.25], [7.0], [25.5])
+
+
+def test_empty_binary_batch():
+    _, batch = decode_sensor_payload(encode_binary([], 0))
+    assert len(batch) == 0
+
+
+def test_truncated_binary_payload_is_rejected():
+    payload = encode_binary([(1.0, 2.0, 3.0), (4.0, 5.0, 6.0)])
+    with pytest.raises(ValueError):
+        decode_sensor_payload(payload[:-1])
+    with pytest.raises(ValueError):
+        decode_sensor_payload(payload[:3])
+
+
+@pytest.mark.parametrize("data", [
+    {"do": 7.25, "ph": 7.0, "temp": 25.5},
+    [{"do": 7.25, "ph": 7.0, "temp": 25.5}],
+    {"samples": [{"do": 7.25, "ph": 7.0, "temp": 25.5}]},
+])
+def test_json_single_and_batch_forms(data):
+    fmt, batch = decode_sensor_payload(json.dumps(data).encode("utf-8"))
+    assert fmt == FORMAT_JSON
+    assert _columns(batch) == ([None], [7.25], [7.0], [25.5])
+
+
+def test_json_round_trip_keeps_timestamps_and_missing_fields():
+    samples = [{"ts": 1000, "do": 7.0, "ph": 7.1}, {"ts": 2000, "temp": 26.0}]
+    _, batch = decode_sensor_payload(json.dumps(samples))
+    assert _columns(batch) == ([1000, 2000], [7.0, None], [7.1, None], [None, 26.0])
+
+    # 缺失项沿用该设备上一条的值
+    last_values = {"do": 1.0, "ph": 2.0, "temp": 3.0}
+    assert batch_rows("d1", batch, last_values) == [("d1", 1000, 7.0, 7.1, 3.0), ("d1", 2000, 7.0, 7.1, 26.0)]
+    assert last_values == {"do": 7.0, "ph": 7.1, "temp": 26.0}
+
+
+@pytest.mark.parametrize("payload", [b'{"do":1', b'{"samples": 5}', b'[1, 2]'])
+def test_malformed_json_is_rejected(payload):
+    with pytest.raises(ValueError):
+        decode_sensor_payload(payload)
+
+
+def test_payload_text_for_binary_and_text():
+    assert payload_text(b'{"do": 1}') == '{"do": 1}'
+    assert payload_text(encode_binary([(1.0, 2.0, 3.0)]))
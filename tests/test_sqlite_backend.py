@@ -0,0 +1,194 @@
+# SQLite后端：结构迁移、keyset分页、过期清理与汇总
+import datetime
+import os
+import sqlite3
+import time
+
+import pytest
+
+from storage import sqlite_backend
+from storage.base import MINUTE_MS, HOUR_MS, ROLLUP_MINUTE, ROLLUP_HOUR, bucket_start_ms
+from storage.sqlite_backend import SQLiteBackend, SCHEMA_VERSION
+
+# 测试数据的时间起点：整小时（UTC），各测试在此之后若干分钟内写入
+BASE_MS = 1_700_002_800_000
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sensor_data.db")
+
+
+@pytest.fixture
+def open_backend(db_path):
+    backends = []
+
+    def _open(**kwargs):
+        backend = SQLiteBackend(db_path, **kwargs)
+        backend.start()
+        assert backend.flush()  # 等写线程完成建表和迁移
+        backends.append(backend)
+        return backend
+
+    yield _open
+    for backend in backends:
+        backend.close()
+
+
+def _all_pages(backend, page_size, start_ms=0, end_ms=2 ** 62, device_id=None):
+    pages = []
+    cursor = None
+    while True:
+        samples, cursor = backend.query_page(start_ms, end_ms, page_size, after=cursor, device_id=device_id)
+        pages.append(samples)
+        if cursor is None:
+            return pages
+
+
+def _local_ms(text):
+    return int(time.mktime(datetime.datetime.strptime(text, "%Y-%m-%d %H:%M:%S").timetuple())) * 1000
+
+
+def test_migrates_v1_records_to_v3(db_path, open_backend, monkeypatch):
+    # 每批3条：同一秒的5条数据跨批次搬运
+    monkeypatch.setattr(sqlite_backend, "MIGRATION_CHUNK_ROWS", 3)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE sensor_records (id INTEGER PRIMARY KEY AUTOINCREMENT, record_date TEXT,
+                    record_time TEXT, do_value REAL, ph_value REAL, temp_value REAL)""")
+    record_times = ["2024-01-01 10:00:00"] * 5 + ["2024-01-01 10:00:01", None, "无效时间"]
+    for index, record_time in enumerate(record_times):
+        # id间隔1000：旧版 id % 1000 偏移下这5条会得到相同的时间戳
+        conn.execute("INSERT INTO sensor_records (id, record_time, do_value, ph_value, temp_value) "
+                     "VALUES (?, ?, ?, 7.0, 25.0)", (index * 1000 + 1, record_time, float(index)))
+    conn.commit()
+    conn.close()
+
+    backend = open_backend()
+    base_ms = _local_ms("2024-01-01 10:00:00")
+    samples = [sample for page in _all_pages(backend, 100) for sample in page]
+    assert [(sample.ts, sample.do) for sample in reversed(samples)] == [
+        (base_ms, 0.0), (base_ms + 1, 1.0), (base_ms + 2, 2.0), (base_ms + 3, 3.0), (base_ms + 4, 4.0),
+        (base_ms + 1000, 5.0),
+    ]
+    assert backend.legacy_rows_migrated == 6
+    assert backend.legacy_rows_skipped == 2
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sensor_records'").fetchone() is None
+    conn.close()
+    # v2 -> v3：迁移来的数据已生成汇总
+    minute_rows = backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)
+    assert sum(row[1] for row in minute_rows) == 6
+
+
+def test_migrates_v2_samples_to_v3_rollups(db_path, open_backend):
+    conn = sqlite3.connect(db_path)
+    conn.execute(sqlite_backend._CREATE_SAMPLES_SQL)
+    conn.executemany("INSERT INTO sensor_samples VALUES (?, ?, ?, ?, ?)",
+                     [("a", BASE_MS + i * 30_000, float(i), 7.0, 25.0) for i in range(4)])
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    backend = open_backend()
+    minute_rows = backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)
+    assert [(row[0], row[1], row[4]) for row in minute_rows] == [
+        (BASE_MS + MINUTE_MS, 2, 2.5),
+        (BASE_MS, 2, 0.5),
+    ]
+    hour_rows = backend.query_rollups(0, 2 ** 62, ROLLUP_HOUR)
+    assert [(row[0], row[1]) for row in hour_rows] == [(bucket_start_ms(BASE_MS, HOUR_MS), 4)]
+
+
+def test_keyset_pagination_across_equal_timestamps(open_backend):
+    backend = open_backend()
+    # 5台设备同一毫秒上报，前后各有一条
+    rows = [("d%d" % i, BASE_MS + 1000, 1.0, 7.0, 25.0) for i in range(5)]
+    rows += [("d0", BASE_MS, 1.0, 7.0, 25.0), ("d0", BASE_MS + 2000, 1.0, 7.0, 25.0)]
+    backend.insert_batch(rows)
+    backend.flush()
+
+    pages = _all_pages(backend, 2)
+    keys = [(sample.ts, sample.device_id) for page in pages for sample in page]
+    assert keys == sorted(((ts, device_id) for device_id, ts, _, _, _ in rows), reverse=True)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+
+    device_keys = [sample.ts for page in _all_pages(backend, 1, device_id="d0") for sample in page]
+    assert device_keys == [BASE_MS + 2000, BASE_MS + 1000, BASE_MS]
+
+
+def test_duplicate_rows_are_ignored_and_not_counted(open_backend):
+    backend = open_backend()
+    rows = [("a", BASE_MS + i * 1000, float(i), 7.0, 25.0) for i in range(3)]
+    backend.insert_batch(rows)
+    backend.insert_batch(rows[1:])  # 设备重发
+    backend.flush()
+
+    assert len(backend.query_page(0, 2 ** 62, 100)[0]) == 3
+    minute_rows = backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)
+    assert [(row[1], row[2], row[3], row[4]) for row in minute_rows] == [(3, 0.0, 2.0, 1.0)]
+
+
+def test_rollups_accumulate_across_flushes(open_backend):
+    backend = open_backend(flush_rows=1)  # 每条单独提交：汇总逐批累加
+    values = [3.0, 1.0, 2.0, 6.0]
+    for i, value in enumerate(values):
+        backend.insert_record(value, 7.0, 25.0, ts_ms=BASE_MS + i * 1000, device_id="a")
+    backend.flush()
+
+    (row,) = backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)
+    assert row[:5] == (BASE_MS, 4, 1.0, 6.0, 3.0)
+    (row,) = backend.query_rollups(0, 2 ** 62, ROLLUP_HOUR)
+    assert row[1:5] == (4, 1.0, 6.0, 3.0)
+
+
+def test_retention_keeps_rollups_of_cleaned_buckets(open_backend, monkeypatch):
+    # 每块删除2条：清理任务分多次执行
+    monkeypatch.setattr(sqlite_backend, "RETENTION_CHUNK_ROWS", 2)
+    backend = open_backend()
+    old_rows = [("a", BASE_MS + i * 1000, 1.0, 7.0, 25.0) for i in range(5)]
+    new_rows = [("a", BASE_MS + 2 * MINUTE_MS, 2.0, 7.0, 25.0)]
+    backend.insert_batch(old_rows + new_rows)
+    backend.flush()
+
+    cutoff_ms = BASE_MS + MINUTE_MS
+    backend.clean_expired(cutoff_ms)
+    backend.flush()
+    deadline = time.monotonic() + 5
+    while backend.get_stats()["total_rows_expired"] < len(old_rows) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.get_stats()["total_rows_expired"] == len(old_rows)
+    assert [sample.ts for sample in backend.query_page(0, 2 ** 62, 100)[0]] == [BASE_MS + 2 * MINUTE_MS]
+
+    # 原始数据已清理的桶：汇总保留
+    counts = {row[0]: row[1] for row in backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)}
+    assert counts == {BASE_MS: 5, BASE_MS + 2 * MINUTE_MS: 1}
+
+    # 迟到的新数据累加进旧桶
+    backend.insert_record(1.0, 7.0, 25.0, ts_ms=BASE_MS + 30_000, device_id="a")
+    backend.flush()
+    counts = {row[0]: row[1] for row in backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)}
+    assert counts[BASE_MS] == 6
+
+    # 含重复数据的批次按桶重算：早于清理截止时间的桶不重算，不会被"只剩几条"的结果替换
+    backend.insert_batch([("a", BASE_MS + 30_000, 1.0, 7.0, 25.0), ("a", BASE_MS + 40_000, 1.0, 7.0, 25.0)])
+    backend.flush()
+    counts = {row[0]: row[1] for row in backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)}
+    assert counts[BASE_MS] == 6
+
+    # 汇总数据清理
+    backend.clean_expired_rollups(BASE_MS + MINUTE_MS, BASE_MS)
+    backend.flush()
+    assert [row[0] for row in backend.query_rollups(0, 2 ** 62, ROLLUP_MINUTE)] == [BASE_MS + 2 * MINUTE_MS]
+
+
+def test_reopen_keeps_data(db_path, open_backend):
+    backend = open_backend()
+    backend.insert_record(1.0, 7.0, 25.0, ts_ms=BASE_MS, device_id="a")
+    backend.close()
+    assert os.path.exists(db_path)
+
+    backend = open_backend()
+    assert backend.latest_ts("a") == BASE_MS
+    assert backend.latest_ts("a", before_ms=BASE_MS) is None
@@ -0,0 +1,95 @@
+# topic_router.py：MQTT主题路由（处理器注册表）
+# 每个订阅主题（精确主题或+/#通配）注册一个处理器：解码函数 + 处理函数 + 线程亲和性 + 是否记录原始消息日志
+#   worker：在MQTT网络线程内解码并处理（只做轻量操作，如投递到存储写线程），主线程只记日志
+#   main：网络线程只解码，结果进接收队列，主线程每帧把同一处理函数本帧的全部消息合并成一次调用
+# 具体主题首次出现时匹配一次并缓存，之后按字典O(1)分发；精确主题优先于通配主题，通配主题按注册顺序匹配
+THREAD_MAIN = "main"
+THREAD_WORKER = "worker"
+THREADS = (THREAD_MAIN, THREAD_WORKER)
+
+
+def match_topic(pattern, levels):
+    """主题层级是否匹配订阅（支持+和#），匹配时返回通配符对应的层级列表，否则返回None"""
+    wildcard_levels = []
+    pattern_levels = pattern.split("/")
+    for index, pattern_level in enumerate(pattern_levels):
+        if pattern_level == "#":
+            return wildcard_levels + levels[index:]
+        if index >= len(levels):
+            return None
+        if pattern_level == "+":
+            wildcard_levels.append(levels[index])
+        elif pattern_level != levels[index]:
+            return None
+    return wildcard_levels if len(pattern_levels) == len(levels) else None
+
+
+def is_wildcard(pattern):
+    return "+" in pattern or "#" in pattern
+
+
+class TopicHandler:
+    """一个订阅主题的处理器
+    decoder(设备ID, payload, trace) -> 解码结果：网络线程调用；返回None表示无需处理，格式错误时抛出ValueError
+      trace为延迟追踪的Trace（追踪关闭时为None），需要追踪的解码函数自行打点；decoder为None时结果即原始payload
+    handler：main线程为handler([(主题, 设备ID, 结果)])，每帧最多一次，格式错误的消息结果为None
+             worker线程为handler(主题, 设备ID, 结果) -> 日志文本或None，在网络线程逐条调用
+    log：是否记录"📥 [主题] 内容"日志；高频遥测主题关闭后不生成日志文本，只走解码和数据回调
+    """
+
+    __slots__ = ("pattern", "decoder", "handler", "thread", "log")
+
+    def __init__(self, pattern, handler=None, decoder=None, thread=THREAD_MAIN, log=True):
+        if thread not in THREADS:
+            raise ValueError(f"未知的线程亲和性：{thread}（可选：{', '.join(THREADS)}）")
+        self.pattern = pattern
+        self.decoder = decoder
+        self.handler = handler
+        self.thread = thread
+        self.log = log
+
+
+class TopicRouter:
+    """主题 -> 处理器；注册在连接前完成（主线程），resolve在网络线程调用"""
+
+    def __init__(self):
+        self._handlers = []   # 注册顺序（订阅顺序）
+        self._exact = {}      # 精确主题 -> 处理器
+        self._wildcards = []  # 通配主题处理器（按注册顺序）
+        # 具体主题 -> (处理器, 设备ID) 的缓存；注册新处理器时整体替换
+        self._table = {}
+
+    def register(self, pattern, handler=None, decoder=None, thread=THREAD_MAIN, log=True):
+        """注册主题处理器（同一主题只能注册一次），返回TopicHandler"""
+        if any(existing.pattern == pattern for existing in self._handlers):
+            raise ValueError(f"主题已注册处理器：{pattern}")
+        topic_handler = TopicHandler(pattern, handler, decoder, thread, log)
+        self._handlers.append(topic_handler)
+        if is_wildcard(pattern):
+            self._wildcards.append(topic_handler)
+        else:
+            self._exact[pattern] = topic_handler
+        self._table = {}
+        return topic_handler
+
+    def patterns(self):
+        """全部订阅主题（按注册顺序）"""
+        return [topic_handler.pattern for topic_handler in self._handlers]
+
+    def resolve(self, topic):
+        """具体主题 -> (处理器, 设备ID)；设备ID为通配符对应的层级（精确主题为空），不匹配时处理器为None"""
+        route = self._table.get(topic)
+        if route is None:
+            route = self._table[topic] = self._match(topic)
+        return route
+
+    def _match(self, topic):
+        topic_handler = self._exact.get(topic)
+        if topic_handler is not None:
+            return topic_handler, ""
+        levels = topic.split("/")
+        for topic_handler in self._wildcards:
+            wildcard_levels = match_topic(topic_handler.pattern, levels)
+            if wildcard_levels is not None:
+                return topic_handler, "/".join(wildcard_levels)
+        return None, ""
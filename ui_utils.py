@@ -4,6 +4,11 @@ from kivy.uix.button import ButtonBehavior
 from kivy.core.text import LabelBase
 from kivy.metrics import dp
 from kivy.clock import Clock
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from log_store import get_log_store, LEVEL_ERROR, LEVEL_WARNING, MAX_COLLAPSE_WINDOW
+from event_bus import get_event_bus, EVENT_LOG_APPENDED
 
 # 自定义无边界按钮（彻底修复canvas为空问题）
 class NoBorderButton(ButtonBehavior, MDLabel):
@@ -87,6 +92,119 @@ class NoBorderButton(ButtonBehavior, MDLabel):
             self.is_pressed = False
             Clock.schedule_once(lambda dt: self.update_button_colors(), 0.01)
 
+# ========== 日志列表（RecycleView虚拟列表） ==========
+# 日志页面最多保留的行数（只有可见的几十行有对应控件）
+LOG_VIEW_CAPACITY = 2000
+# 每行固定高度（最多显示两行文字，固定行高让RecycleView不必逐行测量）
+LOG_LINE_HEIGHT = dp(44)
+LOG_LEVEL_COLORS = {
+    LEVEL_ERROR: (0.8, 0.1, 0.1, 1),
+    LEVEL_WARNING: (0.85, 0.5, 0, 1),
+}
+LOG_DEFAULT_COLOR = (0, 0, 0, 1)
+
+
+class LogLineLabel(RecycleDataViewBehavior, MDLabel):
+    """日志列表的一行：只在滚动到可见时才格式化对应的日志记录（结果缓存在记录上）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.font_name = "CustomChinese"
+        self.font_size = dp(13)
+        self.halign = "left"
+        self.valign = "middle"
+        self.max_lines = 2
+        self.shorten = True
+        self.shorten_from = "right"
+        self.theme_text_color = "Custom"
+        self.bind(width=lambda instance, width: setattr(instance, 'text_size', (width, None)))
+
+    def refresh_view_attrs(self, rv, index, data):
+        record = data["record"]
+        self.text = record.format()
+        self.text_color = LOG_LEVEL_COLORS.get(record.level, LOG_DEFAULT_COLOR)
+        return super().refresh_view_attrs(rv, index, {})
+
+
+class LogView(RecycleView):
+    """运行日志列表：增量追加新日志，控件数量只与可见行数有关
+    订阅事件总线的日志新增通知（主线程，每帧最多一次）后从日志存储增量读取；停在底部时自动跟随最新日志
+    store需已接到总线的EVENT_LOG_APPENDED（全局日志存储在创建总线时已接上）
+    show_entries显示检索结果（暂停实时追加），show_live回到实时日志
+    """
+
+    def __init__(self, store=None, capacity=LOG_VIEW_CAPACITY, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store if store is not None else get_log_store()
+        self.event_bus = get_event_bus()
+        self.capacity = capacity
+        self.viewclass = LogLineLabel
+        layout = RecycleBoxLayout(
+            orientation="vertical",
+            default_size=(None, LOG_LINE_HEIGHT),
+            default_size_hint=(1, None),
+            size_hint_y=None
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self._last_seq = 0
+        self.live = True
+        # 加入界面时开始订阅；离开页面时由switch_page调用detach取消订阅
+        # （切换页面只把整个页面从容器移除，LogView仍挂在页面里，parent不会变为None）
+        self.bind(parent=self._on_parent)
+
+    def _on_parent(self, instance, parent):
+        if parent is not None:
+            self.event_bus.subscribe(EVENT_LOG_APPENDED, self._append_new_records)
+            self._append_new_records()
+
+    def detach(self):
+        """取消订阅日志新增通知（离开页面时调用，之后不再刷新）"""
+        self.event_bus.unsubscribe(EVENT_LOG_APPENDED, self._append_new_records)
+
+    def _append_new_records(self, *args):
+        """把上次刷新之后的新日志追加到列表末尾（主线程，每帧最多一次）"""
+        if not self.live:
+            return
+        records = self.store.since(self._last_seq)
+        if not records:
+            return
+        self._last_seq = records[-1].seq
+        # 刷新前停在底部（或列表为空）才自动滚到最新，用户往上翻看时不打扰
+        follow = not self.data or self.scroll_y <= 0.01
+        # 合并了重复日志（×N）的记录会带着新序号再次出现：先删掉它在末尾几行中的旧行，再追加到最后
+        tail_start = max(0, len(self.data) - MAX_COLLAPSE_WINDOW)
+        returning = {id(record) for record in records}
+        stale = {index for index in range(tail_start, len(self.data)) if id(self.data[index]["record"]) in returning}
+        if stale:
+            kept = [item for index, item in enumerate(self.data[tail_start:], tail_start) if index not in stale]
+            del self.data[tail_start:]
+            self.data.extend(kept)
+        items = [{"record": record} for record in records[-self.capacity:]]
+        overflow = len(self.data) + len(items) - self.capacity
+        if overflow > 0:
+            # 超出容量：一次多删掉十分之一，之后若干帧只需追加，不必每帧整体搬移
+            keep = max(0, self.capacity - len(items) - self.capacity // 10)
+            self.data = (self.data[len(self.data) - keep:] if keep else []) + items
+        else:
+            self.data.extend(items)
+        if follow:
+            self.scroll_y = 0
+
+    def show_entries(self, entries):
+        """显示一组日志（如文件检索结果，需提供level和format()），暂停实时追加"""
+        self.live = False
+        self.data = [{"record": entry} for entry in entries[-self.capacity:]]
+        self.scroll_y = 0
+
+    def show_live(self):
+        """回到实时日志（重新载入日志存储中最新的日志）"""
+        self.live = True
+        self._last_seq = 0
+        self.data = []
+        self._append_new_records()
+
+
 # 注册中文字体
 def register_chinese_font():
     LabelBase.register(
@@ -97,13 +215,29 @@ def register_chinese_font():
 # ui_utils.py 中的 switch_page 函数完整修复版
 def switch_page(app_instance, page_name):
     from app_ui_pages import create_home_page, create_me_page, create_history_page, create_log_page
-    from app_ui_pages import unregister_history_callback, HISTORY_UPDATE_CALLBACKS
+    from app_ui_pages import unregister_history_callback, HISTORY_UPDATE_CALLBACKS, HISTORY_QUERY_KEY
+    from app_ui_pages import HISTORY_NEW_ROWS_QUERY_KEY
+    from app_ui_pages import add_global_log
+    from storage import get_query_executor
     
     # 清理历史页面回调（关键修复：增加方法存在性判断）
     if hasattr(app_instance, 'current_page') and app_instance.current_page:
         # 只对有 update_history_ui 方法的页面（历史数据页）执行注销
         if hasattr(app_instance.current_page, 'update_history_ui'):
             unregister_history_callback(app_instance.current_page.update_history_ui)
+            # 取消未完成的历史查询（否则慢查询完成后仍会改动已离开的页面）
+            get_query_executor().cancel(HISTORY_QUERY_KEY)
+            get_query_executor().cancel(HISTORY_NEW_ROWS_QUERY_KEY)
+            if hasattr(app_instance.current_page, 'new_rows_trigger'):
+                app_instance.current_page.new_rows_trigger.cancel()
+            add_global_log("📱 退出历史数据页面")
+        # 日志页：取消日志列表的订阅（否则离开后仍每帧刷新已不可见的列表）
+        if hasattr(app_instance.current_page, 'log_view'):
+            app_instance.current_page.log_view.detach()
+            app_instance.current_page.cancel_search()
+        # 个人中心：取消日志标签的订阅
+        if hasattr(app_instance.current_page, 'me_log_label') and hasattr(app_instance, 'detach_me_page_log'):
+            app_instance.detach_me_page_log()
         # 额外防护：也可以通过页面特征判断（比如包含"设备历史数据"文本）
         # page_texts = [child.text for child in app_instance.current_page.children if hasattr(child, 'text')]
         # if "设备历史数据" in page_texts and hasattr(app_instance.current_page, 'update_history_ui'):